@@ -0,0 +1,67 @@
+"""Benchmark move detection in diff_commits on a commit that moves many files at once.
+
+Builds a directory of FILES blobs and a second commit in which every file is renamed, then times
+``Repository.diff_commits``. Move pairing is linear, so doubling FILES should roughly double the time.
+
+Usage: python benchmarks/bench_diff_moves.py [--files 100000]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from libcaf import Commit, Tree, TreeRecord, TreeRecordType
+from libcaf.plumbing import hash_object, hash_string, save_commit, save_tree
+from libcaf.repository import MovedFromDiff, MovedToDiff, Repository
+
+
+def _save_tree(objects_dir: Path, records: dict[str, TreeRecord]) -> str:
+    tree = Tree(records)
+    save_tree(objects_dir, tree)
+    return hash_object(tree)
+
+
+def _commit(objects_dir: Path, tree_hash: str, parent: str | None) -> str:
+    commit = Commit(tree_hash, 'bench', 'bench', 0, parent)
+    save_commit(objects_dir, commit)
+    return hash_object(commit)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(tmp)
+        repo.init()
+        objects_dir = repo.objects_dir()
+
+        blobs = [hash_string(f'content {i}') for i in range(args.files)]
+        before = {f'file{i:07d}': TreeRecord(TreeRecordType.BLOB, blob, f'file{i:07d}')
+                  for i, blob in enumerate(blobs)}
+        after = {f'moved{i:07d}': TreeRecord(TreeRecordType.BLOB, blob, f'moved{i:07d}')
+                 for i, blob in enumerate(blobs)}
+
+        src_dir = _save_tree(objects_dir, before)
+        dst_dir = _save_tree(objects_dir, after)
+        commit1 = _commit(objects_dir, _save_tree(objects_dir, {
+            'src': TreeRecord(TreeRecordType.TREE, src_dir, 'src')}), None)
+        commit2 = _commit(objects_dir, _save_tree(objects_dir, {
+            'src': TreeRecord(TreeRecordType.TREE, dst_dir, 'src')}), commit1)
+
+        start = time.perf_counter()
+        diffs = repo.diff_commits(commit1, commit2)
+        elapsed = time.perf_counter() - start
+
+        children = diffs[0].children
+        moves = sum(1 for diff in children if isinstance(diff, MovedToDiff))
+        assert moves == args.files
+        assert sum(1 for diff in children if isinstance(diff, MovedFromDiff)) == args.files
+
+        print(f'diff_commits with {args.files:,} moved files: {elapsed:.3f}s ({moves:,} moves)')
+
+
+if __name__ == '__main__':
+    main()
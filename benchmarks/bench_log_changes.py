@@ -0,0 +1,91 @@
+"""Benchmark per-commit change summaries: log_with_changes against one diff_stats call per commit.
+
+Builds a history of COMMITS commits over a tree of DIRS directories with FILES files each, every commit
+editing one file, then summarizes the whole history both ways. The baseline reloads every tree on each call;
+log_with_changes diffs the commits in a worker pool sharing one tree cache.
+
+Usage: python benchmarks/bench_log_changes.py [--commits 2000] [--dirs 100] [--files 100] [--workers CPUS]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from libcaf import Commit, Tree, TreeRecord, TreeRecordType
+from libcaf.plumbing import hash_object, save_commit, save_tree
+from libcaf.repository import Repository
+
+
+def _save_tree(objects_dir: Path, records: dict[str, TreeRecord]) -> str:
+    tree = Tree(records)
+    save_tree(objects_dir, tree)
+    return hash_object(tree)
+
+
+def _save_blob(repo: Repository, scratch: Path, content: str) -> str:
+    scratch.write_text(content)
+    return repo.save_file_content(scratch).hash
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commits', type=int, default=2000)
+    parser.add_argument('--dirs', type=int, default=100)
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(Path(tmp) / 'repo')
+        repo.working_dir.mkdir()
+        repo.init()
+        objects_dir = repo.objects_dir()
+        scratch = Path(tmp) / 'scratch'
+
+        lines = ''.join(f'line {i}\n' for i in range(200))
+        blob = _save_blob(repo, scratch, lines)
+        dirs = [{f'file{j:04d}': TreeRecord(TreeRecordType.BLOB, blob, f'file{j:04d}') for j in range(args.files)}
+                for _ in range(args.dirs)]
+        dir_hashes = [_save_tree(objects_dir, records) for records in dirs]
+
+        print(f'Building {args.commits:,} commits...')
+        parent = None
+        for i in range(args.commits):
+            d = rng.randrange(args.dirs)
+            name = f'file{rng.randrange(args.files):04d}'
+            content = lines + ''.join(f'edit {i} {k}\n' for k in range(rng.randrange(1, 5)))
+            dirs[d][name] = TreeRecord(TreeRecordType.BLOB, _save_blob(repo, scratch, content), name)
+            dir_hashes[d] = _save_tree(objects_dir, dirs[d])
+
+            root = _save_tree(objects_dir, {f'dir{k:04d}': TreeRecord(TreeRecordType.TREE, h, f'dir{k:04d}')
+                                            for k, h in enumerate(dir_hashes)})
+            commit = Commit(root, 'bench', f'Commit {i}', i, parent)
+            save_commit(objects_dir, commit)
+            parent = hash_object(commit)
+
+        # Warm up the commit-graph so both runs only measure the diffs
+        history = list(repo.log(parent))
+
+        start = time.perf_counter()
+        baseline = [repo.diff_stats(entry.commit.parent, entry.commit_ref) for entry in history
+                    if entry.commit.parent]
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipelined = [entry.stats for entry in repo.log_with_changes(parent, workers=args.workers)
+                     if entry.commit.parent]
+        parallel = time.perf_counter() - start
+
+        assert pipelined == baseline
+
+        print(f'diff_stats per commit:          {sequential:.3f}s')
+        print(f'log_with_changes ({args.workers} workers): {parallel:.3f}s')
+        print(f'Speedup:                        {sequential / parallel:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark three-way merges of wide trees: in one process against a pool of worker processes.
+
+Builds a base tree of 1.5 * TOUCHED files spread over DIRS directories, then two branches that each edit
+TOUCHED files: ours edits the first line of the first TOUCHED files, theirs the last line of the last TOUCHED
+files. The middle third is edited on both sides, so those files are merged by content. Both merges must produce
+the same tree and conflicts. An untimed merge runs first, so both timed ones find the object store equally warm;
+the merge caches are cleared before each of them, and the same merge is then timed once more with the results
+cached.
+
+Usage: python benchmarks/bench_merge.py [--touched 50000] [--dirs 500] [--workers CPUS]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from libcaf import Commit, Tree, TreeRecord, TreeRecordType
+from libcaf.cache import ObjectCache
+from libcaf.merge import MERGES_CACHE, TREE_MERGES_CACHE
+from libcaf.plumbing import hash_object, hash_string, open_content_for_writing, save_commit, save_tree
+from libcaf.repository import Repository
+
+
+def _save_blob(objects_dir: Path, content: str) -> str:
+    blob_hash = hash_string(content)
+    with open_content_for_writing(objects_dir, blob_hash) as f:
+        f.write(content.encode())
+    return blob_hash
+
+
+def _clear_merge_caches(objects_dir: Path) -> None:
+    for kind in (MERGES_CACHE, TREE_MERGES_CACHE):
+        shutil.rmtree(ObjectCache(objects_dir, kind).cache_dir, ignore_errors=True)
+
+
+def _save_commit(objects_dir: Path, dirs: list[dict[str, TreeRecord]], message: str, parent: str | None) -> str:
+    root: dict[str, TreeRecord] = {}
+    for d, records in enumerate(dirs):
+        tree = Tree(records)
+        save_tree(objects_dir, tree)
+        root[f'dir{d:04d}'] = TreeRecord(TreeRecordType.TREE, hash_object(tree), f'dir{d:04d}')
+
+    tree = Tree(root)
+    save_tree(objects_dir, tree)
+    commit = Commit(hash_object(tree), 'bench', message, 0, parent)
+    save_commit(objects_dir, commit)
+    return hash_object(commit)
+
+
+def _build_side(objects_dir: Path, base: list[dict[str, TreeRecord]], contents: list[list[str]], files: range,
+                side: str, line: int, parent: str) -> str:
+    dirs = [dict(records) for records in base]
+    for i in files:
+        d, name = i % len(dirs), f'file{i:06d}'
+        lines = list(contents[i])
+        lines[line] = f'{side} edit of file {i}\n'
+        dirs[d][name] = TreeRecord(TreeRecordType.BLOB, _save_blob(objects_dir, ''.join(lines)), name)
+
+    return _save_commit(objects_dir, dirs, side, parent)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--touched', type=int, default=50000)
+    parser.add_argument('--dirs', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(Path(tmp) / 'repo')
+        repo.working_dir.mkdir()
+        repo.init()
+        objects_dir = repo.objects_dir()
+
+        total = args.touched * 3 // 2
+        print(f'Building a base of {total:,} files and two branches touching {args.touched:,} each...')
+        contents = [[f'line {k} of file {i}\n' for k in range(20)] for i in range(total)]
+        base: list[dict[str, TreeRecord]] = [{} for _ in range(args.dirs)]
+        for i, lines in enumerate(contents):
+            name = f'file{i:06d}'
+            base[i % args.dirs][name] = TreeRecord(TreeRecordType.BLOB, _save_blob(objects_dir, ''.join(lines)), name)
+        base_commit = _save_commit(objects_dir, base, 'base', None)
+
+        ours = _build_side(objects_dir, base, contents, range(args.touched), 'ours', 0, base_commit)
+        theirs = _build_side(objects_dir, base, contents, range(total - args.touched, total), 'theirs', -1,
+                             base_commit)
+
+        repo.merge_commits(ours, theirs, workers=1)
+        _clear_merge_caches(objects_dir)
+
+        start = time.perf_counter()
+        serial = repo.merge_commits(ours, theirs, workers=1)
+        sequential = time.perf_counter() - start
+
+        _clear_merge_caches(objects_dir)
+        start = time.perf_counter()
+        pooled = repo.merge_commits(ours, theirs, workers=args.workers)
+        parallel = time.perf_counter() - start
+
+        start = time.perf_counter()
+        remerged = repo.merge_commits(ours, theirs, workers=args.workers)
+        cached = time.perf_counter() - start
+
+        assert pooled == serial == remerged
+        assert not serial.conflicts
+
+        print(f'Blob merges:              {2 * args.touched - total:,}')
+        print(f'1 worker:                 {sequential:.3f}s')
+        print(f'{args.workers} workers:{" " * (17 - len(str(args.workers)))}{parallel:.3f}s')
+        print(f'Speedup:                  {sequential / parallel:.1f}x')
+        print(f'Cached re-merge:          {cached:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
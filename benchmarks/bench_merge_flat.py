@@ -0,0 +1,91 @@
+"""Benchmark three-way merges of a huge flat directory: loaded trees against trees streamed from the object store.
+
+Writes a base tree of ENTRIES records in one directory, and two sides that each change one record in STRIDE:
+ours edits some, theirs deletes others and adds as many new records after them.
+Each merge runs in a fresh process, which reports its time and peak resident memory above what it started with.
+Both merges must produce the same tree and conflicts.
+
+Usage: python benchmarks/bench_merge_flat.py [--entries 1000000] [--stride 100]
+"""
+
+import argparse
+import multiprocessing
+import resource
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from libcaf import TreeRecord, TreeRecordType
+from libcaf.cache import ObjectCache
+from libcaf.constants import TREE_RECORD_BATCH_SIZE
+from libcaf.merge import TREE_MERGES_CACHE, merge_trees_core
+from libcaf.plumbing import load_tree, open_tree_writer
+from libcaf.repository import Repository
+
+
+def _write_tree(objects_dir: Path, entries: int, stride: int, side: str) -> str:
+    added = entries // stride if side == 'theirs' else 0
+    with open_tree_writer(objects_dir) as writer:
+        batch = []
+        for i in range(entries + added):
+            if side == 'theirs' and i % stride == stride // 2 and i < entries:
+                continue
+            version = 1 if side == 'ours' and i % stride == 0 else 2 if i >= entries else 0
+            batch.append(TreeRecord(TreeRecordType.BLOB, f'{i:039x}{version}', f'file{i:08d}'))
+            if len(batch) == TREE_RECORD_BATCH_SIZE:
+                writer.add(batch)
+                batch = []
+        writer.add(batch)
+        return writer.commit()
+
+
+def _merge(objects_dir: Path, hashes: list[str], loaded: bool, results: multiprocessing.Queue) -> None:
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    trees = [load_tree(objects_dir, tree_hash) for tree_hash in hashes] if loaded else hashes
+    conflicts: list[str] = []
+    merged_hash = merge_trees_core(objects_dir, *trees, '', conflicts, workers=1)
+    elapsed = time.perf_counter() - start
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    results.put((merged_hash, len(conflicts), elapsed, peak_kib))
+
+
+def _run(objects_dir: Path, hashes: list[str], loaded: bool) -> tuple[str, int, float, int]:
+    shutil.rmtree(ObjectCache(objects_dir, TREE_MERGES_CACHE).cache_dir, ignore_errors=True)
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_merge, args=(objects_dir, hashes, loaded, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--stride', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Repository(Path(tmp) / 'repo')
+        repo.working_dir.mkdir()
+        repo.init()
+        objects_dir = repo.objects_dir()
+
+        print(f'Writing a flat directory of {args.entries:,} entries and two sides changing every {args.stride}th...')
+        hashes = [_write_tree(objects_dir, args.entries, args.stride, side) for side in ('base', 'ours', 'theirs')]
+
+        loaded_hash, loaded_conflicts, loaded_time, loaded_peak = _run(objects_dir, hashes, loaded=True)
+        streamed_hash, streamed_conflicts, streamed_time, streamed_peak = _run(objects_dir, hashes, loaded=False)
+
+        assert loaded_hash == streamed_hash
+        assert loaded_conflicts == streamed_conflicts
+
+        print(f'Loaded trees:    {loaded_time:.3f}s, {loaded_peak / 1024:.1f} MiB peak')
+        print(f'Streamed trees:  {streamed_time:.3f}s, {streamed_peak / 1024:.1f} MiB peak')
+
+
+if __name__ == '__main__':
+    main()
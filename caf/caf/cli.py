@@ -2,6 +2,7 @@
 
 import argparse
 import sys
+from datetime import datetime
 from typing import Any
 
 from libcaf.constants import DEFAULT_REPO_DIR
@@ -133,6 +134,46 @@ def cli() -> None:
             'func': cli_commands.log,
             'args': {
                 **_repo_args,
+                'max_count': {
+                    'type': int,
+                    'help': '🔢 Maximum number of commits to show',
+                    'optional': True,
+                },
+                'skip': {
+                    'type': int,
+                    'help': '⏭️ Number of commits to skip before showing output',
+                    'default': 0,
+                },
+                'since': {
+                    'type': datetime.fromisoformat,
+                    'help': '📅 Show commits made at or after this ISO date',
+                    'optional': True,
+                },
+                'until': {
+                    'type': datetime.fromisoformat,
+                    'help': '📅 Show commits made at or before this ISO date',
+                    'optional': True,
+                },
+                'author': {
+                    'type': str,
+                    'help': '👤 Only show commits by this author',
+                    'optional': True,
+                },
+                'grep': {
+                    'type': str,
+                    'help': '🔎 Only show commits whose message contains this text (case-insensitive)',
+                    'optional': True,
+                },
+                'stat': {
+                    'type': bool,
+                    'help': '📈 Show the number of added and removed lines per file for each commit',
+                    'flag': True,
+                },
+                'paths': {
+                    'type': str,
+                    'help': '📂 Only show commits that changed these paths (use after "--")',
+                    'nargs': '*',
+                },
             },
             'help': '📜 Show commit log',
         },
@@ -144,13 +185,86 @@ def cli() -> None:
                 'commit1': {
                     'type': str,
                     'help': '🔄 First commit hash to diff',
+                    'nargs': '?',
                 },
                 'commit2': {
                     'type': str,
                     'help': '🔄 Second commit hash to diff',
+                    'nargs': '?',
+                },
+                'patch': {
+                    'type': bool,
+                    'help': '📝 Show line-level changes of modified files as unified diff hunks',
+                    'flag': True,
+                    'short_flag': 'p',
+                },
+                'stat': {
+                    'type': bool,
+                    'help': '📈 Show the number of added and removed lines per file instead of the changes',
+                    'flag': True,
+                },
+                'numstat': {
+                    'type': bool,
+                    'help': '🔢 Like --stat, as tab-separated added and removed counts for scripts',
+                    'flag': True,
+                },
+                'worktree': {
+                    'type': bool,
+                    'help': '🗂️ Compare commit1 (default HEAD) with the working directory instead of another commit',
+                    'flag': True,
+                },
+                'find_renames': {
+                    'type': int,
+                    'help': '🔀 Also detect edited renames at or above this similarity percentage, e.g. 50',
+                    'optional': True,
+                },
+                'paths': {
+                    'type': str,
+                    'help': '📂 Only compare these paths or glob patterns (use after "--")',
+                    'nargs': '*',
                 },
             },
-            'help': '📊 Display differences between two commits',
+            'help': '📊 Display differences between two commits, or a commit and the working directory',
+        },
+        'merge': {
+            'func': cli_commands.merge,
+            'args': {
+                **_repo_args,
+                'commit1': {
+                    'type': str,
+                    'help': '🔀 Our commit hash',
+                },
+                'commit2': {
+                    'type': str,
+                    'help': '🔀 Their commit hash, merged into ours',
+                },
+                'check': {
+                    'type': bool,
+                    'help': '🔍 Only check whether the commits merge cleanly, without writing any object',
+                    'flag': True,
+                },
+                'stop_on_conflict': {
+                    'type': bool,
+                    'help': '⏹️ With --check, stop at the first conflict',
+                    'flag': True,
+                },
+            },
+            'help': '🔀 Merge two commits into a tree, or check whether they merge cleanly',
+        },
+        'record_resolution': {
+            'func': cli_commands.record_resolution,
+            'args': {
+                **_repo_args,
+                'conflicted_hash': {
+                    'type': str,
+                    'help': '⚔️ Hash of a merged blob with conflicts',
+                },
+                'path': {
+                    'type': str,
+                    'help': '📄 Path of the file with the conflicts resolved',
+                },
+            },
+            'help': '🧩 Record how conflicts were resolved, so later merges resolve them the same way',
         },
         'tags': {
             'func': cli_commands.tags,
@@ -197,12 +311,14 @@ def cli() -> None:
             arg_flag = arg_info.get('flag', False)
 
             if arg_flag:
-                arg_short_flag = arg_info['short_flag']
-                command_sub.add_argument(f'-{arg_short_flag}', f'--{arg_name}', help=arg_help, action='store_true',
-                                         default=arg_default)
-            elif arg_default is not None:
+                arg_short_flag = arg_info.get('short_flag')
+                flag_names = [f'-{arg_short_flag}', f'--{arg_name}'] if arg_short_flag else [f'--{arg_name}']
+                command_sub.add_argument(*flag_names, help=arg_help, action='store_true', default=arg_default)
+            elif arg_default is not None or arg_info.get('optional', False):
                 command_sub.add_argument(f'--{arg_name}', type=arg_type, help=f'{arg_help} (default: %(default)s)',
                                          default=arg_default)
+            elif 'nargs' in arg_info:
+                command_sub.add_argument(arg_name, type=arg_type, help=arg_help, nargs=arg_info['nargs'])
             else:
                 command_sub.add_argument(arg_name, type=arg_type, help=arg_help)
 
@@ -1,15 +1,26 @@
 """CLI command implementations for CAF (Content Addressable File system)."""
 
+import itertools
+import math
 import sys
-from collections.abc import MutableSequence, Sequence
+from collections.abc import Iterator, MutableSequence, Sequence
 from datetime import datetime
 from pathlib import Path
 
+from libcaf import TreeRecordType
 from libcaf.constants import DEFAULT_BRANCH
+from libcaf.line_diff import format_hunks
+from libcaf.merge import FastForwardResult, UpToDateResult, is_binary_blob
 from libcaf.plumbing import hash_file as plumbing_hash_file
 from libcaf.ref import SymRef
-from libcaf.repository import (AddedDiff, Diff, ModifiedDiff, MovedToDiff, RemovedDiff, Repository, RepositoryError,
-                               RepositoryNotFoundError)
+from libcaf.repository import (AddedDiff, Diff, DiffEntry, DiffStat, LogEntry, LogStatEntry, ModifiedDiff,
+                               MovedFromDiff, MovedToDiff, RemovedDiff, Repository, RepositoryError,
+                               RepositoryNotFoundError, diff_path)
+
+# Number of log entries rendered before the output is flushed
+LOG_PAGE_SIZE = 64
+# Longest +/- bar printed by diff --stat; larger changes are scaled down to fit
+STAT_BAR_WIDTH = 50
 
 
 def _print_error(message: str) -> None:
@@ -258,22 +269,30 @@ def log(**kwargs) -> int:
     repo = _repo_from_cli_kwargs(kwargs)
 
     try:
-        history = list(repo.log())
-        if not history:
-            _print_success('No commits in the repository.')
+        log_method = repo.log_with_changes if kwargs.get('stat') else repo.log
+        history: Iterator[LogEntry] = log_method(max_count=kwargs.get('max_count'), skip=kwargs.get('skip') or 0,
+                                                 since=kwargs.get('since'), until=kwargs.get('until'),
+                                                 paths=kwargs.get('paths'), author=kwargs.get('author'),
+                                                 message=kwargs.get('grep'))
+
+        first_entry = next(history, None)
+        if first_entry is None:
+            if repo.head_commit() is None:
+                _print_success('No commits in the repository.')
+            else:
+                _print_success('No commits match the given filters.')
             return 0
 
         _print_success('Commit history:\n')
-        for item in history:
-            commit = item.commit
 
-            print(f'Commit: {item.commit_ref}')
-            print(f'Author: {commit.author}')
-            commit_date = datetime.fromtimestamp(commit.timestamp).strftime('%Y-%m-%d %H:%M:%S')
-            print(f'Date: {commit_date}\n')
-            for line in commit.message.splitlines():
-                print(f'    {line}')
-            print('\n' + '-' * 50 + '\n')
+        # Entries are rendered into a buffer that is flushed every page, so the first page is shown
+        # while the rest of the history is still being walked
+        page: list[str] = []
+        for item in itertools.chain([first_entry], history):
+            page.append(_format_log_entry(item))
+            if len(page) >= LOG_PAGE_SIZE:
+                _flush_page(page)
+        _flush_page(page)
 
         return 0
     except RepositoryNotFoundError:
@@ -282,6 +301,9 @@ def log(**kwargs) -> int:
     except RepositoryError as re:
         _print_error(f'Repository error: {re}')
         return -1
+    except ValueError as e:
+        _print_error(str(e))
+        return -1
 
 
 def diff(**kwargs) -> int:
@@ -289,20 +311,148 @@ def diff(**kwargs) -> int:
     commit1 = kwargs.get('commit1')
     commit2 = kwargs.get('commit2')
 
+    if kwargs.get('worktree'):
+        return _diff_worktree(repo, commit1, commit2, kwargs)
+
     if not commit1 or not commit2:
         _print_error('Both commit1 and commit2 parameters are required for diff.')
         return -1
 
+    find_renames = kwargs.get('find_renames')
+    paths = kwargs.get('paths')
+    if find_renames is not None and not 0 <= find_renames <= 100:
+        _print_error('find_renames must be a percentage between 0 and 100.')
+        return -1
+
     try:
-        diffs = repo.diff_commits(commit1, commit2)
+        if kwargs.get('stat') or kwargs.get('numstat'):
+            stats = repo.diff_stats(commit1, commit2,
+                                    rename_threshold=find_renames / 100 if find_renames is not None else None,
+                                    paths=paths)
+            if not stats:
+                _print_success('No changes detected between commits.')
+            elif kwargs.get('numstat'):
+                _print_numstat(stats)
+            else:
+                _print_stat(stats)
+            return 0
+
+        if find_renames is None:
+            # Without similarity detection the diff is streamed, so output starts before the walk is done
+            found = False
+            for entry in repo.iter_diff(commit1, commit2, paths=paths):
+                if not found:
+                    _print_success('Diff:\n')
+                    found = True
+                _print_diff_entry(repo, entry, patch=kwargs.get('patch', False))
+
+            if not found:
+                _print_success('No changes detected between commits.')
+            return 0
+
+        diffs = repo.diff_commits(commit1, commit2, rename_threshold=find_renames / 100, paths=paths)
 
         if not diffs:
             _print_success('No changes detected between commits.')
             return 0
 
         _print_diffs([(diffs, 0)])
+        if kwargs.get('patch'):
+            _print_patches(repo, diffs)
+
+        return 0
+    except RepositoryNotFoundError:
+        _print_error(f'No repository found at {repo.repo_path()}')
+        return -1
+    except RepositoryError as e:
+        _print_error(f'Repository error: {e}')
+        return -1
+
+
+def _diff_worktree(repo: Repository, commit: str | None, commit2: str | None, kwargs: dict) -> int:
+    if commit2:
+        _print_error('Only one commit can be compared with the working directory.')
+        return -1
+
+    # The working directory is hashed without saving its files, so there are no new blobs to read lines from
+    if any(kwargs.get(option) for option in ('patch', 'stat', 'numstat', 'find_renames', 'paths')):
+        _print_error('--worktree cannot be combined with --patch, --stat, --numstat, --find_renames or paths.')
+        return -1
+
+    try:
+        diffs = repo.diff_working_dir(commit)
+    except RepositoryNotFoundError:
+        _print_error(f'No repository found at {repo.repo_path()}')
+        return -1
+    except RepositoryError as e:
+        _print_error(f'Repository error: {e}')
+        return -1
+
+    if not diffs:
+        _print_success('No changes detected in the working directory.')
+        return 0
+
+    _print_diffs([(diffs, 0)])
+    return 0
+
+
+def merge(**kwargs) -> int:
+    repo = _repo_from_cli_kwargs(kwargs)
+    commit1 = kwargs.get('commit1')
+    commit2 = kwargs.get('commit2')
+    check = kwargs.get('check', False)
+    stop_on_conflict = kwargs.get('stop_on_conflict', False)
+
+    if not commit1 or not commit2:
+        _print_error('Both commit1 and commit2 parameters are required for merge.')
+        return -1
+    if stop_on_conflict and not check:
+        _print_error('--stop_on_conflict can only be used with --check.')
+        return -1
+
+    try:
+        result = repo.merge_commits(commit1, commit2, dry_run=check, stop_on_conflict=stop_on_conflict)
+    except RepositoryNotFoundError:
+        _print_error(f'No repository found at {repo.repo_path()}')
+        return -1
+    except RepositoryError as e:
+        _print_error(f'Repository error: {e}')
+        return -1
+
+    if isinstance(result, UpToDateResult):
+        _print_success('Already up to date.')
+        return 0
+    if isinstance(result, FastForwardResult):
+        _print_success(f'Fast-forward to {result.commit_hash}')
+        return 0
 
+    if result.tree_hash is not None:
+        _print_success(f'Merged tree: {result.tree_hash}')
+    if not result.conflicts:
+        if check:
+            _print_success('The commits merge cleanly.')
         return 0
+
+    _print_success('First conflict:' if stop_on_conflict else 'Conflicts:')
+    for path in result.conflicts:
+        _print_success(f'  {path}')
+    return -1
+
+
+def record_resolution(**kwargs) -> int:
+    repo = _repo_from_cli_kwargs(kwargs)
+    conflicted_hash = kwargs.get('conflicted_hash')
+    path = Path(kwargs['path'])
+
+    if not conflicted_hash:
+        _print_error('Conflicted blob hash is required.')
+        return -1
+    if not path.exists():
+        _print_error(f'File {path} does not exist.')
+        return -1
+
+    try:
+        count = repo.record_resolution(conflicted_hash, path)
     except RepositoryNotFoundError:
         _print_error(f'No repository found at {repo.repo_path()}')
         return -1
@@ -310,6 +460,9 @@ def diff(**kwargs) -> int:
         _print_error(f'Repository error: {e}')
         return -1
 
+    _print_success(f'Recorded {count} resolution{"s" if count != 1 else ""}.')
+    return 0
+
 
 def _repo_from_cli_kwargs(kwargs: dict[str, str]) -> Repository:
     working_dir_path = kwargs.get('working_dir_path', '.')
@@ -318,6 +471,29 @@ def _repo_from_cli_kwargs(kwargs: dict[str, str]) -> Repository:
     return Repository(working_dir_path, repo_dir)
 
 
+def _format_log_entry(item: LogEntry) -> str:
+    commit = item.commit
+    commit_date = datetime.fromtimestamp(commit.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    message = ''.join(f'    {line}\n' for line in commit.message.splitlines())
+
+    stat = ''
+    if isinstance(item, LogStatEntry) and item.stats:
+        stat = '\n' + ''.join(f'{line}\n' for line in _format_stat(item.stats))
+
+    return (f'Commit: {item.commit_ref}\n'
+            f'Author: {commit.author}\n'
+            f'Date: {commit_date}\n\n'
+            f'{message}'
+            f'{stat}'
+            '\n' + '-' * 50 + '\n\n')
+
+
+def _flush_page(page: list[str]) -> None:
+    sys.stdout.write(''.join(page))
+    sys.stdout.flush()
+    page.clear()
+
+
 def _print_diffs(diff_stack: MutableSequence[tuple[Sequence[Diff], int]]) -> None:
     _print_success('Diff:\n')
 
@@ -331,9 +507,12 @@ def _print_diffs(diff_stack: MutableSequence[tuple[Sequence[Diff], int]]) -> Non
                     print(f'Added: {record.name}')
                 case ModifiedDiff(record, _, _):
                     print(f'Modified: {record.name}')
-                case MovedToDiff(record, _, _, moved_to):
+                case MovedToDiff(record, _, _, moved_to, similarity):
                     assert moved_to is not None, 'MovedToDiff must have a moved_to record, this is a bug!'
-                    print(f'Moved: {record.name} -> {moved_to.record.name}')
+                    if similarity < 1:
+                        print(f'Moved: {record.name} -> {moved_to.record.name} ({similarity:.0%} similar)')
+                    else:
+                        print(f'Moved: {record.name} -> {moved_to.record.name}')
                 case RemovedDiff(record, _, _):
                     print(f'Removed: {record.name}')
                 case _:
@@ -341,3 +520,110 @@ def _print_diffs(diff_stack: MutableSequence[tuple[Sequence[Diff], int]]) -> Non
 
             if diff.children:
                 diff_stack.append((diff.children, indent + 3))
+
+
+def _print_numstat(stats: Sequence[DiffStat]) -> None:
+    for stat in stats:
+        if stat.added is None:
+            print(f'-\t-\t{stat.path}')
+        else:
+            print(f'{stat.added}\t{stat.removed}\t{stat.path}')
+
+
+def _print_stat(stats: Sequence[DiffStat]) -> None:
+    print('\n'.join(_format_stat(stats)))
+
+
+def _format_stat(stats: Sequence[DiffStat]) -> list[str]:
+    path_width = max(len(stat.path) for stat in stats)
+    largest = max((stat.added + stat.removed for stat in stats if stat.added is not None), default=0)
+    count_width = len(str(largest))
+    if any(stat.added is None for stat in stats):
+        count_width = max(count_width, len('Bin'))
+    scale = min(1.0, STAT_BAR_WIDTH / largest) if largest else 1.0
+
+    lines = []
+    for stat in stats:
+        if stat.added is None:
+            lines.append(f' {stat.path:<{path_width}} | {"Bin":>{count_width}}')
+            continue
+
+        added_bar = '+' * math.ceil(stat.added * scale)
+        removed_bar = '-' * math.ceil(stat.removed * scale)
+        lines.append(f' {stat.path:<{path_width}} | {stat.added + stat.removed:>{count_width}} '
+                     f'{added_bar}{removed_bar}')
+
+    insertions = sum(stat.added or 0 for stat in stats)
+    deletions = sum(stat.removed or 0 for stat in stats)
+    files = 'file' if len(stats) == 1 else 'files'
+    lines.append(f' {len(stats)} {files} changed, {insertions} insertions(+), {deletions} deletions(-)')
+
+    return lines
+
+
+def _print_diff_entry(repo: Repository, entry: DiffEntry, *, patch: bool) -> None:
+    if isinstance(entry.diff, MovedFromDiff):
+        # A move is reported once, where the record was moved from
+        return
+
+    print(' ' * (entry.depth * 3), end='')
+
+    match entry.diff:
+        case AddedDiff(record, _, _):
+            print(f'Added: {record.name}')
+        case ModifiedDiff(record, _, _):
+            print(f'Modified: {record.name}')
+        case MovedToDiff(record, _, _, _):
+            print(f'Moved: {record.name} -> {entry.other_path}')
+        case RemovedDiff(record, _, _):
+            print(f'Removed: {record.name}')
+
+    if not patch or entry.diff.record.type != TreeRecordType.BLOB:
+        return
+
+    match entry.diff:
+        case AddedDiff(record, _, _):
+            _print_patch(repo, entry.path, entry.path, None, record.hash)
+        case ModifiedDiff(record, _, _, new_record) if new_record.type == TreeRecordType.BLOB:
+            _print_patch(repo, entry.path, entry.path, record.hash, new_record.hash)
+        case RemovedDiff(record, _, _):
+            _print_patch(repo, entry.path, entry.path, record.hash, None)
+
+
+def _print_patches(repo: Repository, diffs: Sequence[Diff]) -> None:
+    stack = list(reversed(diffs))
+    while stack:
+        diff = stack.pop()
+        stack.extend(reversed(diff.children))
+
+        if diff.record.type != TreeRecordType.BLOB:
+            continue
+
+        old_path = new_path = diff_path(diff)
+        match diff:
+            case AddedDiff(record, _, _):
+                old_hash, new_hash = None, record.hash
+            case ModifiedDiff(record, _, _, new_record) if new_record.type == TreeRecordType.BLOB:
+                old_hash, new_hash = record.hash, new_record.hash
+            case RemovedDiff(record, _, _):
+                old_hash, new_hash = record.hash, None
+            case MovedFromDiff(record, _, _, moved_from, similarity) if moved_from is not None and similarity < 1:
+                # Edited renames are shown once, from the side they were moved to
+                old_path = diff_path(moved_from)
+                old_hash, new_hash = moved_from.record.hash, record.hash
+            case _:
+                continue
+
+        _print_patch(repo, old_path, new_path, old_hash, new_hash)
+
+
+def _print_patch(repo: Repository, old_path: str, new_path: str, old_hash: str | None,
+                 new_hash: str | None) -> None:
+    print(f'\ndiff --caf a/{old_path} b/{new_path}')
+    if is_binary_blob(repo.objects_dir(), old_hash) or is_binary_blob(repo.objects_dir(), new_hash):
+        print(f'Binary files a/{old_path} and b/{new_path} differ')
+        return
+
+    print(f'--- a/{old_path}' if old_hash else '--- /dev/null')
+    print(f'+++ b/{new_path}' if new_hash else '+++ /dev/null')
+    sys.stdout.write(format_hunks(repo.diff_blobs(old_hash, new_hash)))
@@ -1,11 +1,12 @@
 """libcaf - Content Addressable File system in Python."""
 
-from _libcaf import Blob, Commit, Tree, TreeRecord, TreeRecordType
+from _libcaf import Blob, Commit, Tree, TreeChange, TreeRecord, TreeRecordType
 
 __all__ = [
     'Blob',
     'Commit',
     'Tree',
+    'TreeChange',
     'TreeRecord',
     'TreeRecordType',
 ]
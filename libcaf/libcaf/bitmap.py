@@ -0,0 +1,354 @@
+"""Reachability bitmaps over object positions."""
+
+import fcntl
+import os
+import struct
+from collections.abc import Iterable
+from pathlib import Path
+
+from . import TreeRecordType
+from .commit_graph import CommitGraph
+from .plumbing import load_tree
+
+BITMAP_SIGNATURE = b'BITM'
+BITMAP_VERSION = 2
+
+# Every commit whose generation is a multiple of this gets a stored bitmap, in addition to ref tips
+BITMAP_INTERVAL = 64
+
+# Header: signature, format version
+_HEADER = struct.Struct('<4sI')
+# Chunk header, one per save: number of objects added, number of bitmaps added
+_CHUNK = struct.Struct('<II')
+# Bitmap entry: commit position, encoded length in bytes
+_ENTRY = struct.Struct('<II')
+
+_WORD = struct.Struct('<Q')
+_WORD_BITS = 64
+_ALL_ONES = (1 << _WORD_BITS) - 1
+_MAX_RUN = (1 << 32) - 1
+_MAX_LITERALS = (1 << 31) - 1
+
+
+class BitmapError(Exception):
+    """Exception raised for reachability bitmap related errors."""
+
+
+def _marker(run_bit: int, run_length: int, literal_count: int) -> bytes:
+    return _WORD.pack(run_bit | (run_length << 1) | (literal_count << 33))
+
+
+def ewah_encode(bits: int) -> bytes:
+    """Compress a bitmap with EWAH: runs of all-zero or all-one words become a single marker word.
+
+    Each marker word holds the run bit (bit 0), the number of clean words in the run (bits 1-32) and the number
+    of literal words that follow it (bits 33-63).
+
+    :param bits: The bitmap, as a non-negative integer where bit i stands for object position i.
+    :return: The encoded bytes."""
+    num_words = (bits.bit_length() + _WORD_BITS - 1) // _WORD_BITS
+    words = memoryview(bits.to_bytes(num_words * 8, 'little')).cast('Q')
+
+    out = bytearray()
+    position = 0
+    while position < num_words:
+        run_bit = 1 if words[position] == _ALL_ONES else 0
+        clean = _ALL_ONES if run_bit else 0
+        run_length = 0
+        while position < num_words and words[position] == clean and run_length < _MAX_RUN:
+            run_length += 1
+            position += 1
+
+        literal_start = position
+        while (position < num_words and words[position] not in (0, _ALL_ONES)
+               and position - literal_start < _MAX_LITERALS):
+            position += 1
+
+        out += _marker(run_bit, run_length, position - literal_start)
+        out += words[literal_start:position].tobytes()
+
+    return bytes(out)
+
+
+def ewah_decode(data: bytes | memoryview) -> int:
+    """Decompress an EWAH-encoded bitmap.
+
+    :param data: The encoded bytes.
+    :return: The bitmap as an integer.
+    :raises BitmapError: If the data is truncated."""
+    words = bytearray()
+    offset = 0
+    while offset < len(data):
+        (marker,) = _WORD.unpack_from(data, offset)
+        offset += _WORD.size
+
+        run_bit = marker & 1
+        run_length = (marker >> 1) & _MAX_RUN
+        literal_count = marker >> 33
+        words += (b'\xff' if run_bit else b'\x00') * (run_length * 8)
+
+        end = offset + literal_count * 8
+        if end > len(data):
+            msg = 'Truncated EWAH bitmap'
+            raise BitmapError(msg)
+        words += data[offset:end]
+        offset = end
+
+    return int.from_bytes(words, 'little')
+
+
+class BitmapIndex:
+    """Reachability bitmaps for selected commits.
+
+    Every object known to the index is assigned a position in the order it was first seen, so positions never
+    change as the index grows. A bitmap has bit i set if the object at position i is reachable from the commit.
+    Bitmaps are stored for ref tips and for commits at regular generation intervals; the reachable set of any
+    other commit is the bitmap of its nearest stored ancestor plus the objects introduced along the way, found
+    by walking only the trees that are not already marked.
+
+    Bitmaps are integers, so that unions, differences and counts run over whole words, but a walk marks objects
+    one at a time in a bytearray and converts it once. The file is a header followed by one chunk per save, each
+    holding the objects and bitmaps added since the previous one, so saving only appends."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.objects: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._bitmaps: dict[str, int] = {}
+        # Objects and bitmaps added since loading, and the file size they are to be appended at
+        self._saved_objects = 0
+        self._new_bitmaps: list[str] = []
+        self._loaded_size: int | None = None
+        self._valid_size = 0
+
+        if not path.exists():
+            return
+
+        data = memoryview(path.read_bytes())
+        if len(data) < _HEADER.size:
+            return
+
+        signature, version = _HEADER.unpack_from(data, 0)
+        if signature != BITMAP_SIGNATURE or version != BITMAP_VERSION:
+            # An unknown format is treated as an empty index and gets rewritten on the next save
+            return
+
+        self._loaded_size = len(data)
+        self._valid_size = offset = _HEADER.size
+        try:
+            while offset < len(data):
+                offset = self._load_chunk(data, offset)
+                self._valid_size = offset
+        except (BitmapError, IndexError, struct.error):
+            # A save interrupted while appending leaves a partial chunk, which the next save overwrites
+            pass
+
+        self._saved_objects = len(self.objects)
+
+    def _load_chunk(self, data: memoryview, offset: int) -> int:
+        object_count, bitmap_count = _CHUNK.unpack_from(data, offset)
+        offset += _CHUNK.size
+
+        objects_end = offset + object_count * 20
+        if objects_end > len(data):
+            msg = 'Truncated bitmap object table'
+            raise BitmapError(msg)
+        objects = [data[start:start + 20].hex() for start in range(offset, objects_end, 20)]
+        offset = objects_end
+
+        bitmaps = {}
+        for _ in range(bitmap_count):
+            commit_position, length = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            if offset + length > len(data):
+                msg = 'Truncated bitmap'
+                raise BitmapError(msg)
+            commit_hash = (self.objects[commit_position] if commit_position < len(self.objects)
+                           else objects[commit_position - len(self.objects)])
+            bitmaps[commit_hash] = ewah_decode(data[offset:offset + length])
+            offset += length
+
+        # Only a complete chunk is taken in
+        for object_hash in objects:
+            self._positions[object_hash] = len(self.objects)
+            self.objects.append(object_hash)
+        self._bitmaps.update(bitmaps)
+        return offset
+
+    def __contains__(self, commit_hash: str) -> bool:
+        return commit_hash in self._bitmaps
+
+    def position(self, object_hash: str) -> int:
+        """Get the position of an object, assigning the next free one if it is new.
+
+        :param object_hash: The hash of the object.
+        :return: The position."""
+        position = self._positions.get(object_hash)
+        if position is None:
+            position = len(self.objects)
+            self.objects.append(object_hash)
+            self._positions[object_hash] = position
+
+        return position
+
+    def known(self, object_hash: str) -> bool:
+        """Check whether an object has a position in the index.
+
+        :param object_hash: The hash of the object.
+        :return: True if the object has a position, False otherwise."""
+        return object_hash in self._positions
+
+    def bitmap(self, object_hashes: Iterable[str]) -> int:
+        """Build the bitmap of a set of objects, ignoring the ones the index does not know.
+
+        :param object_hashes: The hashes of the objects.
+        :return: The bitmap."""
+        marks = bytearray()
+        for object_hash in object_hashes:
+            position = self._positions.get(object_hash)
+            if position is not None:
+                _mark(marks, position)
+
+        return int.from_bytes(marks, 'little')
+
+    def hashes(self, bits: int) -> list[str]:
+        """Translate a bitmap back into object hashes.
+
+        :param bits: The bitmap.
+        :return: The hashes of the objects whose bits are set, in position order."""
+        num_words = (bits.bit_length() + _WORD_BITS - 1) // _WORD_BITS
+        words = memoryview(bits.to_bytes(num_words * 8, 'little')).cast('Q')
+        objects = self.objects
+        hashes: list[str] = []
+        for word_index, word in enumerate(words):
+            while word:
+                low_bit = word & -word
+                hashes.append(objects[word_index * _WORD_BITS + low_bit.bit_length() - 1])
+                word ^= low_bit
+
+        return hashes
+
+    def reachable(self, objects_dir: str | Path, graph: CommitGraph, commit_hash: str) -> int:
+        """Compute the bitmap of objects reachable from a commit.
+
+        The first-parent chain is followed back to the nearest commit with a stored bitmap. The commits in
+        between are then replayed oldest first, and each one only loads the trees that are not yet marked.
+        Commits on ref tips or generation intervals get their bitmap stored along the way.
+
+        :param objects_dir: The objects directory to load trees from.
+        :param graph: A commit-graph recording the commit and its ancestors.
+        :param commit_hash: The commit to start from.
+        :return: The bitmap.
+        :raises CommitGraphError: If the commit is not recorded in the graph."""
+        bits = self._bitmaps.get(commit_hash)
+        if bits is not None:
+            return bits
+
+        chain = []
+        bits = 0
+        for entry in graph.walk(commit_hash):
+            stored = self._bitmaps.get(entry.commit_hash)
+            if stored is not None:
+                bits = stored
+                break
+            chain.append(entry)
+
+        marks = bytearray(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))
+        for entry in reversed(chain):
+            _mark(marks, self.position(entry.commit_hash))
+            self._mark_tree(objects_dir, entry.tree_hash, marks)
+            if entry.generation % BITMAP_INTERVAL == 0:
+                self._store(entry.commit_hash, int.from_bytes(marks, 'little'))
+
+        bits = int.from_bytes(marks, 'little')
+        self._store(commit_hash, bits)
+        return bits
+
+    def reachable_from(self, objects_dir: str | Path, graph: CommitGraph, commit_hashes: Iterable[str]) -> int:
+        """Compute the union of the bitmaps of several commits.
+
+        :param objects_dir: The objects directory to load trees from.
+        :param graph: A commit-graph recording the commits and their ancestors.
+        :param commit_hashes: The commits to start from.
+        :return: The bitmap."""
+        bits = 0
+        for commit_hash in commit_hashes:
+            bits |= self.reachable(objects_dir, graph, commit_hash)
+
+        return bits
+
+    def _mark_tree(self, objects_dir: str | Path, tree_hash: str, marks: bytearray) -> None:
+        stack = [tree_hash]
+        while stack:
+            current = stack.pop()
+            if _mark(marks, self.position(current)):
+                # Everything below an already marked tree is marked too
+                continue
+
+            for record in load_tree(objects_dir, current).records.values():
+                if record.type == TreeRecordType.TREE:
+                    stack.append(record.hash)
+                else:
+                    _mark(marks, self.position(record.hash))
+
+    def _store(self, commit_hash: str, bits: int) -> None:
+        if commit_hash not in self._bitmaps:
+            self._bitmaps[commit_hash] = bits
+            self._new_bitmaps.append(commit_hash)
+
+    def save(self) -> None:
+        """Append the objects and bitmaps added since the index was loaded to its file, if there are any.
+
+        A file in an unknown format is rewritten atomically. If another process has saved the index since it
+        was loaded, nothing is written: the positions assigned here may clash with its own, and the bitmaps
+        are recomputed when next needed."""
+        if len(self.objects) == self._saved_objects and not self._new_bitmaps:
+            return
+
+        chunk = [_CHUNK.pack(len(self.objects) - self._saved_objects, len(self._new_bitmaps))]
+        chunk.extend(bytes.fromhex(object_hash) for object_hash in self.objects[self._saved_objects:])
+        for commit_hash in self._new_bitmaps:
+            encoded = ewah_encode(self._bitmaps[commit_hash])
+            chunk.append(_ENTRY.pack(self._positions[commit_hash], len(encoded)))
+            chunk.append(encoded)
+        data = b''.join(chunk)
+
+        if self._loaded_size is None:
+            data = _HEADER.pack(BITMAP_SIGNATURE, BITMAP_VERSION) + data
+            tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+            with tmp_path.open('wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+            self._loaded_size = self._valid_size = len(data)
+        else:
+            try:
+                f = self.path.open('r+b')
+            except FileNotFoundError:
+                return
+            with f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if os.fstat(f.fileno()).st_size != self._loaded_size:
+                    return
+                f.seek(self._valid_size)
+                f.write(data)
+                f.truncate()
+            self._valid_size += len(data)
+            self._loaded_size = self._valid_size
+
+        self._saved_objects = len(self.objects)
+        self._new_bitmaps = []
+
+
+def _mark(marks: bytearray, position: int) -> bool:
+    """Set the bit of a position in a bitmap, growing it as needed.
+
+    :return: True if the bit was already set, False otherwise."""
+    byte_index = position >> 3
+    if byte_index >= len(marks):
+        marks.extend(bytes(byte_index + 1 - len(marks)))
+
+    mask = 1 << (position & 7)
+    if marks[byte_index] & mask:
+        return True
+    marks[byte_index] |= mask
+    return False
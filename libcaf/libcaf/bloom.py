@@ -0,0 +1,50 @@
+"""Bloom filters over changed paths."""
+
+import hashlib
+from collections.abc import Iterable
+
+BITS_PER_ENTRY = 10
+NUM_HASHES = 7
+
+
+def _bit_positions(key: str, num_bits: int) -> list[int]:
+    # Double hashing: derive all probe positions from two 64-bit halves of a single digest
+    digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+
+    return [(h1 + i * h2) % num_bits for i in range(NUM_HASHES)]
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter answering "definitely not present" or "maybe present" for string keys."""
+
+    def __init__(self, data: bytes | bytearray) -> None:
+        self.data = bytes(data)
+
+    @classmethod
+    def from_keys(cls, keys: Iterable[str]) -> 'BloomFilter':
+        """Build a filter sized for the given keys.
+
+        :param keys: The keys to add.
+        :return: The BloomFilter. An empty key set yields an empty filter that contains nothing."""
+        keys = list(keys)
+        num_bytes = (len(keys) * BITS_PER_ENTRY + 7) // 8
+        data = bytearray(num_bytes)
+
+        for key in keys:
+            for bit in _bit_positions(key, num_bytes * 8):
+                data[bit >> 3] |= 1 << (bit & 7)
+
+        return cls(data)
+
+    def might_contain(self, key: str) -> bool:
+        """Check whether a key may have been added to the filter.
+
+        :param key: The key to check.
+        :return: False if the key was definitely not added, True if it may have been."""
+        if not self.data:
+            return False
+
+        return all(self.data[bit >> 3] & (1 << (bit & 7))
+                   for bit in _bit_positions(key, len(self.data) * 8))
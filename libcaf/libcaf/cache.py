@@ -0,0 +1,188 @@
+"""On-disk caches of derived data, keyed by object hash."""
+
+import os
+import tempfile
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+from .constants import ATTRIBUTES_FILE, HASH_LENGTH, INFO_SUBDIR
+
+# Attribute table entry: binary object hash, flags
+_ATTRIBUTE_ENTRY_SIZE = HASH_LENGTH // 2 + 1
+
+
+class ObjectCache:
+    """A cache of derived data stored next to the objects it was computed from.
+
+    Entries live under ``<objects>/info/<kind>/<key[:2]>/<key>``. Since objects are immutable, an entry never
+    goes stale: it only has to be computed once per key. Writes are atomic, so concurrent writers of the same
+    entry are harmless.
+
+    A cache given a maximum size keeps track of when each entry was last used, in its modification time, and
+    ``prune`` evicts the least recently used entries beyond that size."""
+
+    def __init__(self, objects_dir: str | Path, kind: str, max_size: int | None = None) -> None:
+        self.cache_dir = Path(objects_dir) / INFO_SUBDIR / kind
+        self.max_size = max_size
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def get(self, key: str) -> bytes | None:
+        """Read an entry.
+
+        :param key: The key of the entry, usually an object hash.
+        :return: The cached data, or None if there is no entry."""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            if self.max_size is not None:
+                os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Write an entry, replacing any existing one.
+
+        :param key: The key of the entry, usually an object hash.
+        :param data: The data to cache."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{key}.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    def evict(self, predicate: Callable[[bytes], bool]) -> int:
+        """Remove the entries whose data matches a predicate, e.g. results that depend on something that changed.
+
+        :param predicate: Called with the data of each entry; the entry is removed if it returns True.
+        :return: The number of entries removed."""
+        evicted = 0
+        for path in self.cache_dir.glob('??/*'):
+            if path.name.startswith('.'):
+                continue
+            try:
+                if predicate(path.read_bytes()):
+                    path.unlink(missing_ok=True)
+                    evicted += 1
+            except OSError:
+                continue
+
+        return evicted
+
+    def prune(self) -> int:
+        """Evict the least recently used entries until the disk space used by the cache is within its maximum size.
+
+        :return: The number of entries evicted."""
+        if self.max_size is None:
+            return 0
+
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob('??/*'):
+            if path.name.startswith('.'):
+                # An entry still being written
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_blocks * 512, path))
+            total += stat.st_blocks * 512
+
+        evicted = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+
+        return evicted
+
+
+class AttributeTable:
+    """One-byte flags of objects, e.g. whether a blob is binary, packed into a single file.
+
+    Entries are a binary object hash followed by its flags, appended to ``<objects>/info/<ATTRIBUTES_FILE>``.
+    The file is read once per process (see attribute_table) and looked up in memory, since reading an entry
+    from a file of its own costs more than computing most flags again. Since objects are immutable, an entry
+    never goes stale. Every entry is appended with a single write, so concurrent writers never interleave;
+    an object added by two of them only has two equal entries."""
+
+    def __init__(self, objects_dir: str | Path) -> None:
+        self.path = Path(objects_dir) / INFO_SUBDIR / ATTRIBUTES_FILE
+        self._flags: dict[bytes, int] = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> int | None:
+        """Look up the flags of an object, reading the entries other processes appended if it is not known yet.
+
+        :param key: The object hash.
+        :return: The flags, or None if there is no entry."""
+        binary_key = bytes.fromhex(key)
+        flags = self._flags.get(binary_key)
+        if flags is None:
+            self._read_new_entries()
+            flags = self._flags.get(binary_key)
+        return flags
+
+    def put(self, key: str, flags: int) -> None:
+        """Append the flags of an object.
+
+        :param key: The object hash.
+        :param flags: The flags, from 0 to 255."""
+        binary_key = bytes.fromhex(key)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, binary_key + bytes([flags]))
+        finally:
+            os.close(fd)
+        self._flags[binary_key] = flags
+
+    def _read_new_entries(self) -> None:
+        with self._lock:
+            try:
+                with self.path.open('rb') as f:
+                    if os.fstat(f.fileno()).st_size < self._offset:
+                        # Removed and written again since
+                        self._offset = 0
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+
+            # An entry still being appended is read next time
+            end = len(data) - len(data) % _ATTRIBUTE_ENTRY_SIZE
+            for start in range(0, end, _ATTRIBUTE_ENTRY_SIZE):
+                self._flags[data[start:start + _ATTRIBUTE_ENTRY_SIZE - 1]] = data[start + _ATTRIBUTE_ENTRY_SIZE - 1]
+            self._offset += end
+
+
+# Keyed by path string rather than Path, which is slower to hash than a whole lookup
+_attribute_tables: dict[str, AttributeTable] = {}
+_attribute_tables_lock = threading.Lock()
+
+
+def attribute_table(objects_dir: str | Path) -> AttributeTable:
+    """Get the attribute table of an objects directory, shared by every lookup in this process.
+
+    :param objects_dir: The objects directory.
+    :return: The table."""
+    key = os.fspath(objects_dir)
+    table = _attribute_tables.get(key)
+    if table is None:
+        with _attribute_tables_lock:
+            table = _attribute_tables.setdefault(key, AttributeTable(key))
+    return table
@@ -0,0 +1,544 @@
+"""Commit-graph file for walking history without loading commit objects."""
+
+import hashlib
+import mmap
+import os
+import re
+import struct
+from bisect import bisect_right
+from collections.abc import Generator, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import Commit, TreeRecordType
+from .bloom import BloomFilter
+from .plumbing import load_commit, load_tree
+from .ref import HashRef
+
+COMMIT_GRAPH_SIGNATURE = b'CGPH'
+COMMIT_GRAPH_VERSION = 4
+
+# Header: signature, format version, number of commits, number of commits in the layers below
+_HEADER = struct.Struct('<4sIII')
+# Row: commit hash, tree hash, parent position, jump position, generation number, timestamp,
+# changed-path filter offset and length within the filter data that follows the rows
+_ROW = struct.Struct('<20s20sIIIqQI')
+
+NO_PARENT = 0xFFFFFFFF
+NO_FILTER = 0xFFFFFFFF
+
+# Commits changing more paths than this get no changed-path filter and are always inspected
+MAX_CHANGED_PATHS = 512
+
+# A new layer is merged into the one below it unless it is less than 1/LAYER_SIZE_FACTOR of its size
+LAYER_SIZE_FACTOR = 2
+# Reads of a chain that is replaced concurrently, while its layers are being opened, before giving up
+_CHAIN_READ_ATTEMPTS = 3
+_LAYER_NAME = re.compile(r'[0-9a-f]{40}\.graph')
+
+
+class CommitGraphError(Exception):
+    """Exception raised for commit-graph related errors."""
+
+
+@dataclass
+class CommitGraphEntry:
+    """A single commit as recorded in the commit-graph."""
+
+    position: int
+    commit_hash: HashRef
+    tree_hash: str
+    parent_position: int | None
+    jump_position: int
+    generation: int
+    timestamp: int
+
+
+@dataclass
+class CommitGraphRow:
+    """A commit to be written to the commit-graph, with its parent referenced by hash."""
+
+    tree_hash: str
+    parent_hash: str | None
+    generation: int
+    timestamp: int
+    changed_paths: BloomFilter | None = None
+
+
+class _Layer:
+    """One memory-mapped file of the commit-graph chain: rows sorted by commit hash, positioned after the rows of
+    the layers below it."""
+
+    def __init__(self, path: Path, base_count: int) -> None:
+        self.path = path
+        self.base_count = base_count
+        with path.open('rb') as f:
+            self.mmapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mmapped) < _HEADER.size:
+            self.close()
+            msg = f'Commit-graph layer {path} is truncated'
+            raise CommitGraphError(msg)
+
+        signature, version, self.count, layer_base_count = _HEADER.unpack_from(self.mmapped, 0)
+        if signature != COMMIT_GRAPH_SIGNATURE or version != COMMIT_GRAPH_VERSION or layer_base_count != base_count:
+            self.close()
+            msg = f'Commit-graph layer {path} does not belong to its chain'
+            raise CommitGraphError(msg)
+        if len(self.mmapped) < _HEADER.size + self.count * _ROW.size:
+            self.close()
+            msg = f'Commit-graph layer {path} is truncated'
+            raise CommitGraphError(msg)
+
+    def close(self) -> None:
+        self.mmapped.close()
+
+    def raw_hash(self, index: int) -> bytes:
+        offset = _HEADER.size + index * _ROW.size
+        return self.mmapped[offset:offset + 20]
+
+    def index(self, key: bytes) -> int | None:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw_hash(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self.raw_hash(low) == key:
+            return low
+        return None
+
+
+class CommitGraph:
+    """Read-only, memory-mapped view over a commit-graph.
+
+    The graph is a chain of layers, listed base first in the file at ``path``, each a table of fixed-size rows
+    sorted by commit hash. A commit is located with a binary search in each layer, and its parent is reached by
+    position, without opening any commit object. Positions are global: a layer's rows follow those of the layers
+    below it, so new commits are added as a new layer without touching, or renumbering, the existing ones."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._layers: list[_Layer] = []
+        self._bases: list[int] = []
+        self._count = 0
+
+        for _ in range(_CHAIN_READ_ATTEMPTS):
+            names = read_commit_graph_chain(path)
+            try:
+                for name in names:
+                    layer = _Layer(layers_dir(path) / name, self._count)
+                    self._layers.append(layer)
+                    self._bases.append(self._count)
+                    self._count += layer.count
+                return
+            except FileNotFoundError:
+                self.close()
+                # The chain was compacted while being opened, and the layers it listed removed
+                if read_commit_graph_chain(path) == names:
+                    break
+            except BaseException:
+                self.close()
+                raise
+
+        msg = f'Commit-graph chain {path} lists missing layers'
+        raise CommitGraphError(msg)
+
+    def close(self) -> None:
+        """Release the memory maps of the layers."""
+        for layer in self._layers:
+            layer.close()
+        self._layers = []
+        self._bases = []
+        self._count = 0
+
+    @property
+    def layers(self) -> list[tuple[str, int]]:
+        """The file names and commit counts of the layers of the chain, base first."""
+        return [(layer.path.name, layer.count) for layer in self._layers]
+
+    def __enter__(self) -> 'CommitGraph':
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, commit_hash: object) -> bool:
+        return isinstance(commit_hash, str) and self.position(commit_hash) is not None
+
+    def _locate(self, position: int) -> tuple[_Layer, int]:
+        layer = self._layers[bisect_right(self._bases, position) - 1]
+        return layer, position - layer.base_count
+
+    def position(self, commit_hash: str) -> int | None:
+        """Find the row position of a commit.
+
+        :param commit_hash: The hash of the commit to look up.
+        :return: The position of the commit in the graph, or None if it is not recorded."""
+        key = bytes.fromhex(commit_hash)
+        for layer in reversed(self._layers):
+            index = layer.index(key)
+            if index is not None:
+                return layer.base_count + index
+        return None
+
+    def entry(self, position: int) -> CommitGraphEntry:
+        """Decode the row at the given position.
+
+        :param position: The row position.
+        :return: The decoded CommitGraphEntry.
+        :raises IndexError: If the position is out of range."""
+        if position < 0 or position >= self._count:
+            msg = 'commit-graph position out of range'
+            raise IndexError(msg)
+
+        layer, index = self._locate(position)
+        commit_hash, tree_hash, parent_position, jump_position, generation, timestamp, _, _ = \
+            _ROW.unpack_from(layer.mmapped, _HEADER.size + index * _ROW.size)
+
+        return CommitGraphEntry(position, HashRef(commit_hash.hex()), tree_hash.hex(),
+                                None if parent_position == NO_PARENT else parent_position,
+                                jump_position, generation, timestamp)
+
+    def changed_paths(self, position: int) -> BloomFilter | None:
+        """Get the changed-path filter of the commit at the given position.
+
+        :param position: The row position.
+        :return: A BloomFilter over the paths the commit changed relative to its parent, or None if the commit
+            changed too many paths to be filtered."""
+        layer, index = self._locate(position)
+        *_, offset, length = _ROW.unpack_from(layer.mmapped, _HEADER.size + index * _ROW.size)
+        if length == NO_FILTER:
+            return None
+
+        start = _HEADER.size + layer.count * _ROW.size + offset
+        return BloomFilter(layer.mmapped[start:start + length])
+
+    def row(self, position: int) -> CommitGraphRow:
+        """Decode the row at the given position into a CommitGraphRow, resolving the parent to its hash.
+
+        :param position: The row position.
+        :return: The CommitGraphRow."""
+        entry = self.entry(position)
+        parent_hash = self.entry(entry.parent_position).commit_hash if entry.parent_position is not None else None
+
+        return CommitGraphRow(entry.tree_hash, parent_hash, entry.generation, entry.timestamp,
+                              self.changed_paths(position))
+
+    def get(self, commit_hash: str) -> CommitGraphEntry | None:
+        """Look up a commit by hash.
+
+        :param commit_hash: The hash of the commit to look up.
+        :return: The CommitGraphEntry, or None if the commit is not recorded."""
+        position = self.position(commit_hash)
+        return None if position is None else self.entry(position)
+
+    def walk(self, commit_hash: str) -> Generator[CommitGraphEntry, None, None]:
+        """Walk the first-parent chain starting at a commit.
+
+        :param commit_hash: The commit to start from.
+        :return: A generator yielding the commit and each of its ancestors, newest first.
+        :raises CommitGraphError: If the commit is not recorded in the graph."""
+        entry = self.get(commit_hash)
+        if entry is None:
+            msg = f'Commit {commit_hash} is not in the commit-graph'
+            raise CommitGraphError(msg)
+
+        while True:
+            yield entry
+            if entry.parent_position is None:
+                return
+            entry = self.entry(entry.parent_position)
+
+    def ancestor_at(self, entry: CommitGraphEntry, generation: int) -> CommitGraphEntry:
+        """Find the ancestor of a commit that has the given generation number.
+
+        Jump pointers are taken whenever they do not overshoot, which reaches any generation in a logarithmic
+        number of steps.
+
+        :param entry: The commit to start from.
+        :param generation: The generation to reach. Must not exceed the generation of the commit.
+        :return: The ancestor at that generation.
+        :raises ValueError: If the generation is out of range."""
+        if generation < 1 or generation > entry.generation:
+            msg = f'Generation {generation} is not an ancestor generation of {entry.commit_hash}'
+            raise ValueError(msg)
+
+        while entry.generation > generation:
+            jump = self.entry(entry.jump_position)
+            if jump.generation >= generation:
+                entry = jump
+            else:
+                entry = self.entry(entry.parent_position)
+
+        return entry
+
+    def merge_base(self, hash1: str, hash2: str) -> HashRef | None:
+        """Find the nearest common ancestor of two commits.
+
+        Both commits are first brought to the same generation, then climbed in lockstep, taking the jump pointers
+        whenever they still lead to different commits. This takes a logarithmic number of steps in the length of
+        history, and never more than the distance to the merge base.
+
+        :param hash1: The first commit.
+        :param hash2: The second commit.
+        :return: The hash of the common ancestor, or None if the histories are unrelated.
+        :raises CommitGraphError: If either commit is not recorded in the graph."""
+        entry1 = self.get(hash1)
+        entry2 = self.get(hash2)
+        if entry1 is None or entry2 is None:
+            msg = f'Commits {hash1} and {hash2} must both be in the commit-graph'
+            raise CommitGraphError(msg)
+
+        generation = min(entry1.generation, entry2.generation)
+        entry1 = self.ancestor_at(entry1, generation)
+        entry2 = self.ancestor_at(entry2, generation)
+
+        while entry1.position != entry2.position:
+            if entry1.parent_position is None or entry2.parent_position is None:
+                return None
+
+            # Jump targets depend only on the generation, so both jumps land on the same generation
+            if entry1.jump_position != entry2.jump_position:
+                entry1 = self.entry(entry1.jump_position)
+                entry2 = self.entry(entry2.jump_position)
+            else:
+                entry1 = self.entry(entry1.parent_position)
+                entry2 = self.entry(entry2.parent_position)
+
+        return entry1.commit_hash
+
+
+def changed_paths(objects_dir: str | Path, old_tree_hash: str | None, new_tree_hash: str) -> list[str] | None:
+    """List the paths that differ between two trees.
+
+    Every changed entry is reported together with all of its parent directories, and added or removed
+    subtrees are listed in full, so that a lookup for any affected file or directory succeeds.
+    Subtrees with the same hash on both sides are never loaded.
+
+    :param objects_dir: The objects directory to load trees from.
+    :param old_tree_hash: The tree of the parent commit, or None for a root commit.
+    :param new_tree_hash: The tree of the commit.
+    :return: The changed paths, or None if there are more than MAX_CHANGED_PATHS of them."""
+    paths: set[str] = set()
+    stack: list[tuple[str | None, str | None, str]] = [(old_tree_hash, new_tree_hash, '')]
+
+    while stack:
+        old_hash, new_hash, prefix = stack.pop()
+        old_records = load_tree(objects_dir, old_hash).records if old_hash else {}
+        new_records = load_tree(objects_dir, new_hash).records if new_hash else {}
+
+        for name in old_records.keys() | new_records.keys():
+            old_record = old_records.get(name)
+            new_record = new_records.get(name)
+            if old_record is not None and new_record is not None and old_record.hash == new_record.hash:
+                continue
+
+            path = f'{prefix}{name}'
+            paths.add(path)
+            if len(paths) > MAX_CHANGED_PATHS:
+                return None
+
+            old_subtree = old_record.hash if old_record and old_record.type == TreeRecordType.TREE else None
+            new_subtree = new_record.hash if new_record and new_record.type == TreeRecordType.TREE else None
+            if old_subtree or new_subtree:
+                stack.append((old_subtree, new_subtree, f'{path}/'))
+
+    return sorted(paths)
+
+
+def layers_dir(path: Path) -> Path:
+    """Get the directory holding the layer files of the commit-graph chain at a path."""
+    return path.with_name(f'{path.name}s')
+
+
+def read_commit_graph_chain(path: Path) -> list[str]:
+    """Read the file names of the layers of a commit-graph chain, base first.
+
+    A missing chain, or one in an unknown format, e.g. a single-file commit-graph written by an older version, is
+    an empty chain, and gets replaced on the next update."""
+    try:
+        names = path.read_bytes().decode('ascii', errors='replace').split()
+    except FileNotFoundError:
+        return []
+    return names if all(_LAYER_NAME.fullmatch(name) for name in names) else []
+
+
+def update_commit_graph(path: Path, objects_dir: str | Path, commit_hashes: Iterable[str]) -> list[tuple[str, Commit]]:
+    """Add commits and any of their ancestors missing from the commit-graph.
+
+    Only the commits that are not yet recorded are loaded from the object store: the walk back from each tip
+    stops at the first commit already present in the graph. They are written as a new layer on top of the chain,
+    merged with the top layers as long as it is not less than 1/LAYER_SIZE_FACTOR of the size of the layer below
+    it. Layer sizes therefore grow geometrically down the chain, which has a logarithmic number of layers, and
+    each commit is rewritten a logarithmic number of times over the life of the graph, in amortized time
+    independent of the length of history.
+
+    :param path: The path of the commit-graph chain file.
+    :param objects_dir: The objects directory to load new commits from.
+    :param commit_hashes: The commits to add.
+    :return: The (commit hash, Commit) pairs of the commits that were added, children before parents.
+    :raises CommitGraphError: If a commit cannot be loaded."""
+    with CommitGraph(path) as graph:
+        # Find the commits that are missing, in the order they were discovered (children before parents)
+        missing: dict[str, Commit] = {}
+        for commit_hash in commit_hashes:
+            current: str | None = commit_hash
+            while current and current not in missing and current not in graph:
+                try:
+                    commit = load_commit(objects_dir, current)
+                except Exception as e:
+                    msg = f'Error loading commit {current} for the commit-graph'
+                    raise CommitGraphError(msg) from e
+
+                missing[current] = commit
+                current = commit.parent
+
+        if not missing:
+            return []
+
+        rows: dict[str, CommitGraphRow] = {}
+
+        def parent_row(parent_hash: str) -> CommitGraphRow | None:
+            if parent_hash in rows:
+                return rows[parent_hash]
+            entry = graph.get(parent_hash)
+            return None if entry is None else CommitGraphRow(entry.tree_hash, None, entry.generation, entry.timestamp)
+
+        # Parents must be recorded before their children, which need their generation and tree
+        for commit_hash in missing:
+            stack = [commit_hash]
+            while stack:
+                current = stack[-1]
+                if current in rows:
+                    stack.pop()
+                    continue
+
+                commit = missing[current]
+                tree_hash, parent_hash, timestamp = commit.tree_hash, commit.parent, commit.timestamp
+                if parent_hash and parent_hash in missing and parent_hash not in rows:
+                    stack.append(parent_hash)
+                    continue
+
+                stack.pop()
+                parent = parent_row(parent_hash) if parent_hash else None
+                try:
+                    paths = changed_paths(objects_dir, parent.tree_hash if parent else None, tree_hash)
+                except Exception as e:
+                    msg = f'Error computing the changed paths of commit {current}'
+                    raise CommitGraphError(msg) from e
+
+                rows[current] = CommitGraphRow(tree_hash, parent_hash, parent.generation + 1 if parent else 1,
+                                               timestamp, BloomFilter.from_keys(paths) if paths is not None else None)
+
+        # Merge the top layers into the new one while it is not much smaller than them. Only the merged layers are
+        # decoded: nothing below them refers to their rows, and their rows keep referring to the same positions below.
+        layers = graph.layers
+        kept, base_count = len(layers), len(graph)
+        while kept and len(rows) * LAYER_SIZE_FACTOR > layers[kept - 1][1]:
+            kept -= 1
+            base_count -= layers[kept][1]
+            for position in range(base_count, base_count + layers[kept][1]):
+                rows[graph.entry(position).commit_hash] = graph.row(position)
+
+        names = [name for name, _ in layers]
+        layer_name = _write_layer(layers_dir(path), rows, graph, base_count)
+
+    _write_chain(path, [*names[:kept], layer_name])
+    for name in names[kept:]:
+        (layers_dir(path) / name).unlink(missing_ok=True)
+
+    return list(missing.items())
+
+
+def write_commit_graph(path: Path, rows: dict[str, CommitGraphRow]) -> None:
+    """Write a complete commit-graph, as a chain of a single layer.
+
+    :param path: The path of the commit-graph chain file.
+    :param rows: Mapping of commit hash to its CommitGraphRow."""
+    names = read_commit_graph_chain(path)
+    _write_chain(path, [_write_layer(layers_dir(path), rows, None, 0)])
+    for name in names:
+        (layers_dir(path) / name).unlink(missing_ok=True)
+
+
+def _write_chain(path: Path, names: list[str]) -> None:
+    tmp_path = path.with_name(f'{path.name}.tmp')
+    tmp_path.write_text(''.join(f'{name}\n' for name in names))
+    os.replace(tmp_path, path)
+
+
+def _write_layer(directory: Path, rows: dict[str, CommitGraphRow], base: CommitGraph | None,
+                 base_count: int) -> str:
+    """Write the rows of a layer, whose parents are either among them or in the first base_count positions of the
+    base graph.
+
+    :return: The file name of the layer, in the directory."""
+    ordered = sorted(rows)
+    positions = {commit_hash: base_count + index for index, commit_hash in enumerate(ordered)}
+
+    def position(commit_hash: str) -> int:
+        if commit_hash in positions:
+            return positions[commit_hash]
+        return base.position(commit_hash)  # type: ignore[union-attr]
+
+    def generation(commit_hash: str) -> int:
+        if commit_hash in rows:
+            return rows[commit_hash].generation
+        return base.get(commit_hash).generation  # type: ignore[union-attr]
+
+    def jump(commit_hash: str) -> str:
+        if commit_hash in jumps:
+            return jumps[commit_hash]
+        return base.entry(base.get(commit_hash).jump_position).commit_hash  # type: ignore[union-attr]
+
+    # Skew-binary jump pointers: a commit jumps to its parent, unless the parent's jump and the jump after it
+    # cover equal distances, in which case the two are merged into a single jump twice as long.
+    # Roots jump to themselves.
+    jumps: dict[str, str] = {}
+    for commit_hash in sorted(rows, key=lambda h: rows[h].generation):
+        parent_hash = rows[commit_hash].parent_hash
+        if not parent_hash:
+            jumps[commit_hash] = commit_hash
+            continue
+
+        parent_jump = jump(parent_hash)
+        parent_jump_jump = jump(parent_jump)
+        parent_generation = generation(parent_hash)
+        parent_jump_generation = generation(parent_jump)
+        if parent_generation - parent_jump_generation == parent_jump_generation - generation(parent_jump_jump):
+            jumps[commit_hash] = parent_jump_jump
+        else:
+            jumps[commit_hash] = parent_hash
+
+    buffer = bytearray(_HEADER.size + len(ordered) * _ROW.size)
+    filter_data = bytearray()
+    _HEADER.pack_into(buffer, 0, COMMIT_GRAPH_SIGNATURE, COMMIT_GRAPH_VERSION, len(ordered), base_count)
+    for index, commit_hash in enumerate(ordered):
+        row = rows[commit_hash]
+        parent_position = position(row.parent_hash) if row.parent_hash else NO_PARENT
+
+        filter_offset = len(filter_data)
+        if row.changed_paths is None:
+            filter_length = NO_FILTER
+        else:
+            filter_length = len(row.changed_paths.data)
+            filter_data += row.changed_paths.data
+
+        _ROW.pack_into(buffer, _HEADER.size + index * _ROW.size,
+                       bytes.fromhex(commit_hash), bytes.fromhex(row.tree_hash), parent_position,
+                       position(jumps[commit_hash]), row.generation, row.timestamp, filter_offset, filter_length)
+
+    # Layers are named by their content, so a chain never refers to a layer that was rewritten since
+    buffer += filter_data
+    name = f'{hashlib.sha1(buffer).hexdigest()}.graph'
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f'.{name}.tmp'
+    tmp_path.write_bytes(buffer)
+    os.replace(tmp_path, directory / name)
+    return name
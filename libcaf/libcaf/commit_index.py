@@ -0,0 +1,223 @@
+"""Secondary index over commit metadata: timestamps, authors and message trigrams."""
+
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import struct
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable
+from pathlib import Path
+
+from _libcaf import Commit
+
+TIME_TABLE = 'time'
+AUTHOR_TABLE = 'author'
+TRIGRAM_TABLE = 'trigram'
+
+# New rows are merged into the segment below them unless they are less than 1/SEGMENT_SIZE_FACTOR of its size
+SEGMENT_SIZE_FACTOR = 2
+# Reads of a chain that is replaced concurrently, while its segments are being opened, before giving up
+_CHAIN_READ_ATTEMPTS = 3
+
+
+class CommitIndexError(Exception):
+    """Exception raised for commit index related errors."""
+
+
+class _SortedTable:
+    """A table of fixed-size (key, commit hash) rows sorted by key, binary-searched through memory maps.
+
+    The rows are stored as a chain of sorted segment files, listed oldest first in ``<name>.chain``, each named by
+    the SHA-1 of its content. Inserted rows become a new segment, merged with the newest segments as long as it
+    is not less than 1/SEGMENT_SIZE_FACTOR of their size, so a table has a logarithmic number of segments and
+    each row is rewritten a logarithmic number of times, rather than the whole table on every insert."""
+
+    def __init__(self, index_dir: Path, name: str, key_format: str) -> None:
+        self.index_dir = index_dir
+        self.name = name
+        self.chain_path = index_dir / f'{name}.chain'
+        self._row = struct.Struct(f'<{key_format}20s')
+        self._segment_name = re.compile(rf'{re.escape(name)}-[0-9a-f]{{40}}')
+
+    def exists(self) -> bool:
+        return self.chain_path.exists()
+
+    def create(self) -> None:
+        self._write_chain([])
+
+    def _segments(self) -> list[str]:
+        try:
+            names = self.chain_path.read_text(encoding='ascii', errors='replace').split()
+        except FileNotFoundError:
+            return []
+        if not all(self._segment_name.fullmatch(name) for name in names):
+            msg = f'Commit index table {self.chain_path} is corrupt'
+            raise CommitIndexError(msg)
+        return names
+
+    def _write_chain(self, names: list[str]) -> None:
+        tmp_path = self.chain_path.with_name(f'{self.chain_path.name}.tmp')
+        tmp_path.write_text(''.join(f'{name}\n' for name in names), encoding='ascii')
+        os.replace(tmp_path, self.chain_path)
+
+    def lookup(self, low: int, high: int) -> list[str]:
+        """Get the commits whose key lies in the inclusive range [low, high].
+
+        :param low: The smallest key to include.
+        :param high: The largest key to include.
+        :return: The matching commit hashes, in key order."""
+        for _ in range(_CHAIN_READ_ATTEMPTS):
+            names = self._segments()
+            try:
+                rows = [row for name in names for row in self._lookup_segment(self.index_dir / name, low, high)]
+            except FileNotFoundError:
+                # The table was merged while being read, and the segments it listed removed
+                if self._segments() == names:
+                    break
+                continue
+
+            rows.sort()
+            return [commit_hash.hex() for _, commit_hash in dict.fromkeys(rows)]
+
+        msg = f'Commit index table {self.chain_path} lists missing segments'
+        raise CommitIndexError(msg)
+
+    def _lookup_segment(self, path: Path, low: int, high: int) -> list[tuple[int, bytes]]:
+        with path.open('rb') as f:
+            if os.fstat(f.fileno()).st_size < self._row.size:
+                return []
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mmapped:
+                row = self._row
+                count = len(mmapped) // row.size
+
+                def key_at(position: int) -> int:
+                    return row.unpack_from(mmapped, position * row.size)[0]
+
+                start = bisect_left(range(count), low, key=key_at)
+                end = bisect_right(range(count), high, lo=start, key=key_at)
+
+                return [row.unpack_from(mmapped, position * row.size) for position in range(start, end)]
+
+    def _segment_size(self, name: str) -> int:
+        return (self.index_dir / name).stat().st_size // self._row.size
+
+    def insert(self, rows: Iterable[tuple[int, str]]) -> None:
+        """Add new rows to the table as a new segment, merged with the newest segments while it is not much
+        smaller than them, and replace the chain atomically.
+
+        :param rows: The (key, commit hash) rows to insert."""
+        new_rows = {(key, bytes.fromhex(commit_hash)) for key, commit_hash in rows}
+        if not new_rows:
+            return
+
+        names = self._segments()
+        kept = len(names)
+        while kept and len(new_rows) * SEGMENT_SIZE_FACTOR > self._segment_size(names[kept - 1]):
+            kept -= 1
+            new_rows.update(self._row.iter_unpack((self.index_dir / names[kept]).read_bytes()))
+
+        buffer = bytearray(len(new_rows) * self._row.size)
+        for position, (key, commit_hash) in enumerate(sorted(new_rows)):
+            self._row.pack_into(buffer, position * self._row.size, key, commit_hash)
+
+        segment_name = f'{self.name}-{hashlib.sha1(buffer).hexdigest()}'
+        tmp_path = self.index_dir / f'.{segment_name}.tmp'
+        tmp_path.write_bytes(buffer)
+        os.replace(tmp_path, self.index_dir / segment_name)
+
+        self._write_chain([*names[:kept], segment_name])
+        for name in names[kept:]:
+            if name != segment_name:
+                (self.index_dir / name).unlink(missing_ok=True)
+
+
+def _author_key(author: str) -> int:
+    return int.from_bytes(hashlib.blake2b(author.encode(), digest_size=8).digest(), 'little')
+
+
+def _trigram_keys(text: str) -> set[int]:
+    data = text.lower().encode()
+    return {int.from_bytes(data[i:i + 3], 'big') for i in range(len(data) - 2)}
+
+
+class CommitIndex:
+    """Persistent secondary index over commit metadata.
+
+    The index consists of three sorted tables: commits by timestamp, by a hash of the author name, and by every
+    trigram of the lower-cased message. Lookups return candidate commit hashes; author and trigram matches may
+    contain false positives and must be confirmed against the commit objects."""
+
+    def __init__(self, index_dir: Path) -> None:
+        self.index_dir = index_dir
+        self._time = _SortedTable(index_dir, TIME_TABLE, 'q')
+        self._author = _SortedTable(index_dir, AUTHOR_TABLE, 'Q')
+        self._trigram = _SortedTable(index_dir, TRIGRAM_TABLE, 'I')
+
+    def exists(self) -> bool:
+        """Check whether the index has been created.
+
+        :return: True if every table of the index exists, False otherwise, e.g. for an index written by an older
+            version, which is rebuilt."""
+        return all(table.exists() for table in (self._time, self._author, self._trigram))
+
+    def create(self) -> None:
+        """Create an empty index, replacing any files left in the index directory."""
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+        self.index_dir.mkdir(parents=True)
+        for table in (self._time, self._author, self._trigram):
+            table.create()
+
+    def add(self, commits: Iterable[tuple[str, Commit]]) -> None:
+        """Index commits.
+
+        :param commits: The (commit hash, Commit) pairs to index.
+        :raises CommitIndexError: If the index has not been created."""
+        if not self.exists():
+            msg = f'Commit index does not exist at {self.index_dir}'
+            raise CommitIndexError(msg)
+
+        time_rows: list[tuple[int, str]] = []
+        author_rows: list[tuple[int, str]] = []
+        trigram_rows: list[tuple[int, str]] = []
+        for commit_hash, commit in commits:
+            time_rows.append((commit.timestamp, commit_hash))
+            author_rows.append((_author_key(commit.author), commit_hash))
+            trigram_rows.extend((key, commit_hash) for key in _trigram_keys(commit.message))
+
+        self._time.insert(time_rows)
+        self._author.insert(author_rows)
+        self._trigram.insert(trigram_rows)
+
+    def between(self, since: int | None = None, until: int | None = None) -> list[str]:
+        """Find the commits made in a time range.
+
+        :param since: The earliest timestamp to include, or None for no lower bound.
+        :param until: The latest timestamp to include, or None for no upper bound.
+        :return: The commit hashes, oldest first."""
+        return self._time.lookup(-2 ** 63 if since is None else since, 2 ** 63 - 1 if until is None else until)
+
+    def by_author(self, author: str) -> set[str]:
+        """Find candidate commits by an author.
+
+        :param author: The exact author name.
+        :return: The candidate commit hashes."""
+        key = _author_key(author)
+        return set(self._author.lookup(key, key))
+
+    def by_message(self, text: str) -> set[str] | None:
+        """Find candidate commits whose message contains a text, ignoring case.
+
+        :param text: The text to search for.
+        :return: The candidate commit hashes, or None if the text is shorter than a trigram and cannot narrow
+            down the search."""
+        candidates: set[str] | None = None
+        for key in _trigram_keys(text):
+            matches = set(self._trigram.lookup(key, key))
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return set()
+
+        return candidates
@@ -4,11 +4,36 @@ from _libcaf import hash_length
 
 DEFAULT_REPO_DIR = '.caf'
 OBJECTS_SUBDIR = 'objects'
+INFO_SUBDIR = 'info'
 HEAD_FILE = 'HEAD'
 DEFAULT_BRANCH = 'main'
 REFS_DIR = 'refs'
 HEADS_DIR = 'heads'
 TAGS_DIR = 'tags'
+COMMIT_GRAPH_FILE = 'commit-graph'
+COMMIT_INDEX_DIR = 'commit-index'
+BITMAP_FILE = 'bitmaps'
+ATTRIBUTES_FILE = 'blob-attributes'
+INDEX_FILE = 'index'
+
+# Changes fetched from the native tree differ per call when streaming a diff
+TREE_DIFF_BATCH_SIZE = 1024
+# Records read from a stored tree, or written to a tree, per native call when streaming its records
+TREE_RECORD_BATCH_SIZE = 1024
+# Pending added and removed records kept while pairing moves in a streamed diff
+DEFAULT_MOVE_WINDOW = 4096
+# Trees kept in memory while diffing a run of consecutive commits
+TREE_CACHE_SIZE = 4096
+# Smallest blob, in bytes, whose line offsets are cached on disk rather than indexed again on every use
+LINE_TABLE_MIN_CACHED_SIZE = 64 * 1024
+# Combined size, in bytes, of the three sides of a text merge from which it runs natively instead of with merge3
+NATIVE_MERGE_MIN_SIZE = 1024 * 1024
+# Content merges from which a merge with several workers runs them in worker processes rather than in-process
+PARALLEL_MERGE_MIN_BLOBS = 256
+# Combined size, in bytes, of the subtrees a merge has to walk from which it walks them in worker processes
+PARALLEL_WALK_MIN_SIZE = 1024 * 1024
+# Disk space, in bytes, that each of the blob and tree merge result caches may use before old entries are evicted
+MERGE_CACHE_MAX_SIZE = 64 * 1024 * 1024
 
 HASH_LENGTH = hash_length()
 HASH_CHARSET = '0123456789abcdef'
@@ -0,0 +1,170 @@
+"""Line-level diffs between blobs, rendered as unified hunks."""
+
+import struct
+from collections.abc import Sequence
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+
+import _libcaf
+
+from .cache import ObjectCache
+from .constants import HASH_LENGTH
+from .merge import _open_line_sequence, is_binary_blob
+
+DEFAULT_CONTEXT = 3
+
+STATS_CACHE = 'diffstats'
+# Cached (added, removed) line counts; binary blobs are stored as (-1, -1)
+_STATS = struct.Struct('<qq')
+_NO_BLOB = '0' * HASH_LENGTH
+
+
+@dataclass
+class Hunk:
+    """A group of nearby changes with surrounding context, as in a unified diff.
+
+    Line numbers are 1-based. Each line is a (prefix, content) pair where the prefix is ' ' for context,
+    '-' for a removed line and '+' for an added line; contents keep their trailing newline, if any."""
+
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: list[tuple[str, bytes]]
+
+    def header(self) -> str:
+        """Format the hunk header, such as '@@ -1,4 +1,5 @@'.
+
+        :return: The header line, without a trailing newline."""
+        old_range = _format_range(self.old_start, self.old_count)
+        new_range = _format_range(self.new_start, self.new_count)
+        return f'@@ -{old_range} +{new_range} @@'
+
+
+def _format_range(start: int, count: int) -> str:
+    # An empty range is reported as the line before it, following the unified diff format
+    if count == 0:
+        return f'{start - 1},0'
+    if count == 1:
+        return f'{start}'
+    return f'{start},{count}'
+
+
+def diff_blobs_core(objects_dir: str | Path, old_hash: str | None, new_hash: str | None,
+                    context: int = DEFAULT_CONTEXT) -> list[Hunk]:
+    """Compute the unified hunks between two blobs.
+
+    The diff itself runs natively over memory-mapped blobs; only the lines that end up in a hunk are read
+    into Python.
+
+    :param objects_dir: The objects directory to read the blobs from.
+    :param old_hash: The hash of the old blob, or None if the file was added.
+    :param new_hash: The hash of the new blob, or None if the file was removed.
+    :param context: The number of unchanged lines to show around each change.
+    :return: The hunks, in file order. Empty if the blobs have the same content.
+    :raises ValueError: If context is negative."""
+    if context < 0:
+        msg = 'context must not be negative'
+        raise ValueError(msg)
+
+    if old_hash == new_hash:
+        return []
+
+    blocks = _libcaf.diff_lines(str(objects_dir), old_hash or '', new_hash or '')
+    if not blocks:
+        return []
+
+    with ExitStack() as stack:
+        old_lines = _open_line_sequence(stack, objects_dir, old_hash) if old_hash else []
+        new_lines = _open_line_sequence(stack, objects_dir, new_hash) if new_hash else []
+
+        return [_build_hunk(group, old_lines, new_lines, context) for group in _group_blocks(blocks, context)]
+
+
+def count_changed_lines(objects_dir: str | Path, old_hash: str | None, new_hash: str | None,
+                        cache: ObjectCache | None = None) -> tuple[int, int] | None:
+    """Count the lines added and removed between two blobs, without building any diff text.
+
+    Lines are counted natively over memory-mapped blobs: by newline scanning when one side is missing, and by
+    the line-hash diff otherwise. Since blobs are immutable, the counts are cached per pair of hashes.
+
+    :param objects_dir: The objects directory to read the blobs from.
+    :param old_hash: The hash of the old blob, or None if the file was added.
+    :param new_hash: The hash of the new blob, or None if the file was removed.
+    :param cache: The cache of counts, or None to always compute them.
+    :return: The (added, removed) line counts, or None if either blob is binary."""
+    if old_hash == new_hash:
+        return 0, 0
+
+    key = f'{old_hash or _NO_BLOB}{new_hash or _NO_BLOB}'
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None and len(cached) == _STATS.size:
+        added, removed = _STATS.unpack(cached)
+    else:
+        if is_binary_blob(objects_dir, old_hash) or is_binary_blob(objects_dir, new_hash):
+            added, removed = -1, -1
+        else:
+            added, removed = _libcaf.diff_stat(str(objects_dir), old_hash or '', new_hash or '')
+        if cache is not None:
+            cache.put(key, _STATS.pack(added, removed))
+
+    return None if added < 0 else (added, removed)
+
+
+def _group_blocks(blocks: Sequence[tuple[int, int, int, int]],
+                  context: int) -> list[list[tuple[int, int, int, int]]]:
+    """Group change blocks whose context would overlap or touch into the same hunk."""
+    groups = [[blocks[0]]]
+    for block in blocks[1:]:
+        previous_old_start, previous_old_count, _, _ = groups[-1][-1]
+        if block[0] - (previous_old_start + previous_old_count) <= 2 * context:
+            groups[-1].append(block)
+        else:
+            groups.append([block])
+
+    return groups
+
+
+def _build_hunk(group: Sequence[tuple[int, int, int, int]], old_lines: Sequence[bytes],
+                new_lines: Sequence[bytes], context: int) -> Hunk:
+    first_old, _, first_new, _ = group[0]
+    last_old, last_old_count, last_new, last_new_count = group[-1]
+
+    leading = min(context, first_old)
+    trailing = min(context, len(old_lines) - (last_old + last_old_count))
+    old_start = first_old - leading
+    new_start = first_new - leading
+
+    lines: list[tuple[str, bytes]] = []
+    old_position = old_start
+    for old_index, old_count, new_index, new_count in group:
+        lines.extend((' ', old_lines[i]) for i in range(old_position, old_index))
+        lines.extend(('-', old_lines[i]) for i in range(old_index, old_index + old_count))
+        lines.extend(('+', new_lines[i]) for i in range(new_index, new_index + new_count))
+        old_position = old_index + old_count
+    lines.extend((' ', old_lines[i]) for i in range(old_position, old_position + trailing))
+
+    old_end = last_old + last_old_count + trailing
+    new_end = last_new + last_new_count + trailing
+    return Hunk(old_start + 1, old_end - old_start, new_start + 1, new_end - new_start, lines)
+
+
+def format_hunks(hunks: Sequence[Hunk]) -> str:
+    """Render hunks as unified diff text, without file headers.
+
+    Binary-safe: contents are decoded as UTF-8 with invalid bytes replaced.
+
+    :param hunks: The hunks to render.
+    :return: The rendered text."""
+    out: list[str] = []
+    for hunk in hunks:
+        out.append(f'{hunk.header()}\n')
+        for prefix, content in hunk.lines:
+            text = content.decode('utf-8', errors='replace')
+            if text.endswith('\n'):
+                out.append(f'{prefix}{text}')
+            else:
+                out.append(f'{prefix}{text}\n\\ No newline at end of file\n')
+
+    return ''.join(out)
@@ -1,19 +1,27 @@
 """Merge helpers for libcaf."""
 
-from array import array
-from collections.abc import Sequence
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
 from contextlib import ExitStack
+import hashlib
 import mmap
+import multiprocessing
 import os
-import tempfile
+import sys
 from dataclasses import dataclass
+from typing import TypeVar
 from pathlib import Path
 
+import _libcaf
 from merge3 import Merge3
 
 from . import Tree, TreeRecord, TreeRecordType
-from .plumbing import (hash_object, load_commit, load_tree,
-                       open_content_for_reading, save_file_content, save_tree)
+from .cache import ObjectCache, attribute_table
+from .commit_graph import CommitGraph
+from .constants import (HASH_LENGTH, LINE_TABLE_MIN_CACHED_SIZE, MERGE_CACHE_MAX_SIZE, NATIVE_MERGE_MIN_SIZE,
+                        PARALLEL_MERGE_MIN_BLOBS, PARALLEL_WALK_MIN_SIZE, TREE_RECORD_BATCH_SIZE)
+from .plumbing import (hash_object, hash_string, load_commit, open_content_for_reading, open_object_writer,
+                       open_tree_writer, stream_tree_records)
 from .ref import HashRef
 
 
@@ -25,72 +33,115 @@ class MergeError(Exception):
 class MergeResult:
     """Represents the output of a 3-way merge."""
 
-    tree_hash: HashRef
+    # None for a dry run, which saves no tree
+    tree_hash: HashRef | None
     conflicts: list[str]
 
 
-def is_binary_blob(objects_dir: str | Path, blob_hash: str | None, sample_size: int = 8192) -> bool:
-    """Detect if a blob contains binary data using multiple heuristics."""
+@dataclass
+class FastForwardResult(MergeResult):
+    """The merge of a commit into one of its descendants: their commit already contains ours, so the ref being merged
+    into can simply be moved to it."""
+
+    commit_hash: HashRef
+
+
+@dataclass
+class UpToDateResult(MergeResult):
+    """The merge of a commit that our commit already contains, or of our commit itself: there is nothing to do."""
+
+    commit_hash: HashRef
+
+
+# Tables of line start offsets, as native unsigned 64-bit integers followed by the size of the blob
+LINES_CACHE = 'lines'
+_OFFSET_SIZE = 8
+# Results of content merges, keyed by the merge key of their inputs: the merged blob hash and b'1' if it conflicts
+MERGES_CACHE = 'merges'
+# Results of tree merges, keyed likewise: the merged tree hash and its conflicting paths, relative to the tree,
+# each preceded by a null byte
+TREE_MERGES_CACHE = 'tree-merges'
+# Recorded resolutions of conflict hunks, keyed by the conflict key of the hunk: the text that replaces it
+RESOLUTIONS_CACHE = 'resolutions'
+_CONFLICT_START = b'<<<<<<< ours\n'
+_CONFLICT_SEPARATOR = b'=======\n'
+_CONFLICT_END = b'>>>>>>> theirs\n'
+_EMPTY_LINE_TABLE = bytes(_OFFSET_SIZE)
+# Flags of blobs in the attribute table
+_ATTRIBUTE_BINARY = 0x01
+_BINARY_SAMPLE_SIZE = 8192
+# Every byte except control characters other than tab, LF and CR, and DEL: deleting these leaves the non-text bytes
+_TEXT_BYTES = bytes(byte for byte in range(256) if (byte >= 32 or byte in (9, 10, 13)) and byte != 127)
+
+
+def is_binary_blob(objects_dir: str | Path, blob_hash: str | None, sample_size: int = _BINARY_SAMPLE_SIZE, *,
+                   write_cache: bool = True) -> bool:
+    """Detect if a blob contains binary data using multiple heuristics.
+
+    Since blobs are immutable, the result for the default sample size is kept in the attribute table of the
+    objects directory, so a blob is only sniffed once. Without write_cache, the table is only read."""
     if blob_hash is None:
         return False
 
+    table = attribute_table(objects_dir) if sample_size == _BINARY_SAMPLE_SIZE else None
+    flags = table.get(blob_hash) if table is not None else None
+    if flags is not None:
+        return bool(flags & _ATTRIBUTE_BINARY)
+
     try:
         with open_content_for_reading(objects_dir, blob_hash) as handle:
-            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mmapped:
-                size = min(sample_size, len(mmapped))
-                if size == 0:
-                    return False
-                sample = mmapped[:size]
-
-                # Check for null bytes (strong indicator of binary)
-                if b'\x00' in sample:
-                    return True
-
-                # Count non-text bytes (control characters except whitespace)
-                non_text_count = 0
-                for byte in sample:
-                    # Allow common text characters: printable ASCII, newline, tab, carriage return
-                    if byte < 32 and byte not in (9, 10, 13):  # tab, LF, CR
-                        non_text_count += 1
-                    elif byte == 127:  # DEL character
-                        non_text_count += 1
-
-                # If more than 30% of bytes are non-text, consider it binary
-                if non_text_count > size * 0.3:
-                    return True
-
-                return False
+            sample = handle.read(sample_size)
     except Exception:
         return False
 
+    binary = _is_binary_sample(sample)
+    if table is not None and write_cache:
+        table.put(blob_hash, _ATTRIBUTE_BINARY if binary else 0)
+    return binary
+
+
+def _is_binary_sample(sample: bytes) -> bool:
+    # Check for null bytes (strong indicator of binary)
+    if b'\x00' in sample:
+        return True
+
+    # Count non-text bytes (control characters except whitespace, and DEL) by deleting all the others natively.
+    # If more than 30% of bytes are non-text, consider it binary.
+    non_text_count = len(sample.translate(None, _TEXT_BYTES))
+    return non_text_count > len(sample) * 0.3
+
 
 class MmapLineSequence(Sequence[bytes]):
     """List-like random-access view over the lines of a memory-mapped file."""
 
-    def __init__(self, mmapped: mmap.mmap) -> None:
+    def __init__(self, mmapped: mmap.mmap, line_offsets: bytes | None = None) -> None:
+        """Create a view over the lines of a memory map, indexed later by build_line_index unless a table is given.
+
+        :param mmapped: The memory-mapped content.
+        :param line_offsets: A table returned by build_line_index for the same content, e.g. from the cache."""
         self._mmapped = mmapped
         self._size = len(mmapped)
-        self._line_offsets = array('Q')
-
-    def build_line_index(self) -> None:
-        """Scan the entire mmapped region to record the byte offset of each line start."""
-        self._line_offsets.append(0)
-        search_start = 0
-        while True:
-            newline_pos = self._mmapped.find(b'\n', search_start)
-            if newline_pos < 0:
-                break
-            line_start = newline_pos + 1
-            if line_start < self._size:
-                self._line_offsets.append(line_start)
-            search_start = line_start
+        self._line_offsets = memoryview(line_offsets if line_offsets is not None else _EMPTY_LINE_TABLE).cast('Q')
+
+    def build_line_index(self) -> bytes:
+        """Natively scan the entire mmapped region to record the byte offset of each line start, followed by the
+        size of the region.
+
+        :return: The packed table of offsets, which can be cached and given back to the constructor."""
+        line_offsets = _libcaf.line_offsets(self._mmapped)
+        self._line_offsets = memoryview(line_offsets).cast('Q')
+        return line_offsets
 
     def __len__(self) -> int:
-        return len(self._line_offsets)
+        return max(len(self._line_offsets) - 1, 0)
 
     def __getitem__(self, index: int | slice) -> bytes | list[bytes]:
         if isinstance(index, slice):
-            return [self[i] for i in range(*index.indices(len(self)))]
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            offsets = self._line_offsets[start:max(stop, start) + 1]
+            return [self._mmapped[line_start:line_end] for line_start, line_end in zip(offsets, offsets[1:])]
 
         line_count = len(self)
         if index < 0:
@@ -98,24 +149,60 @@ class MmapLineSequence(Sequence[bytes]):
         if index < 0 or index >= line_count:
             raise IndexError('line index out of range')
 
-        start = self._line_offsets[index]
-        end = self._line_offsets[index + 1] if index + 1 < line_count else self._size
-        return self._mmapped[start:end]
+        return self._mmapped[self._line_offsets[index]:self._line_offsets[index + 1]]
 
-def _open_line_sequence(stack: ExitStack, objects_dir: str | Path, blob_hash: str) -> MmapLineSequence | list:
-    """Open a blob from the object store and return an indexed line sequence."""
+    def __iter__(self) -> Iterator[bytes]:
+        offsets = self._line_offsets
+        for line_start, line_end in zip(offsets, offsets[1:]):
+            yield self._mmapped[line_start:line_end]
+
+
+def _open_line_sequence(stack: ExitStack, objects_dir: str | Path, blob_hash: str,
+                        write_cache: bool = True) -> MmapLineSequence | list:
+    """Open a blob from the object store and return an indexed line sequence.
+
+    The line tables of blobs of at least LINE_TABLE_MIN_CACHED_SIZE bytes are kept in the lines cache; smaller
+    ones are indexed faster than a cache entry can be read. Without write_cache, the cache is only read."""
     handle = stack.enter_context(open_content_for_reading(objects_dir, blob_hash))
     size = os.fstat(handle.fileno()).st_size
     if size == 0:
         return []
     mmapped = stack.enter_context(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+
+    cache = ObjectCache(objects_dir, LINES_CACHE) if size >= LINE_TABLE_MIN_CACHED_SIZE else None
+    line_offsets = cache.get(blob_hash) if cache is not None else None
+    if line_offsets is not None and _is_line_table(line_offsets, size):
+        return MmapLineSequence(mmapped, line_offsets)
+
     seq = MmapLineSequence(mmapped)
-    seq.build_line_index()
+    line_offsets = seq.build_line_index()
+    if cache is not None and write_cache:
+        cache.put(blob_hash, line_offsets)
     return seq
 
 
-def merge_blob_text(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None, theirs_hash: str | None) -> tuple[HashRef, bool]:
-    """Merge three versions of a blob using merge3."""
+def _is_line_table(line_offsets: bytes, size: int) -> bool:
+    # A table ends with the size of its content, so a truncated entry is never mistaken for a valid one
+    return (len(line_offsets) >= 2 * _OFFSET_SIZE and len(line_offsets) % _OFFSET_SIZE == 0
+            and int.from_bytes(line_offsets[-_OFFSET_SIZE:], sys.byteorder) == size)
+
+
+def _blob_size(objects_dir: str | Path, blob_hash: str | None) -> int:
+    if not blob_hash:
+        return 0
+    with open_content_for_reading(objects_dir, blob_hash) as handle:
+        return os.fstat(handle.fileno()).st_size
+
+
+def _merge_size(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None, theirs_hash: str | None) -> int:
+    return sum(_blob_size(objects_dir, blob_hash) for blob_hash in (base_hash, ours_hash, theirs_hash))
+
+
+def merge_blob_text(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None,
+                    theirs_hash: str | None) -> tuple[HashRef, bool]:
+    """Merge three versions of a blob using merge3, streaming the result into the object store.
+
+    A conflict hunk with a recorded resolution (see record_resolution) is replaced by it and does not conflict."""
     with ExitStack() as stack:
         if base_hash:
             base_lines = _open_line_sequence(stack, objects_dir, base_hash)
@@ -131,25 +218,39 @@ def merge_blob_text(objects_dir: str | Path, base_hash: str | None, ours_hash: s
             theirs_lines = []
 
         merger = Merge3(base_lines, ours_lines, theirs_lines)
+        resolutions = ObjectCache(objects_dir, RESOLUTIONS_CACHE)
         conflict = False
 
-        with tempfile.NamedTemporaryFile(mode='wb') as tmp_file:
+        with open_object_writer(objects_dir) as writer:
             for group in merger.merge_groups():
                 if group[0] == 'conflict':
+                    ours, theirs = b''.join(group[2]), b''.join(group[3])
+                    resolution = resolutions.get(_conflict_key(ours, theirs))
+                    if resolution is not None:
+                        writer.write(resolution)
+                        continue
                     conflict = True
-                    tmp_file.write(b'<<<<<<< ours\n')
-                    tmp_file.writelines(group[2])  # a_lines (ours)
-                    tmp_file.write(b'=======\n')
-                    tmp_file.writelines(group[3])  # b_lines (theirs)
-                    tmp_file.write(b'>>>>>>> theirs\n')
+                    writer.write(b''.join([_CONFLICT_START, ours, _CONFLICT_SEPARATOR, theirs, _CONFLICT_END]))
                 else:
-                    tmp_file.writelines(group[1])
-            tmp_file.flush()
-            blob = save_file_content(objects_dir, tmp_file.name)
-            return HashRef(blob.hash), conflict
+                    writer.write(b''.join(group[1]))
 
+            # Publishing takes no lock, so it is safe even if the result is one of the inputs, still open here
+            return HashRef(writer.commit()), conflict
 
-def merge_blob_binary(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None, theirs_hash: str | None) -> tuple[HashRef, bool]:
+
+def merge_blob_text_native(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None,
+                           theirs_hash: str | None) -> tuple[HashRef, bool]:
+    """Merge three versions of a blob with the native diff3, which writes the same conflict markers as merge3.
+
+    The sides are matched against the base over their memory maps as merge3's sequence matcher does, so the
+    result is the same as merge_blob_text's, without reading any line into Python, and it is streamed into the
+    object store. Recorded resolutions are not applied (see merge_blob)."""
+    blob_hash, conflict = _libcaf.merge_text(str(objects_dir), base_hash or '', ours_hash or '', theirs_hash or '')
+    return HashRef(blob_hash), conflict
+
+
+def merge_blob_binary(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None,
+                      theirs_hash: str | None) -> tuple[HashRef, bool]:
     """Merge binary blobs by selecting a version or marking as conflict."""
     if ours_hash == theirs_hash:
         return HashRef(ours_hash), False
@@ -169,12 +270,284 @@ def merge_blob_binary(objects_dir: str | Path, base_hash: str | None, ours_hash:
     raise MergeError(msg)
 
 
-def merge_blob(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None, theirs_hash: str | None) -> tuple[HashRef, bool]:
-    """Merge two blob versions using their common ancestor."""
+def merge_blob(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None,
+               theirs_hash: str | None) -> tuple[HashRef, bool]:
+    """Merge two blob versions using their common ancestor.
+
+    Text is merged natively once the three versions together reach NATIVE_MERGE_MIN_SIZE bytes, and with merge3
+    below that; both give the same result, the native merge only being faster. Recorded resolutions replace the
+    conflict hunks they resolve either way. Content merges are remembered in the merges cache, so merging the same
+    three versions again only looks the result up."""
     if is_binary_blob(objects_dir, ours_hash) or is_binary_blob(objects_dir, theirs_hash):
         return merge_blob_binary(objects_dir, base_hash, ours_hash, theirs_hash)
 
-    return merge_blob_text(objects_dir, base_hash, ours_hash, theirs_hash)
+    cache = ObjectCache(objects_dir, MERGES_CACHE, MERGE_CACHE_MAX_SIZE)
+    key = _merge_key(base_hash, ours_hash, theirs_hash)
+    cached = cache.get(key)
+    if cached is not None and len(cached) == HASH_LENGTH + 1:
+        merged_hash = cached[:HASH_LENGTH].decode()
+        if _object_exists(objects_dir, merged_hash):
+            return HashRef(merged_hash), cached[HASH_LENGTH:] == b'1'
+
+    if _merge_size(objects_dir, base_hash, ours_hash, theirs_hash) >= NATIVE_MERGE_MIN_SIZE:
+        merged_hash, conflict = merge_blob_text_native(objects_dir, base_hash, ours_hash, theirs_hash)
+        if conflict:
+            merged_hash, conflict = _apply_resolutions(objects_dir, merged_hash)
+    else:
+        merged_hash, conflict = merge_blob_text(objects_dir, base_hash, ours_hash, theirs_hash)
+
+    cache.put(key, merged_hash.encode() + (b'1' if conflict else b'0'))
+    return merged_hash, conflict
+
+
+def blob_merge_conflicts(objects_dir: str | Path, base_hash: str | None, ours_hash: str | None,
+                         theirs_hash: str | None) -> bool:
+    """Tell whether merge_blob would report a conflict for three versions of a blob, without writing anything.
+
+    Text is aligned with the same engine merge_blob would use, but only the merge regions are computed. Conflict
+    regions with a recorded resolution do not count. The attribute table and the cache of line tables are read
+    but not added to, so a dry run leaves the repository as it was."""
+    if (is_binary_blob(objects_dir, ours_hash, write_cache=False)
+            or is_binary_blob(objects_dir, theirs_hash, write_cache=False)):
+        return merge_blob_binary(objects_dir, base_hash, ours_hash, theirs_hash)[1]
+
+    cache = ObjectCache(objects_dir, MERGES_CACHE, MERGE_CACHE_MAX_SIZE)
+    cached = cache.get(_merge_key(base_hash, ours_hash, theirs_hash))
+    if cached is not None and len(cached) == HASH_LENGTH + 1:
+        return cached[HASH_LENGTH:] == b'1'
+
+    resolutions = ObjectCache(objects_dir, RESOLUTIONS_CACHE)
+    if _merge_size(objects_dir, base_hash, ours_hash, theirs_hash) >= NATIVE_MERGE_MIN_SIZE:
+        regions = _libcaf.merge_regions(str(objects_dir), base_hash or '', ours_hash or '', theirs_hash or '')
+        conflict_regions = [(region.ours_start, region.ours_end, region.theirs_start, region.theirs_end)
+                            for region in regions if region.kind == _libcaf.MergeRegion.Kind.CONFLICT]
+        if not conflict_regions or not resolutions.cache_dir.exists():
+            return bool(conflict_regions)
+
+        # The blobs are opened only now: merge_regions has closed them
+        with ExitStack() as stack:
+            ours_lines, theirs_lines = (_open_line_sequence(stack, objects_dir, blob_hash, write_cache=False)
+                                        if blob_hash else [] for blob_hash in (ours_hash, theirs_hash))
+            return any(_is_unresolved(resolutions, ours_lines[ours_start:ours_end],
+                                      theirs_lines[theirs_start:theirs_end])
+                       for ours_start, ours_end, theirs_start, theirs_end in conflict_regions)
+
+    with ExitStack() as stack:
+        base_lines, ours_lines, theirs_lines = (
+            _open_line_sequence(stack, objects_dir, blob_hash, write_cache=False) if blob_hash else []
+            for blob_hash in (base_hash, ours_hash, theirs_hash))
+        merger = Merge3(base_lines, ours_lines, theirs_lines)
+        return any(region[0] == 'conflict'
+                   and _is_unresolved(resolutions, ours_lines[region[3]:region[4]], theirs_lines[region[5]:region[6]])
+                   for region in merger.merge_regions())
+
+
+def _conflict_key(ours: bytes, theirs: bytes) -> str:
+    """Get the key of a conflict hunk in the resolutions cache: the hash of its two sides, normalized into sorted
+    order, so a conflict is resolved the same way whichever branch is merged into the other."""
+    first, second = sorted((ours, theirs))
+    return hashlib.sha1(first + b'\0' + second + b'\0').hexdigest()
+
+
+def _is_unresolved(resolutions: ObjectCache, ours_lines: Sequence[bytes], theirs_lines: Sequence[bytes]) -> bool:
+    return resolutions.get(_conflict_key(b''.join(ours_lines), b''.join(theirs_lines))) is None
+
+
+def _conflict_segments(lines: Iterable[bytes]) -> Iterator[list[bytes] | tuple[list[bytes], list[bytes]]]:
+    """Split merged text into the lines between conflict hunks and the hunks, as the lines of our and their side.
+
+    Text and hunks alternate, starting and ending with text, which may be empty. A hunk missing its separator or
+    end marker is left as text."""
+    text: list[bytes] = []
+    lines = iter(lines)
+    for line in lines:
+        if line != _CONFLICT_START:
+            text.append(line)
+            continue
+
+        ours: list[bytes] = []
+        theirs: list[bytes] = []
+        side, hunk = ours, [line]
+        for line in lines:
+            hunk.append(line)
+            if line == _CONFLICT_SEPARATOR and side is ours:
+                side = theirs
+            elif line == _CONFLICT_END and side is theirs:
+                break
+            else:
+                side.append(line)
+        else:
+            text.extend(hunk)
+            break
+
+        yield text
+        yield ours, theirs
+        text = []
+
+    yield text
+
+
+def _apply_resolutions(objects_dir: str | Path, merged_hash: HashRef) -> tuple[HashRef, bool]:
+    """Replace the conflict hunks of a merged blob that have a recorded resolution.
+
+    :return: The hash of the blob with the known hunks resolved, the same blob if none was, and whether any
+        conflict is left."""
+    resolutions = ObjectCache(objects_dir, RESOLUTIONS_CACHE)
+    if not resolutions.cache_dir.exists():
+        return merged_hash, True
+
+    with ExitStack() as stack:
+        lines = _open_line_sequence(stack, objects_dir, merged_hash)
+        writer = stack.enter_context(open_object_writer(objects_dir))
+        conflict = resolved = False
+        for segment in _conflict_segments(lines):
+            if isinstance(segment, list):
+                writer.write(b''.join(segment))
+                continue
+
+            ours, theirs = (b''.join(side) for side in segment)
+            resolution = resolutions.get(_conflict_key(ours, theirs))
+            if resolution is None:
+                conflict = True
+                writer.write(b''.join([_CONFLICT_START, ours, _CONFLICT_SEPARATOR, theirs, _CONFLICT_END]))
+            else:
+                resolved = True
+                writer.write(resolution)
+
+        if not resolved:
+            return merged_hash, True
+        return HashRef(writer.commit()), conflict
+
+
+def record_resolution(objects_dir: str | Path, conflicted_hash: str, resolved: str | Path) -> int:
+    """Record how the conflicts of a merged blob were resolved, so later merges resolve them the same way.
+
+    The resolved content must keep the text between the conflict hunks: what replaced each hunk is its
+    resolution, kept in the resolutions cache under the hunk's conflict key. Cached merge results that conflicted
+    are evicted, since the resolutions may now apply to them. Nothing is written unless the resolved content
+    matches.
+
+    :param objects_dir: The objects directory.
+    :param conflicted_hash: The hash of a merged blob with conflict markers.
+    :param resolved: The hash of the same blob with its conflicts resolved, or the path of a file with that
+        content, read without saving it to the object store.
+    :return: The number of resolutions recorded.
+    :raises MergeError: If the blob has no conflicts, or the resolved content does not match it or does not show
+        unambiguously what replaced each hunk."""
+    with ExitStack() as stack:
+        segments = list(_conflict_segments(_open_line_sequence(stack, objects_dir, conflicted_hash)))
+        if len(segments) == 1:
+            msg = 'The blob has no conflicts to resolve'
+            raise MergeError(msg)
+        if resolved == conflicted_hash:
+            msg = 'The conflicts are not resolved'
+            raise MergeError(msg)
+
+        if isinstance(resolved, Path):
+            resolved_lines = _open_file_lines(stack, resolved)
+        else:
+            resolved_lines = _open_line_sequence(stack, objects_dir, resolved)
+        if _CONFLICT_START in resolved_lines:
+            msg = 'The resolved blob still has conflict markers'
+            raise MergeError(msg)
+        hunk_resolutions = _match_resolutions(segments[::2], resolved_lines)
+
+    resolutions = ObjectCache(objects_dir, RESOLUTIONS_CACHE)
+    for (ours, theirs), resolution in zip(segments[1::2], hunk_resolutions):
+        resolutions.put(_conflict_key(b''.join(ours), b''.join(theirs)), resolution)
+
+    ObjectCache(objects_dir, MERGES_CACHE).evict(lambda entry: entry.endswith(b'1'))
+    ObjectCache(objects_dir, TREE_MERGES_CACHE).evict(lambda entry: b'\0' in entry)
+    return len(hunk_resolutions)
+
+
+def _open_file_lines(stack: ExitStack, path: Path) -> MmapLineSequence | list:
+    """Open a file outside the object store and return an indexed line sequence."""
+    handle = stack.enter_context(path.open('rb'))
+    if os.fstat(handle.fileno()).st_size == 0:
+        return []
+    seq = MmapLineSequence(stack.enter_context(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)))
+    seq.build_line_index()
+    return seq
+
+
+def _match_resolutions(texts: Sequence[list[bytes]], resolved_lines: Sequence[bytes]) -> list[bytes]:
+    """Find what replaced each conflict hunk in the resolved lines, given the text around the hunks, in order.
+
+    The text between hunks is matched both at its first and at its last possible place. If the two disagree,
+    for instance because the text between two hunks is empty, or also occurs in a resolution, more than one
+    split of the resolved lines fits and the resolutions cannot be told apart."""
+    head, tail = texts[0], texts[-1]
+    end = len(resolved_lines) - len(tail)
+    if (end < len(head) or resolved_lines[:len(head)] != head
+            or resolved_lines[end:len(resolved_lines)] != tail):
+        msg = 'The resolved blob does not match the conflicted one'
+        raise MergeError(msg)
+
+    first_matches = []
+    position = len(head)
+    for text in texts[1:-1]:
+        found = _find_lines(resolved_lines, text, range(position, end - len(text) + 1))
+        if found is None:
+            msg = 'The resolved blob does not match the conflicted one'
+            raise MergeError(msg)
+        first_matches.append(found)
+        position = found + len(text)
+
+    last_matches = []
+    position = end
+    for text in reversed(texts[1:-1]):
+        found = _find_lines(resolved_lines, text, range(position - len(text), len(head) - 1, -1))
+        last_matches.append(found)
+        position = found
+    if first_matches != last_matches[::-1]:
+        msg = 'The resolved blob does not show where each resolution ends: the text between the hunks is ambiguous'
+        raise MergeError(msg)
+
+    starts = [len(head), *(found + len(text) for found, text in zip(first_matches, texts[1:-1]))]
+    ends = [*first_matches, end]
+    return [b''.join(resolved_lines[start:stop]) for start, stop in zip(starts, ends)]
+
+
+def _find_lines(lines: Sequence[bytes], needle: list[bytes], positions: range) -> int | None:
+    """Find the first of the positions where the lines start with the needle."""
+    for index in positions:
+        if not needle or (lines[index] == needle[0] and lines[index:index + len(needle)] == needle):
+            return index
+    return None
+
+
+def _merge_key(base_hash: str | None, ours_hash: str | None, theirs_hash: str | None) -> str:
+    """Get the key of a three-way merge in the merge caches: the hash of its three input hashes, in order."""
+    return hash_string(f'{base_hash or ""} {ours_hash or ""} {theirs_hash or ""}')
+
+
+def _object_exists(objects_dir: str | Path, object_hash: str) -> bool:
+    # A cached merge result may have been deleted since, as garbage, in which case the merge runs again
+    return (Path(objects_dir) / object_hash[:2] / object_hash).exists()
+
+
+def _object_size(objects_dir: str | Path, object_hash: str) -> int:
+    # Read without opening the object, which would lock it
+    try:
+        return (Path(objects_dir) / object_hash[:2] / object_hash).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _cached_tree_merge(objects_dir: str | Path, key: str) -> tuple[HashRef, list[str]] | None:
+    cached = ObjectCache(objects_dir, TREE_MERGES_CACHE, MERGE_CACHE_MAX_SIZE).get(key)
+    if cached is None or len(cached) < HASH_LENGTH:
+        return None
+
+    merged_hash, *conflicts = cached.decode('utf-8', errors='surrogateescape').split('\0')
+    if len(merged_hash) != HASH_LENGTH or not _object_exists(objects_dir, merged_hash):
+        return None
+    return HashRef(merged_hash), conflicts
+
+
+def _join_path(path_prefix: str, path: str) -> str:
+    return str(Path(path_prefix) / path) if path_prefix else path
 
 
 def _records_equal(a: TreeRecord | None, b: TreeRecord | None) -> bool:
@@ -183,73 +556,360 @@ def _records_equal(a: TreeRecord | None, b: TreeRecord | None) -> bool:
     return a == b
 
 
-def merge_trees_core(objects_dir: str | Path, base_tree: Tree | None, ours_tree: Tree | None, theirs_tree: Tree | None, path_prefix: str, conflicts: list[str]) -> HashRef:
-    """Recursively merge three trees using 3-way merge logic."""
-    base_records = base_tree.records if base_tree else {}
-    ours_records = ours_tree.records if ours_tree else {}
-    theirs_records = theirs_tree.records if theirs_tree else {}
+# A tree to merge: a loaded Tree, the hash of a stored tree, streamed from the object store, or None if absent
+TreeSource = Tree | str | None
 
-    all_names = sorted(set(base_records) | set(ours_records) | set(theirs_records))
-    merged_records: dict[str, TreeRecord] = {}
 
-    for name in all_names:
-        base = base_records.get(name)
-        ours = ours_records.get(name)
-        theirs = theirs_records.get(name)
-        path = str(Path(path_prefix) / name) if path_prefix else name
+def _tree_source_hash(tree: TreeSource) -> str | None:
+    return hash_object(tree) if isinstance(tree, Tree) else tree
 
-        if _records_equal(ours, theirs):
-            if ours is not None:
-                merged_records[name] = ours
-            continue
 
-        if _records_equal(base, ours):
-            if theirs is not None:
-                merged_records[name] = theirs
-            continue
+def _tree_records(objects_dir: str | Path, tree: TreeSource) -> Iterator[TreeRecord]:
+    if tree is None:
+        return iter(())
+    if isinstance(tree, Tree):
+        # Records are kept in name order, as they are stored
+        return iter(tree.records.values())
+    return stream_tree_records(objects_dir, tree)
+
+
+def _join_records(objects_dir: str | Path,
+                  trees: Sequence[TreeSource]) -> Iterator[tuple[str, list[TreeRecord | None]]]:
+    """Merge-join the records of trees by name, yielding each name with the record of every tree, or None.
 
-        if _records_equal(base, theirs):
-            if ours is not None:
-                merged_records[name] = ours
+    Tree records are sorted by name, so only the next record of each tree is held at a time."""
+    streams = [_tree_records(objects_dir, tree) for tree in trees]
+    heads = [next(stream, None) for stream in streams]
+    names = [head.name if head is not None else None for head in heads]
+
+    while any(name is not None for name in names):
+        name = min(name for name in names if name is not None)
+        row: list[TreeRecord | None] = []
+        for i, stream in enumerate(streams):
+            if names[i] == name:
+                row.append(heads[i])
+                heads[i] = next(stream, None)
+                names[i] = heads[i].name if heads[i] is not None else None
+            else:
+                row.append(None)
+        yield name, row
+
+
+def _merged_record(base: TreeRecord | None, ours: TreeRecord | None, theirs: TreeRecord | None) -> TreeRecord | None:
+    """Get the record a merge keeps for a name when its content is not merged: the changed side if only one side
+    changed it, or ours (theirs if ours deleted it) if both did."""
+    if _records_equal(ours, theirs) or _records_equal(base, theirs):
+        return ours
+    if _records_equal(base, ours):
+        return theirs
+    return ours or theirs
+
+
+@dataclass
+class _PendingTree:
+    """A merged tree whose blob records are only known once the content merges below it are done.
+
+    Only the records decided by merges are kept: the others are merge-joined again from the three trees when the
+    merged tree is saved, so a merge never holds all the records of a tree in memory."""
+
+    trees: tuple[TreeSource, TreeSource, TreeSource]
+    # Hashes of the merged subtrees found in the tree merges cache, by name
+    merged_subtrees: dict[str, str]
+    subtrees: dict[str, '_PendingTree']
+    # Blobs to merge by content, by name, as indices into the list of blob merges
+    blob_merges: dict[str, int]
+    path: str
+    # Key of the merge in the tree merges cache, and the range of walked conflicts below this tree
+    merge_key: str
+    conflicts_start: int = 0
+    conflicts_end: int = 0
+
+
+BlobMergeKey = tuple[str | None, str, str]
+# A walked conflict: its path and the blob merge that decides it, or None if it is a conflict anyway
+WalkedConflict = tuple[str, int | None]
+T = TypeVar('T')
+
+
+class _WorkerPool:
+    """The worker processes of a merge, started on first use, so that merges too small to split never start any.
+
+    Processes rather than threads run the work, since merge3 and the walks hold the GIL. Workers share nothing
+    with the merge but the object store, and objects are locked while open across processes just as across
+    threads."""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    def __enter__(self) -> '_WorkerPool':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # A fork server, since forking a process that runs threads can deadlock the child
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('forkserver'))
+        return self._executor
+
+
+def merge_trees_core(objects_dir: str | Path, base_tree: TreeSource, ours_tree: TreeSource, theirs_tree: TreeSource,
+                     path_prefix: str, conflicts: list[str], workers: int | None = None, dry_run: bool = False,
+                     stop_on_conflict: bool = False) -> HashRef | None:
+    """Merge three trees using 3-way merge logic.
+
+    Each tree is a loaded Tree, or the hash of a stored tree. Stored trees are never loaded whole: the records of
+    the three trees are streamed from the object store in name order and merge-joined, and merged trees are
+    written a batch of records at a time, so a merge of huge flat directories runs in memory bounded by the
+    number of changed paths rather than the size of the trees.
+
+    The trees are walked first, collecting the blobs that need a content merge. Those then run, and the merged
+    trees are saved bottom-up. With more than one worker (one per CPU by default), big merges run in a pool of
+    worker processes: the top-level subtrees are walked in parallel once they add up to PARALLEL_WALK_MIN_SIZE
+    bytes of tree objects, and the content merges run in parallel once there are PARALLEL_MERGE_MIN_BLOBS of
+    them. Identical blob merges run once, and conflicts are reported in path order however the work is
+    scheduled, so the result is deterministic.
+
+    The result of every tree merge is remembered in the tree merges cache, so merging the same trees again, or
+    subtrees already merged elsewhere, only looks the results up. Both merge caches are pruned after a merge
+    that added to them.
+
+    A dry run only finds the conflicts: nothing is saved and None is returned. It can also stop at the first
+    conflict in path order, which is then the only one reported."""
+    key = _merge_key(*(_tree_source_hash(tree) for tree in (base_tree, ours_tree, theirs_tree)))
+    cached = _cached_tree_merge(objects_dir, key)
+    if cached is not None:
+        merged_hash, tree_conflicts = cached
+        if stop_on_conflict:
+            tree_conflicts = tree_conflicts[:1]
+        conflicts.extend(_join_path(path_prefix, path) for path in tree_conflicts)
+        return None if dry_run else merged_hash
+
+    with _WorkerPool(workers or os.cpu_count() or 1) as pool:
+        blob_merges: dict[BlobMergeKey, int] = {}
+        # Conflicting paths in walk order, each with the blob merge that decides it, or None if it is a conflict
+        # anyway
+        walked_conflicts: list[WalkedConflict] = []
+        pending = _walk_trees(objects_dir, base_tree, ours_tree, theirs_tree, path_prefix, key, blob_merges,
+                              walked_conflicts, stop_on_conflict, pool)
+
+        if dry_run:
+            conflicts.extend(_dry_run_conflicts(objects_dir, list(blob_merges), walked_conflicts, pool,
+                                                stop_on_conflict))
+            return None
+
+        results = _run_blob_merges(objects_dir, list(blob_merges), pool)
+
+    conflicts.extend(path for path, index in walked_conflicts if index is None or results[index][1])
+
+    merged_hash = _save_pending_tree(objects_dir, pending, results, walked_conflicts)
+
+    ObjectCache(objects_dir, MERGES_CACHE, MERGE_CACHE_MAX_SIZE).prune()
+    ObjectCache(objects_dir, TREE_MERGES_CACHE, MERGE_CACHE_MAX_SIZE).prune()
+    return merged_hash
+
+
+def _walk_trees(objects_dir: str | Path, base_tree: TreeSource, ours_tree: TreeSource, theirs_tree: TreeSource,
+                path_prefix: str, key: str, blob_merges: dict[BlobMergeKey, int], conflicts: list[WalkedConflict],
+                stop_on_conflict: bool = False, pool: _WorkerPool | None = None) -> _PendingTree:
+    """Recursively merge the records of three trees, deferring blob content merges to the caller.
+
+    Subtrees whose merge is in the tree merges cache are not walked again. When stopping on a conflict, the walk
+    ends at the first path that conflicts whatever its content merge. Otherwise, given a pool of several workers,
+    the subtrees of these trees are walked once all the other records are, in parallel if they are big enough,
+    and their blob merges and conflicts spliced in as if they had been walked in place."""
+    pending = _PendingTree((base_tree, ours_tree, theirs_tree), {}, {}, {}, path_prefix, key, len(conflicts))
+    # Subtrees left to walk, with the number of conflicts walked before them
+    deferred: list[tuple[int, str, tuple[str | None, str, str, str, str]]] = []
+    defer = pool is not None and pool.workers > 1 and not stop_on_conflict
+
+    for name, (base, ours, theirs) in _join_records(objects_dir, pending.trees):
+        if stop_on_conflict and conflicts and conflicts[-1][1] is None:
+            break
+
+        if _records_equal(ours, theirs) or _records_equal(base, ours) or _records_equal(base, theirs):
             continue
 
+        path = _join_path(path_prefix, name)
         if (ours is not None and theirs is not None
                 and ours.type == TreeRecordType.TREE
                 and theirs.type == TreeRecordType.TREE):
-            base_subtree = load_tree(objects_dir, base.hash) if (base is not None and base.type == TreeRecordType.TREE) else None
-            merged_hash = merge_trees_core(
-                objects_dir,
-                base_subtree,
-                load_tree(objects_dir, ours.hash),
-                load_tree(objects_dir, theirs.hash),
-                path,
-                conflicts,
-            )
-            merged_records[name] = TreeRecord(TreeRecordType.TREE, merged_hash, name)
+            base_subtree_hash = base.hash if (base is not None and base.type == TreeRecordType.TREE) else None
+            subtree_key = _merge_key(base_subtree_hash, ours.hash, theirs.hash)
+            cached = _cached_tree_merge(objects_dir, subtree_key)
+            if cached is not None:
+                merged_hash, subtree_conflicts = cached
+                pending.merged_subtrees[name] = merged_hash
+                conflicts.extend((_join_path(path, conflict), None) for conflict in subtree_conflicts)
+                continue
+
+            subtree = (base_subtree_hash, ours.hash, theirs.hash, path, subtree_key)
+            if defer:
+                deferred.append((len(conflicts), name, subtree))
+            else:
+                pending.subtrees[name] = _walk_trees(objects_dir, *subtree, blob_merges, conflicts,
+                                                     stop_on_conflict)
             continue
 
         if (ours is not None and theirs is not None
                 and ours.type == TreeRecordType.BLOB
                 and theirs.type == TreeRecordType.BLOB):
             base_hash = base.hash if (base is not None and base.type == TreeRecordType.BLOB) else None
-            merged_hash, conflict = merge_blob(objects_dir, base_hash, ours.hash, theirs.hash)
-            if conflict:
-                conflicts.append(path)
-            merged_records[name] = TreeRecord(TreeRecordType.BLOB, merged_hash, name)
+            index = blob_merges.setdefault((base_hash, ours.hash, theirs.hash), len(blob_merges))
+            pending.blob_merges[name] = index
+            conflicts.append((path, index))
             continue
 
-        chosen = ours or theirs
-        if chosen is not None:
-            merged_records[name] = chosen
-        conflicts.append(path)
+        conflicts.append((path, None))
+
+    if deferred:
+        _splice_subtree_walks(objects_dir, pending, deferred, blob_merges, conflicts, pool)
+
+    pending.conflicts_end = len(conflicts)
+    return pending
+
+
+def _splice_subtree_walks(objects_dir: str | Path, pending: _PendingTree,
+                          deferred: Sequence[tuple[int, str, tuple[str | None, str, str, str, str]]],
+                          blob_merges: dict[BlobMergeKey, int], conflicts: list[WalkedConflict],
+                          pool: _WorkerPool) -> None:
+    """Walk the deferred subtrees of a tree, in parallel if they are big enough, and splice their conflicts into
+    the walked ones where they belong in path order."""
+    if sum(_object_size(objects_dir, subtree[2]) for _, _, subtree in deferred) >= PARALLEL_WALK_MIN_SIZE:
+        executor = pool.executor()
+        walks: list[Future | None] = [executor.submit(_walk_subtree, objects_dir, *subtree)
+                                      for _, _, subtree in deferred]
+    else:
+        walks = [None] * len(deferred)
+
+    tree_conflicts = conflicts[pending.conflicts_start:]
+    del conflicts[pending.conflicts_start:]
+    spliced = 0
+    for (position, name, subtree), walk in zip(deferred, walks):
+        conflicts.extend(tree_conflicts[spliced:position - pending.conflicts_start])
+        spliced = position - pending.conflicts_start
+
+        subtree_pending, subtree_merges, subtree_conflicts = (walk.result() if walk is not None
+                                                              else _walk_subtree(objects_dir, *subtree))
+        indices = [blob_merges.setdefault(blob_merge, len(blob_merges)) for blob_merge in subtree_merges]
+        _rebase_pending(subtree_pending, indices, len(conflicts))
+        conflicts.extend((path, None if index is None else indices[index]) for path, index in subtree_conflicts)
+        pending.subtrees[name] = subtree_pending
+
+    conflicts.extend(tree_conflicts[spliced:])
+
+
+def _walk_subtree(objects_dir: str | Path, base_tree: str | None, ours_tree: str, theirs_tree: str, path: str,
+                  key: str) -> tuple[_PendingTree, list[BlobMergeKey], list[WalkedConflict]]:
+    """Walk a subtree on its own, numbering its blob merges and conflicts from zero."""
+    blob_merges: dict[BlobMergeKey, int] = {}
+    conflicts: list[WalkedConflict] = []
+    pending = _walk_trees(objects_dir, base_tree, ours_tree, theirs_tree, path, key, blob_merges, conflicts)
+    return pending, list(blob_merges), conflicts
+
+
+def _rebase_pending(pending: _PendingTree, indices: Sequence[int], conflicts_offset: int) -> None:
+    """Renumber the blob merges and conflicts of a subtree walked on its own to fit those of the whole merge."""
+    pending.blob_merges = {name: indices[index] for name, index in pending.blob_merges.items()}
+    pending.conflicts_start += conflicts_offset
+    pending.conflicts_end += conflicts_offset
+    for subtree in pending.subtrees.values():
+        _rebase_pending(subtree, indices, conflicts_offset)
+
+
+def _run_blob_merges(objects_dir: str | Path, blob_merges: Sequence[BlobMergeKey], pool: _WorkerPool,
+                     merge_function: Callable[..., T] = merge_blob) -> list[T]:
+    """Merge blobs by content.
+
+    The merges run merge_blob by default, or another function of the same arguments, e.g. blob_merge_conflicts.
+    They run in the worker processes of the pool if there are several and at least PARALLEL_MERGE_MIN_BLOBS
+    merges, dealt out in a few batches per worker to keep them busy however unequal the merges are. Readers
+    share the lock of an object, so merges reading a blob in common run concurrently."""
+    if pool.workers > 1 and len(blob_merges) >= PARALLEL_MERGE_MIN_BLOBS:
+        batch_count = min(4 * pool.workers, len(blob_merges))
+        batches = [blob_merges[start::batch_count] for start in range(batch_count)]
+        batch_results = list(pool.executor().map(_merge_blob_batch, [objects_dir] * batch_count,
+                                                 [merge_function] * batch_count, batches))
+        return [batch_results[position % batch_count][position // batch_count]
+                for position in range(len(blob_merges))]
+
+    return _merge_blob_batch(objects_dir, merge_function, blob_merges)
+
+
+def _merge_blob_batch(objects_dir: str | Path, merge_function: Callable[..., T],
+                      blob_merges: Sequence[BlobMergeKey]) -> list[T]:
+    return [merge_function(objects_dir, *blob_merge) for blob_merge in blob_merges]
+
+
+def _dry_run_conflicts(objects_dir: str | Path, blob_merges: Sequence[BlobMergeKey],
+                       walked_conflicts: Sequence[WalkedConflict], pool: _WorkerPool,
+                       stop_on_conflict: bool) -> list[str]:
+    """Find which of the walked conflicts are real, without writing any merge result.
+
+    When stopping on a conflict, the content merges are checked in path order, up to the first conflict."""
+    if not stop_on_conflict:
+        results = _run_blob_merges(objects_dir, blob_merges, pool, blob_merge_conflicts)
+        return [path for path, index in walked_conflicts if index is None or results[index]]
+
+    checked: dict[int, bool] = {}
+    for path, index in walked_conflicts:
+        if index is not None and index not in checked:
+            checked[index] = blob_merge_conflicts(objects_dir, *blob_merges[index])
+        if index is None or checked[index]:
+            return [path]
+    return []
+
+
+def _save_pending_tree(objects_dir: str | Path, pending: _PendingTree, results: Sequence[tuple[HashRef, bool]],
+                       walked_conflicts: Sequence[WalkedConflict]) -> HashRef:
+    """Save a merged tree and its subtrees once their blob merges are done, remembering each tree merge.
+
+    The records of the three trees are merge-joined again and the merged records written as they come."""
+    with open_tree_writer(objects_dir) as writer:
+        batch: list[TreeRecord] = []
+        for name, (base, ours, theirs) in _join_records(objects_dir, pending.trees):
+            if name in pending.subtrees:
+                subtree_hash = _save_pending_tree(objects_dir, pending.subtrees[name], results, walked_conflicts)
+                record = TreeRecord(TreeRecordType.TREE, subtree_hash, name)
+            elif name in pending.blob_merges:
+                record = TreeRecord(TreeRecordType.BLOB, results[pending.blob_merges[name]][0], name)
+            elif name in pending.merged_subtrees:
+                record = TreeRecord(TreeRecordType.TREE, pending.merged_subtrees[name], name)
+            else:
+                record = _merged_record(base, ours, theirs)
+
+            if record is not None:
+                batch.append(record)
+                if len(batch) == TREE_RECORD_BATCH_SIZE:
+                    writer.add(batch)
+                    batch = []
+
+        writer.add(batch)
+        merged_hash = HashRef(writer.commit())
+
+    prefix_length = len(pending.path) + 1 if pending.path else 0
+    tree_conflicts = [path[prefix_length:]
+                      for path, index in walked_conflicts[pending.conflicts_start:pending.conflicts_end]
+                      if index is None or results[index][1]]
+    entry = '\0'.join([merged_hash, *tree_conflicts]).encode('utf-8', errors='surrogateescape')
+    ObjectCache(objects_dir, TREE_MERGES_CACHE, MERGE_CACHE_MAX_SIZE).put(pending.merge_key, entry)
+
+    return merged_hash
+
+
+def find_common_ancestor_core(objects_dir: str, hash1: str, hash2: str,
+                              graph: CommitGraph | None = None) -> HashRef | None:
+    """Helper function to run the ancestor search algorithm independent of the Repository class.
+
+    When a commit-graph recording both commits is given, the merge base is found with its generation numbers and
+    jump pointers, in time logarithmic in the length of history. Otherwise both parent chains are walked."""
+    if graph is not None and hash1 in graph and hash2 in graph:
+        return graph.merge_base(hash1, hash2)
 
-    merged_tree = Tree(merged_records)
-    save_tree(objects_dir, merged_tree)
-    return HashRef(hash_object(merged_tree))
-
-
-def find_common_ancestor_core(objects_dir: str, hash1: str, hash2: str) -> HashRef | None:
-    """Helper function to run the ancestor search algorithm independent of the Repository class."""
     try:
         ancestors: set[str] = set()
         current_hash: str | None = hash1
@@ -272,24 +932,37 @@ def find_common_ancestor_core(objects_dir: str, hash1: str, hash2: str) -> HashR
     return None
 
 
-def merge_commits_core(objects_dir: str | Path, ours_hash: str, theirs_hash: str) -> MergeResult:
-    """Perform a 3-way merge between two commits using their common ancestor."""
-    ancestor_hash = find_common_ancestor_core(objects_dir, ours_hash, theirs_hash)
+def _commit_tree_hash(objects_dir: str | Path, commit_hash: str) -> HashRef:
+    try:
+        return HashRef(load_commit(objects_dir, commit_hash).tree_hash)
+    except Exception as e:
+        msg = 'Error preparing commits for merge'
+        raise MergeError(msg) from e
+
+
+def merge_commits_core(objects_dir: str | Path, ours_hash: str, theirs_hash: str,
+                       graph: CommitGraph | None = None, workers: int | None = None, dry_run: bool = False,
+                       stop_on_conflict: bool = False) -> MergeResult:
+    """Perform a 3-way merge between two commits using their common ancestor, on up to workers processes (one
+    per CPU by default). A dry run only finds the conflicts, or the first one when stopping on a
+    conflict, and saves nothing (see merge_trees_core).
+
+    When one commit is an ancestor of the other, no tree is loaded: the result is an UpToDateResult for our
+    commit if theirs is its ancestor, or a FastForwardResult to their commit if ours is theirs'."""
+    ancestor_hash = find_common_ancestor_core(objects_dir, ours_hash, theirs_hash, graph)
     if ancestor_hash is None:
         msg = 'No common ancestor found for merge'
         raise MergeError(msg)
 
-    try:
-        ours_commit = load_commit(objects_dir, ours_hash)
-        theirs_commit = load_commit(objects_dir, theirs_hash)
-        ancestor_commit = load_commit(objects_dir, ancestor_hash)
+    if ancestor_hash == theirs_hash:
+        return UpToDateResult(_commit_tree_hash(objects_dir, ours_hash), [], HashRef(ours_hash))
+    if ancestor_hash == ours_hash:
+        return FastForwardResult(_commit_tree_hash(objects_dir, theirs_hash), [], HashRef(theirs_hash))
 
-        ours_tree = load_tree(objects_dir, ours_commit.tree_hash)
-        theirs_tree = load_tree(objects_dir, theirs_commit.tree_hash)
-        ancestor_tree = load_tree(objects_dir, ancestor_commit.tree_hash)
-    except Exception as e:
-        msg = 'Error preparing commits for merge'
-        raise MergeError(msg) from e
+    # The root trees are streamed by hash rather than loaded, like every other tree of the merge
+    ours_tree = _commit_tree_hash(objects_dir, ours_hash)
+    theirs_tree = _commit_tree_hash(objects_dir, theirs_hash)
+    ancestor_tree = _commit_tree_hash(objects_dir, ancestor_hash)
 
     conflicts: list[str] = []
     merged_tree_hash = merge_trees_core(
@@ -299,6 +972,9 @@ def merge_commits_core(objects_dir: str | Path, ours_hash: str, theirs_hash: str
         theirs_tree,
         '',
         conflicts,
+        workers,
+        dry_run,
+        stop_on_conflict,
     )
 
     return MergeResult(merged_tree_hash, conflicts)
@@ -2,11 +2,13 @@
 
 import os
 from pathlib import Path
+from collections.abc import Iterator, Sequence
 from typing import IO
 
 import _libcaf
-from _libcaf import Blob, Commit, Tree
+from _libcaf import Blob, Commit, ObjectWriter, PathChange, Tree, TreeCache, TreeChange, TreeRecord, TreeWriter
 
+from .constants import TREE_DIFF_BATCH_SIZE, TREE_RECORD_BATCH_SIZE
 from .ref import HashRef
 
 
@@ -40,6 +42,17 @@ def open_content_for_writing(root_dir: str | Path, hash_value: str) -> IO[bytes]
     return os.fdopen(fd, 'wb')
 
 
+def open_object_writer(root_dir: str | Path) -> ObjectWriter:
+    """Open a writer for an object whose hash is only known once it is fully written.
+
+    The content is hashed as it is written to a temporary file in the objects directory. ``commit()`` publishes
+    the object atomically and returns its hash; a writer closed without committing discards what it wrote."""
+    if isinstance(root_dir, Path):
+        root_dir = str(root_dir)
+
+    return ObjectWriter(root_dir)
+
+
 def delete_content(root_dir: str | Path, hash_value: str) -> None:
     if isinstance(root_dir, Path):
         root_dir = str(root_dir)
@@ -85,8 +98,49 @@ def load_tree(root_dir: str | Path, hash_value: str) -> Tree:
     return _libcaf.load_tree(root_dir, hash_value)
 
 
+def stream_tree_records(root_dir: str | Path, hash_value: str,
+                        batch_size: int = TREE_RECORD_BATCH_SIZE) -> Iterator[TreeRecord]:
+    """Yield the records of a stored tree in name order, holding only a batch of them in memory at a time."""
+    if isinstance(root_dir, Path):
+        root_dir = str(root_dir)
+
+    stream = _libcaf.TreeRecordStream(root_dir, hash_value)
+    while batch := stream.next(batch_size):
+        yield from batch
+
+
+def open_tree_writer(root_dir: str | Path) -> TreeWriter:
+    """Open a writer that saves a tree from records given in increasing name order, a batch at a time.
+
+    ``add(records)`` appends a list of records. ``commit()`` publishes the tree atomically and returns its hash,
+    the same as saving a Tree of those records; a writer closed without committing discards them."""
+    if isinstance(root_dir, Path):
+        root_dir = str(root_dir)
+
+    return TreeWriter(root_dir)
+
+
+def diff_trees(root_dir: str | Path, old_tree_hash: str, new_tree_hash: str, paths: Sequence[str] = (),
+               cache: TreeCache | None = None) -> list[TreeChange]:
+    if isinstance(root_dir, Path):
+        root_dir = str(root_dir)
+
+    return _libcaf.diff_trees(root_dir, old_tree_hash, new_tree_hash, list(paths), cache)
+
+
+def stream_tree_diff(root_dir: str | Path, old_tree_hash: str, new_tree_hash: str, paths: Sequence[str] = (),
+                     batch_size: int = TREE_DIFF_BATCH_SIZE) -> Iterator[PathChange]:
+    if isinstance(root_dir, Path):
+        root_dir = str(root_dir)
+
+    stream = _libcaf.TreeDiffStream(root_dir, old_tree_hash, new_tree_hash, list(paths))
+    while batch := stream.next(batch_size):
+        yield from batch
+
+
 __all__ = [
     'delete_content',
+    'diff_trees',
     'hash_file',
     'hash_object',
     'hash_string',
@@ -94,7 +148,11 @@ __all__ = [
     'load_tree',
     'open_content_for_reading',
     'open_content_for_writing',
+    'open_object_writer',
+    'open_tree_writer',
     'save_commit',
     'save_file_content',
     'save_tree',
+    'stream_tree_diff',
+    'stream_tree_records',
 ]
@@ -1,20 +1,34 @@
 """libcaf repository management."""
 
+import math
+import os
 import shutil
-from collections import deque
-from collections.abc import Callable, Generator, Sequence
+from collections import defaultdict, deque
+from collections.abc import Callable, Generator, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from functools import wraps
 from pathlib import Path
 from typing import Concatenate
 
-from . import Blob, Commit, Tree, TreeRecord, TreeRecordType
-from .constants import (DEFAULT_BRANCH, DEFAULT_REPO_DIR, HASH_CHARSET, HASH_LENGTH, HEADS_DIR, HEAD_FILE,
-                        OBJECTS_SUBDIR, REFS_DIR, TAGS_DIR)
-from .merge import MergeError, MergeResult, find_common_ancestor_core, merge_commits_core
-from .plumbing import hash_object, load_commit, load_tree, save_commit, save_file_content, save_tree
+from _libcaf import TreeCache
+
+from . import Blob, Commit, Tree, TreeChange, TreeRecord, TreeRecordType
+from .bitmap import BitmapIndex
+from .cache import ObjectCache
+from .commit_graph import CommitGraph, CommitGraphEntry, CommitGraphError, update_commit_graph
+from .commit_index import CommitIndex
+from .constants import (BITMAP_FILE, COMMIT_GRAPH_FILE, COMMIT_INDEX_DIR, DEFAULT_BRANCH, DEFAULT_MOVE_WINDOW,
+                        DEFAULT_REPO_DIR, HASH_CHARSET, HASH_LENGTH, HEADS_DIR, HEAD_FILE, INDEX_FILE, OBJECTS_SUBDIR,
+                        REFS_DIR, TAGS_DIR, TREE_CACHE_SIZE)
+from .line_diff import DEFAULT_CONTEXT, STATS_CACHE, Hunk, count_changed_lines, diff_blobs_core
+from .merge import MergeError, MergeResult, find_common_ancestor_core, merge_commits_core, record_resolution
+from .plumbing import (diff_trees, hash_object, load_commit, load_tree, save_commit, save_file_content, save_tree,
+                       stream_tree_diff)
 from .ref import HashRef, Ref, RefError, SymRef, read_ref, write_ref
+from .similarity import find_similar_pairs
+from .stat_cache import StatCache
 
 
 class RepositoryError(Exception):
@@ -48,12 +62,15 @@ class RemovedDiff(Diff):
 class ModifiedDiff(Diff):
     """A modified tree record diff as part of a commit."""
 
+    new_record: TreeRecord
+
 
 @dataclass
 class MovedToDiff(Diff):
     """A tree record diff that has been moved elsewhere as part of a commit."""
 
     moved_to: 'MovedFromDiff | None'
+    similarity: float = 1.0
 
 
 @dataclass
@@ -61,6 +78,30 @@ class MovedFromDiff(Diff):
     """A tree record diff that has been moved from elsewhere as part of a commit."""
 
     moved_from: MovedToDiff | None
+    similarity: float = 1.0
+
+
+@dataclass
+class DiffEntry:
+    """A change between two commits identified by its full path, as streamed by Repository.iter_diff.
+
+    The diff has no parent or children; its nesting is given by depth, 0 for top-level records."""
+
+    path: str
+    depth: int
+    diff: Diff
+    # For either side of a move, the full path of the other side
+    other_path: str | None = None
+
+
+@dataclass
+class DiffStat:
+    """Line counts of a file changed between two commits, as reported by Repository.diff_stats."""
+
+    path: str
+    # Both counts are None for binary files
+    added: int | None
+    removed: int | None
 
 
 @dataclass
@@ -71,6 +112,14 @@ class LogEntry:
     commit: Commit
 
 
+@dataclass
+class LogStatEntry(LogEntry):
+    """A log entry with the line counts of the files its commit changed, as generated by
+    Repository.log_with_changes."""
+
+    stats: list[DiffStat]
+
+
 @dataclass
 class Tag:
     """Represents an immutable label that points to a commit."""
@@ -108,6 +157,7 @@ class Repository:
         heads_dir = self.heads_dir()
         heads_dir.mkdir(parents=True)
         self.tags_dir().mkdir(parents=True)
+        CommitIndex(self.commit_index_dir()).create()
 
         self.add_branch(default_branch)
 
@@ -147,6 +197,30 @@ class Repository:
         """Get the path to the tags directory within the repository."""
         return self.refs_dir() / TAGS_DIR
 
+    def commit_graph_file(self) -> Path:
+        """Get the path to the commit-graph file within the repository.
+
+        :return: The path to the commit-graph file."""
+        return self.repo_path() / COMMIT_GRAPH_FILE
+
+    def commit_index_dir(self) -> Path:
+        """Get the path to the commit metadata index within the repository.
+
+        :return: The path to the commit index directory."""
+        return self.repo_path() / COMMIT_INDEX_DIR
+
+    def bitmap_file(self) -> Path:
+        """Get the path to the reachability bitmap index within the repository.
+
+        :return: The path to the bitmap file."""
+        return self.repo_path() / BITMAP_FILE
+
+    def index_file(self) -> Path:
+        """Get the path to the stat cache of working directory files within the repository.
+
+        :return: The path to the index file."""
+        return self.repo_path() / INDEX_FILE
+
     @staticmethod
     def requires_repo[**P, R](func: Callable[Concatenate['Repository', P], R]) -> \
             Callable[Concatenate['Repository', P], R]:
@@ -488,6 +562,7 @@ class Repository:
         commit_ref = HashRef(hash_object(commit))
 
         save_commit(self.objects_dir(), commit)
+        self.update_commit_graph(commit_ref)
 
         if branch:
             # Extract the relative path from the SymRef (e.g., 'heads/feature' from SymRef('heads/feature'))
@@ -497,157 +572,666 @@ class Repository:
         return commit_ref
 
     @requires_repo
-    def log(self, tip: Ref | None = None) -> Generator[LogEntry, None, None]:
+    def update_commit_graph(self, *commit_refs: HashRef) -> None:
+        """Record commits, and any of their ancestors that are missing, in the commit-graph file.
+
+        The commits recorded are added to the commit index as well. The log only finds commits through the
+        commit-graph, so the index covers every commit it can walk, however the commit was written.
+
+        :param commit_refs: The commits to record.
+        :raises RepositoryError: If a commit cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        try:
+            added = update_commit_graph(self.commit_graph_file(), self.objects_dir(), commit_refs)
+        except CommitGraphError as e:
+            msg = 'Error updating the commit-graph'
+            raise RepositoryError(msg) from e
+
+        # A missing index is built from the whole history the first time it is queried
+        commit_index = CommitIndex(self.commit_index_dir())
+        if added and commit_index.exists():
+            commit_index.add(added)
+
+    @requires_repo
+    def commit_graph(self, *commit_refs: HashRef) -> CommitGraph:
+        """Open the commit-graph of the repository, making sure it records the given commits.
+
+        The returned graph holds a memory map and should be closed, preferably by using it as a context manager.
+
+        :param commit_refs: Commits that must be present in the graph. Missing ones are added first.
+        :return: The opened CommitGraph.
+        :raises RepositoryError: If a commit cannot be loaded or the commit-graph file is invalid.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        try:
+            graph = CommitGraph(self.commit_graph_file())
+            if all(commit_ref in graph for commit_ref in commit_refs):
+                return graph
+
+            graph.close()
+            self.update_commit_graph(*commit_refs)
+            return CommitGraph(self.commit_graph_file())
+        except CommitGraphError as e:
+            msg = 'Error opening the commit-graph'
+            raise RepositoryError(msg) from e
+
+    @requires_repo
+    def log(self, tip: Ref | None = None, max_count: int | None = None, skip: int = 0,
+            since: datetime | None = None, until: datetime | None = None,
+            paths: Sequence[str] | None = None, author: str | None = None,
+            message: str | None = None) -> Generator[LogEntry, None, None]:
         """Generate a log of commits in the repository, starting from the specified tip.
 
+        The parent chain is followed through the commit-graph and the filters are evaluated on its rows, so commit
+        objects are only loaded for the entries that are actually yielded. Path filtering first consults the
+        changed-path Bloom filter of each commit, and only loads the trees along a path when the filter cannot
+        rule the commit out. Time, author and message filters restrict the walk to candidates from the commit
+        index: the time range is binary-searched in its time table, and the walk stops once it is below the
+        generation of every candidate, so it does not go further back in history than the oldest match.
+
         :param tip: The reference to the commit to start from. If None, defaults to the current HEAD.
+        :param max_count: The maximum number of entries to yield. If None, the whole history is yielded.
+        :param skip: The number of matching entries to skip before yielding.
+        :param since: Only yield commits made at or after this time.
+        :param until: Only yield commits made at or before this time.
+        :param paths: Only yield commits that changed one of these files or directories, relative to the
+            working directory.
+        :param author: Only yield commits by this author.
+        :param message: Only yield commits whose message contains this text, ignoring case.
         :return: A generator yielding LogEntry objects representing the commits in the log.
+        :raises ValueError: If max_count or skip is negative.
         :raises RepositoryError: If a commit cannot be loaded.
         :raises RepositoryNotFoundError: If the repository does not exist."""
+        for log_entry, _ in self._walk_log(tip, max_count, skip, since, until, paths, author, message):
+            yield log_entry
+
+    def _walk_log(self, tip: Ref | None, max_count: int | None, skip: int, since: datetime | None,
+                  until: datetime | None, paths: Sequence[str] | None, author: str | None,
+                  message: str | None) -> Generator[tuple[LogEntry, str], None, None]:
+        """Walk the log as in log, yielding each entry with the tree hash of its first parent, read from the
+        commit-graph ('' for a root commit)."""
+        if max_count is not None and max_count < 0:
+            msg = 'max_count must not be negative'
+            raise ValueError(msg)
+        if skip < 0:
+            msg = 'skip must not be negative'
+            raise ValueError(msg)
+
         tip = tip or self.head_ref()
         current_hash = self.resolve_ref(tip)
+        if not current_hash or max_count == 0:
+            return
+
+        objects_dir = self.objects_dir()
+        since_timestamp = since.timestamp() if since is not None else None
+        until_timestamp = until.timestamp() if until is not None else None
+        path_filter = [path.strip('/') for path in paths or []]
+        if '' in path_filter:
+            path_filter = []
+        yielded = 0
 
         try:
-            while current_hash:
-                commit = load_commit(self.objects_dir(), current_hash)
-                yield LogEntry(HashRef(current_hash), commit)
+            with self.commit_graph(current_hash) as graph:
+                # Only once the tip is in the commit-graph, which indexes it if it was not recorded yet
+                candidates = self._index_candidates(author, message, since, until)
+
+                # Generations decrease along the walk, so no candidate is found below the lowest of theirs
+                lowest_generation = 0
+                if candidates is not None:
+                    generations = [entry.generation for entry in map(graph.get, candidates) if entry is not None]
+                    if not generations:
+                        return
+                    lowest_generation = min(generations)
+
+                for entry in graph.walk(current_hash):
+                    current_hash = entry.commit_hash
+                    if entry.generation < lowest_generation:
+                        return
+
+                    if since_timestamp is not None and entry.timestamp < since_timestamp:
+                        continue
+                    if until_timestamp is not None and entry.timestamp > until_timestamp:
+                        continue
+                    if path_filter and not _changes_any_path(objects_dir, graph, entry, path_filter):
+                        continue
+
+                    commit = None
+                    if candidates is not None:
+                        if current_hash not in candidates:
+                            continue
+                        if author is not None or message is not None:
+                            commit = load_commit(objects_dir, current_hash)
+                            if not _matches_metadata(commit, author, message):
+                                continue
+
+                    if skip:
+                        skip -= 1
+                        continue
+
+                    if commit is None:
+                        commit = load_commit(objects_dir, current_hash)
+                    parent_tree = (graph.entry(entry.parent_position).tree_hash
+                                   if entry.parent_position is not None else '')
+                    yield LogEntry(current_hash, commit), parent_tree
 
-                current_hash = HashRef(commit.parent) if commit.parent else None
+                    yielded += 1
+                    if max_count is not None and yielded >= max_count:
+                        return
         except Exception as e:
             msg = f'Error loading commit {current_hash}'
             raise RepositoryError(msg) from e
 
     @requires_repo
-    def diff_commits(self, commit_ref1: Ref | None = None, commit_ref2: Ref | None = None) -> Sequence[Diff]:
+    def log_with_changes(self, tip: Ref | None = None, max_count: int | None = None, skip: int = 0,
+                         since: datetime | None = None, until: datetime | None = None,
+                         paths: Sequence[str] | None = None, author: str | None = None,
+                         message: str | None = None,
+                         workers: int | None = None) -> Generator[LogStatEntry, None, None]:
+        """Generate a log of commits together with the line counts of the files each one changed.
+
+        Every commit is diffed against its first parent (a root commit against the empty tree) in a pool of
+        worker threads. The workers share one cache of loaded trees, so a tree that consecutive commits have in
+        common is read once rather than once per diff, and the native tree diffs and line counts release the
+        GIL, so the workers run in parallel. The tree of each parent is read from the commit-graph, so parent
+        commits are not loaded. Entries are still yielded in history order, with a bounded number of commits in
+        flight ahead of the one being yielded.
+
+        The commits are selected as in log; tip, max_count, skip, since, until, author and message have the
+        same meaning there.
+
+        :param paths: Only yield commits that changed one of these files or directories, and only count the
+            changes to them.
+        :param workers: The number of worker threads. If None, one per CPU.
+        :return: A generator yielding LogStatEntry objects, newest first.
+        :raises ValueError: If max_count or skip is negative, or workers is not positive.
+        :raises RepositoryError: If a commit, tree or blob cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        if workers is not None and workers < 1:
+            msg = 'workers must be positive'
+            raise ValueError(msg)
+
+        history = self._walk_log(tip, max_count, skip, since, until, paths, author, message)
+        tree_cache = TreeCache(TREE_CACHE_SIZE)
+        stats_cache = ObjectCache(self.objects_dir(), STATS_CACHE)
+
+        def commit_changes(commit: Commit, parent_tree: str) -> list[DiffStat]:
+            diffs = self._diff_trees(parent_tree, commit.tree_hash, paths=paths, tree_cache=tree_cache)
+            return self._count_changes(diffs, stats_cache)
+
+        # More threads than CPUs only adds contention for the GIL between the Python parts of the diffs
+        workers = workers or os.cpu_count() or 1
+        pool = ThreadPoolExecutor(max_workers=workers)
+        max_in_flight = 2 * workers
+        in_flight: deque[tuple[LogEntry, Future[list[DiffStat]]]] = deque()
+        try:
+            for entry, parent_tree in history:
+                in_flight.append((entry, pool.submit(commit_changes, entry.commit, parent_tree)))
+                if len(in_flight) >= max_in_flight:
+                    entry, changes = in_flight.popleft()
+                    yield LogStatEntry(entry.commit_ref, entry.commit, changes.result())
+
+            while in_flight:
+                entry, changes = in_flight.popleft()
+                yield LogStatEntry(entry.commit_ref, entry.commit, changes.result())
+        finally:
+            # Commits queued ahead of an abandoned or failed walk are not diffed
+            pool.shutdown(cancel_futures=True)
+
+    @requires_repo
+    def commit_index(self) -> CommitIndex:
+        """Get the commit metadata index, building it if it does not exist yet.
+
+        The index is built from every commit in the commit-graph, once the history of all refs is recorded there.
+        From then on, update_commit_graph indexes the commits it records.
+
+        :return: The CommitIndex.
+        :raises RepositoryError: If a commit cannot be loaded while building the index.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        commit_index = CommitIndex(self.commit_index_dir())
+        if commit_index.exists():
+            return commit_index
+
+        with self.commit_graph(*self._ref_tips()) as graph:
+            commit_hashes = [graph.entry(position).commit_hash for position in range(len(graph))]
+
+        objects_dir = self.objects_dir()
+        try:
+            commits = [(commit_hash, load_commit(objects_dir, commit_hash)) for commit_hash in commit_hashes]
+        except Exception as e:
+            msg = 'Error loading commit while building the commit index'
+            raise RepositoryError(msg) from e
+
+        commit_index.create()
+        commit_index.add(commits)
+        return commit_index
+
+    @requires_repo
+    def find_commits(self, author: str | None = None, since: datetime | None = None, until: datetime | None = None,
+                     message: str | None = None) -> list[LogEntry]:
+        """Find commits by metadata using the commit index, across the history of all refs and any other commit
+        recorded in the commit-graph.
+
+        :param author: Only return commits by this author.
+        :param since: Only return commits made at or after this time.
+        :param until: Only return commits made at or before this time.
+        :param message: Only return commits whose message contains this text, ignoring case.
+        :return: The matching commits, newest first.
+        :raises RepositoryError: If a commit cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        commit_index = self.commit_index()
+
+        in_range = commit_index.between(*_index_time_range(since, until))
+        candidates = self._index_candidates(author, message)
+        if candidates is not None:
+            in_range = [commit_hash for commit_hash in in_range if commit_hash in candidates]
+
+        objects_dir = self.objects_dir()
+        entries: list[LogEntry] = []
+        try:
+            for commit_hash in in_range:
+                commit = load_commit(objects_dir, commit_hash)
+                if _matches_metadata(commit, author, message):
+                    entries.append(LogEntry(HashRef(commit_hash), commit))
+        except Exception as e:
+            msg = 'Error loading commit while searching the commit index'
+            raise RepositoryError(msg) from e
+
+        entries.reverse()
+        return entries
+
+    def _index_candidates(self, author: str | None, message: str | None, since: datetime | None = None,
+                          until: datetime | None = None) -> set[str] | None:
+        """Narrow down commits by author, message and time range through the commit index.
+
+        :return: The candidate commit hashes, or None if no filter restricts the candidates."""
+        if author is None and message is None and since is None and until is None:
+            return None
+
+        commit_index = self.commit_index()
+        candidates = commit_index.by_author(author) if author is not None else None
+        if message is not None:
+            message_candidates = commit_index.by_message(message)
+            if message_candidates is not None:
+                candidates = message_candidates if candidates is None else candidates & message_candidates
+        if since is not None or until is not None or candidates is None:
+            in_range = set(commit_index.between(*_index_time_range(since, until)))
+            candidates = in_range if candidates is None else candidates & in_range
+
+        return candidates
+
+    def _ref_tips(self) -> set[HashRef]:
+        """Resolve every ref, and HEAD, to the commit it points to."""
+        tips = {self.resolve_ref(SymRef(ref)) for ref in self._ref_paths()}
+        tips.add(self.head_commit())
+        tips.discard(None)
+
+        return tips
+
+    def _ref_paths(self) -> list[str]:
+        """List every ref as a path relative to the refs directory, such as 'heads/main'."""
+        refs_dir = self.refs_dir()
+        return [ref_file.relative_to(refs_dir).as_posix() for ref_file in refs_dir.rglob('*')
+                if ref_file.is_file()]
+
+    @requires_repo
+    def reachable_objects(self, *refs: Ref) -> set[str]:
+        """Get every object reachable from the given refs: the commits, their trees and their blobs.
+
+        :param refs: The refs to start from. Defaults to all refs and HEAD.
+        :return: The object hashes.
+        :raises RepositoryError: If a ref cannot be resolved or an object cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        bitmaps, bits = self._reachable_bits(self._resolve_tips(refs))
+        return set(bitmaps.hashes(bits))
+
+    @requires_repo
+    def count_objects(self, *refs: Ref) -> int:
+        """Count the objects reachable from the given refs without listing them.
+
+        :param refs: The refs to start from. Defaults to all refs and HEAD.
+        :return: The number of reachable objects.
+        :raises RepositoryError: If a ref cannot be resolved or an object cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        _, bits = self._reachable_bits(self._resolve_tips(refs))
+        return bits.bit_count()
+
+    @requires_repo
+    def unreachable_objects(self) -> list[str]:
+        """Find the stored objects that no ref or HEAD can reach, i.e. the objects garbage collection may delete.
+
+        :return: The unreachable object hashes, sorted.
+        :raises RepositoryError: If an object cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        bitmaps, bits = self._reachable_bits(self._ref_tips())
+
+        stored = [object_file.name for object_file in self.objects_dir().glob('??/*')
+                  if len(object_file.name) == HASH_LENGTH]
+        # Reachable objects all have a position, so objects without one are unreachable too
+        unreachable = bitmaps.hashes(bitmaps.bitmap(stored) & ~bits)
+        unreachable.extend(object_hash for object_hash in stored if not bitmaps.known(object_hash))
+
+        return sorted(unreachable)
+
+    @requires_repo
+    def objects_to_send(self, wants: Sequence[Ref], haves: Sequence[Ref]) -> set[str]:
+        """Negotiate a transfer: find the objects reachable from the wanted commits but not from the ones the
+        other side already has.
+
+        :param wants: The commits the other side asks for.
+        :param haves: The commits the other side already has. Commits unknown to this repository are ignored.
+        :return: The hashes of the objects to send.
+        :raises RepositoryError: If a ref cannot be resolved or an object cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        want_tips = self._resolve_tips(wants)
+        have_tips = {commit_hash for commit_hash in self._resolve_tips(haves)
+                     if (self.objects_dir() / commit_hash[:2] / commit_hash).exists()}
+
+        bitmaps, want_bits = self._reachable_bits(want_tips)
+        _, have_bits = self._reachable_bits(have_tips)
+        return set(bitmaps.hashes(want_bits & ~have_bits))
+
+    def _resolve_tips(self, refs: Sequence[Ref]) -> set[HashRef]:
+        """Resolve refs to commits, defaulting to every ref and HEAD when none are given."""
+        if not refs:
+            return self._ref_tips()
+
+        tips = set()
+        for ref in refs:
+            try:
+                commit_hash = self.resolve_ref(ref)
+            except RefError as e:
+                msg = f'Cannot resolve reference {ref}'
+                raise RepositoryError(msg) from e
+            if commit_hash is None:
+                msg = f'Cannot resolve reference {ref}'
+                raise RepositoryError(msg)
+            tips.add(commit_hash)
+
+        return tips
+
+    def _reachable_bits(self, commit_refs: set[HashRef]) -> tuple[BitmapIndex, int]:
+        """Compute the reachability bitmap of a set of commits, storing any new bitmaps in the index."""
+        bitmaps = BitmapIndex(self.bitmap_file())
+        with self.commit_graph(*commit_refs) as graph:
+            try:
+                bits = bitmaps.reachable_from(self.objects_dir(), graph, commit_refs)
+            except Exception as e:
+                msg = 'Error computing reachable objects'
+                raise RepositoryError(msg) from e
+
+        bitmaps.save()
+        return bitmaps, bits
+
+    @requires_repo
+    def diff_commits(self, commit_ref1: Ref | None = None, commit_ref2: Ref | None = None,
+                     rename_threshold: float | None = None, paths: Sequence[str] | None = None) -> Sequence[Diff]:
         """Generate a diff between two commits in the repository.
 
         :param commit_ref1: The reference to the first commit. If None, defaults to the current HEAD.
         :param commit_ref2: The reference to the second commit. If None, defaults to the current HEAD.
+        :param rename_threshold: If given, also report a removed and an added file as a move when their
+            contents are at least this similar (between 0 and 1), not only when they are identical.
+        :param paths: Only compare these files or directories, relative to the working directory. Patterns
+            with *, ? or [ are matched as globs against whole paths. Trees that cannot contain a match are
+            never loaded; directories leading to matches are only reported if something in them changed.
         :return: A list of Diff objects representing the differences between the two commits.
+        :raises ValueError: If rename_threshold is not between 0 and 1.
         :raises RepositoryError: If a commit or tree cannot be loaded.
         :raises RepositoryNotFoundError: If the repository does not exist."""
-        if commit_ref1 is None:
-            commit_ref1 = self.head_ref()
-        if commit_ref2 is None:
-            commit_ref2 = self.head_ref()
+        commit1, commit2 = self._load_commit_pair(commit_ref1, commit_ref2)
 
-        try:
-            commit_hash1 = self.resolve_ref(commit_ref1)
-            commit_hash2 = self.resolve_ref(commit_ref2)
+        return self._diff_trees(commit1.tree_hash, commit2.tree_hash, rename_threshold, paths)
 
-            if commit_hash1 is None:
-                msg = f'Cannot resolve reference {commit_ref1}'
-                raise RefError(msg)
-            if commit_hash2 is None:
-                msg = f'Cannot resolve reference {commit_ref2}'
-                raise RefError(msg)
+    def _diff_trees(self, tree_hash1: str, tree_hash2: str, rename_threshold: float | None = None,
+                    paths: Sequence[str] | None = None, tree_cache: TreeCache | None = None) -> list[Diff]:
+        if tree_hash1 == tree_hash2:
+            return []
 
-            commit1 = load_commit(self.objects_dir(), commit_hash1)
-            commit2 = load_commit(self.objects_dir(), commit_hash2)
+        try:
+            changes = diff_trees(self.objects_dir(), tree_hash1, tree_hash2, paths or (), tree_cache)
         except Exception as e:
-            msg = 'Error loading commit'
+            msg = 'Error loading tree'
             raise RepositoryError(msg) from e
 
-        if commit1.tree_hash == commit2.tree_hash:
-            return []
+        top_level_diff = Diff(TreeRecord(TreeRecordType.TREE, '', ''), None, [])
+        # The diff built for each change, by change index, so that nested changes can find their parent
+        change_diffs: list[Diff] = []
+
+        # Added and removed records by hash, each with its index in the parent's children.
+        # Moves are paired up once the whole walk is done, so each one is a constant-time replacement.
+        added_by_hash: dict[str, list[tuple[Diff, int]]] = defaultdict(list)
+        removed_by_hash: dict[str, list[tuple[Diff, int]]] = defaultdict(list)
+
+        for change in changes:
+            parent_diff = change_diffs[change.parent] if change.parent >= 0 else top_level_diff
+            local_diff: Diff
+
+            match change.kind:
+                case TreeChange.Kind.REMOVED:
+                    record = change.old_record
+                    local_diff = RemovedDiff(record, parent_diff, [])
+                    removed_by_hash[record.hash].append((local_diff, len(parent_diff.children)))
+
+                case TreeChange.Kind.MODIFIED:
+                    # Modified subtrees are descended into natively; their changes refer back to this diff
+                    local_diff = ModifiedDiff(change.old_record, parent_diff, [], change.new_record)
+
+                case TreeChange.Kind.ADDED:
+                    record = change.new_record
+                    local_diff = AddedDiff(record, parent_diff, [])
+                    added_by_hash[record.hash].append((local_diff, len(parent_diff.children)))
+
+            parent_diff.children.append(local_diff)
+            change_diffs.append(local_diff)
+
+        unpaired_added, unpaired_removed = _resolve_moves(added_by_hash, removed_by_hash)
+        if rename_threshold is not None:
+            try:
+                _resolve_similar_moves(self.objects_dir(), unpaired_added, unpaired_removed, rename_threshold)
+            except ValueError:
+                raise
+            except Exception as e:
+                msg = 'Error reading blobs for rename detection'
+                raise RepositoryError(msg) from e
+
+        return top_level_diff.children
+
+    @requires_repo
+    def diff_working_dir(self, commit_ref: Ref | None = None) -> Sequence[Diff]:
+        """Generate a diff between a commit and the working directory.
+
+        Files whose stat data is unchanged since they were last hashed reuse the hash recorded in the index
+        rather than being read again, and nothing is written into the object store: the trees of the working
+        directory are only hashed in memory. Directories whose hash matches the commit are not descended into.
+
+        :param commit_ref: The reference to the commit to compare against. If None, defaults to the current HEAD.
+        :return: A list of Diff objects representing the changes from the commit to the working directory.
+        :raises RepositoryError: If the commit cannot be loaded or the working directory cannot be read.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        commit, _ = self._load_commit_pair(commit_ref, commit_ref)
+
+        top_level_diff = Diff(TreeRecord(TreeRecordType.TREE, '', ''), None, [])
+        added_by_hash: dict[str, list[tuple[Diff, int]]] = defaultdict(list)
+        removed_by_hash: dict[str, list[tuple[Diff, int]]] = defaultdict(list)
 
         try:
-            tree1 = load_tree(self.objects_dir(), commit1.tree_hash)
-            tree2 = load_tree(self.objects_dir(), commit2.tree_hash)
+            stat_cache = StatCache(self.index_file())
+            self._diff_dir(self.working_dir, '', commit.tree_hash, top_level_diff, stat_cache,
+                           added_by_hash, removed_by_hash)
+            stat_cache.save()
         except Exception as e:
-            msg = 'Error loading tree'
+            msg = 'Error comparing the working directory'
             raise RepositoryError(msg) from e
 
-        top_level_diff = Diff(TreeRecord(TreeRecordType.TREE, '', ''), None, [])
-        stack = [(tree1, tree2, top_level_diff)]
+        _resolve_moves(added_by_hash, removed_by_hash)
 
-        potentially_added: dict[str, Diff] = {}
-        potentially_removed: dict[str, Diff] = {}
+        return top_level_diff.children
 
-        while stack:
-            current_tree1, current_tree2, parent_diff = stack.pop()
-            records1 = current_tree1.records if current_tree1 else {}
-            records2 = current_tree2.records if current_tree2 else {}
-
-            for name, record1 in records1.items():
-                if name not in records2:
-                    local_diff: Diff
-
-                    # This name is no longer in the tree, so it was either moved or removed
-                    # Have we seen this hash before as a potentially-added record?
-                    if record1.hash in potentially_added:
-                        added_diff = potentially_added[record1.hash]
-                        del potentially_added[record1.hash]
-
-                        local_diff = MovedToDiff(record1, parent_diff, [], None)
-                        moved_from_diff = MovedFromDiff(added_diff.record, added_diff.parent, [], local_diff)
-                        local_diff.moved_to = moved_from_diff
-
-                        # Replace the original added diff with a moved-from diff
-                        added_diff.parent.children = (
-                            [_ if _.record.hash != record1.hash
-                             else moved_from_diff
-                             for _ in added_diff.parent.children])
+    def _diff_dir(self, path: Path, prefix: str, tree_hash: str, parent_diff: Diff, stat_cache: StatCache,
+                  added_by_hash: dict[str, list[tuple[Diff, int]]],
+                  removed_by_hash: dict[str, list[tuple[Diff, int]]]) -> str:
+        """Add the changes from a tree to a working directory to the children of a diff.
 
-                    else:
-                        local_diff = RemovedDiff(record1, parent_diff, [])
-                        potentially_removed[record1.hash] = local_diff
+        :return: The hash the directory would have as a tree."""
+        old_records = load_tree(self.objects_dir(), tree_hash).records if tree_hash else {}
+        new_records: dict[str, TreeRecord] = {}
+
+        for item in sorted(path.iterdir()):
+            if item.name == self.repo_dir.name:
+                continue
 
+            old_record = old_records.get(item.name)
+            if item.is_file():
+                file_hash = stat_cache.file_hash(prefix + item.name, item)
+                new_records[item.name] = TreeRecord(TreeRecordType.BLOB, file_hash, item.name)
+            elif item.is_dir() and old_record is not None and old_record.type == TreeRecordType.TREE:
+                # Built before knowing whether anything changed, so nested changes can refer to it
+                local_diff = ModifiedDiff(old_record, parent_diff, [], old_record)
+                subtree_hash = self._diff_dir(item, f'{prefix}{item.name}/', old_record.hash, local_diff,
+                                              stat_cache, added_by_hash, removed_by_hash)
+                new_records[item.name] = TreeRecord(TreeRecordType.TREE, subtree_hash, item.name)
+                if subtree_hash != old_record.hash:
+                    local_diff.new_record = new_records[item.name]
                     parent_diff.children.append(local_diff)
-                else:
-                    record2 = records2[name]
+                continue
+            elif item.is_dir():
+                subtree_hash = self._hash_dir(item, f'{prefix}{item.name}/', stat_cache)
+                new_records[item.name] = TreeRecord(TreeRecordType.TREE, subtree_hash, item.name)
+            else:
+                continue
 
-                    # This record is identical in both trees, so no diff is needed
-                    if record1.hash == record2.hash:
-                        continue
+            new_record = new_records[item.name]
+            if old_record is None:
+                local_diff = AddedDiff(new_record, parent_diff, [])
+                added_by_hash[new_record.hash].append((local_diff, len(parent_diff.children)))
+                parent_diff.children.append(local_diff)
+            elif old_record.hash != new_record.hash:
+                parent_diff.children.append(ModifiedDiff(old_record, parent_diff, [], new_record))
 
-                    # If the record is a tree, we need to recursively compare the trees
-                    if record1.type == TreeRecordType.TREE and record2.type == TreeRecordType.TREE:
-                        subtree_diff = ModifiedDiff(record1, parent_diff, [])
+        for name in sorted(old_records.keys() - new_records.keys()):
+            local_diff = RemovedDiff(old_records[name], parent_diff, [])
+            removed_by_hash[local_diff.record.hash].append((local_diff, len(parent_diff.children)))
+            parent_diff.children.append(local_diff)
 
-                        try:
-                            tree1 = load_tree(self.objects_dir(), record1.hash)
-                            tree2 = load_tree(self.objects_dir(), record2.hash)
-                        except Exception as e:
-                            msg = 'Error loading subtree for diff'
-                            raise RepositoryError(msg) from e
+        return hash_object(Tree(new_records))
 
-                        stack.append((tree1, tree2, subtree_diff))
-                        parent_diff.children.append(subtree_diff)
-                    else:
-                        modified_diff = ModifiedDiff(record1, parent_diff, [])
-                        parent_diff.children.append(modified_diff)
-
-            for name, record2 in records2.items():
-                if name not in records1:
-                    # This name is in the new tree but not in the old tree, so it was either
-                    # added or moved
-                    # If we've already seen this hash, it was moved, so convert the original
-                    # added diff to a moved diff
-                    if record2.hash in potentially_removed:
-                        removed_diff = potentially_removed[record2.hash]
-                        del potentially_removed[record2.hash]
-
-                        local_diff = MovedFromDiff(record2, parent_diff, [], None)
-                        moved_to_diff = MovedToDiff(removed_diff.record, removed_diff.parent, [], local_diff)
-                        local_diff.moved_from = moved_to_diff
-
-                        # Create a new diff for the moved record
-                        removed_diff.parent.children = (
-                            [_ if _.record.hash != record2.hash
-                             else moved_to_diff
-                             for _ in removed_diff.parent.children])
+    def _hash_dir(self, path: Path, prefix: str, stat_cache: StatCache) -> str:
+        """Hash a working directory as a tree without saving anything.
 
-                    else:
-                        local_diff = AddedDiff(record2, parent_diff, [])
-                        potentially_added[record2.hash] = local_diff
+        :return: The hash the directory would have as a tree."""
+        records: dict[str, TreeRecord] = {}
+        for item in path.iterdir():
+            if item.name == self.repo_dir.name:
+                continue
+            if item.is_file():
+                records[item.name] = TreeRecord(TreeRecordType.BLOB,
+                                                stat_cache.file_hash(prefix + item.name, item), item.name)
+            elif item.is_dir():
+                records[item.name] = TreeRecord(TreeRecordType.TREE,
+                                                self._hash_dir(item, f'{prefix}{item.name}/', stat_cache), item.name)
 
-                    parent_diff.children.append(local_diff)
+        return hash_object(Tree(records))
+
+    @requires_repo
+    def diff_stats(self, commit_ref1: Ref | None = None, commit_ref2: Ref | None = None,
+                   rename_threshold: float | None = None, paths: Sequence[str] | None = None) -> list[DiffStat]:
+        """Count the lines added and removed in every file changed between two commits.
 
-        # Sort the diffs to ensure a deterministic order.
-        # top_level_diff.children.sort(key=lambda d: d.record.name)
+        Files in added or removed directories are counted one by one, and a moved file is reported once, as
+        'old => new'. Counts come from native newline scanning and line-hash diffs, never from diff text, and
+        are cached per pair of blob hashes, so repeated runs over the same history do not read the blobs again.
 
-        return top_level_diff.children
+        :param commit_ref1: The reference to the first commit. If None, defaults to the current HEAD.
+        :param commit_ref2: The reference to the second commit. If None, defaults to the current HEAD.
+        :param rename_threshold: Also detect edited renames at this similarity, as in diff_commits.
+        :param paths: Only count changes to these files or directories, as in diff_commits.
+        :return: The statistics of the changed files, sorted by path.
+        :raises ValueError: If rename_threshold is not between 0 and 1.
+        :raises RepositoryError: If a commit, tree or blob cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        diffs = self.diff_commits(commit_ref1, commit_ref2, rename_threshold, paths)
+
+        return self._count_changes(diffs, ObjectCache(self.objects_dir(), STATS_CACHE))
+
+    def _count_changes(self, diffs: Sequence[Diff], stats_cache: ObjectCache) -> list[DiffStat]:
+        objects_dir = self.objects_dir()
+        stats: list[DiffStat] = []
+        try:
+            for path, old_hash, new_hash in _changed_blobs(objects_dir, diffs):
+                added, removed = count_changed_lines(objects_dir, old_hash, new_hash, stats_cache) or (None, None)
+                stats.append(DiffStat(path, added, removed))
+        except Exception as e:
+            msg = 'Error counting changed lines'
+            raise RepositoryError(msg) from e
+
+        stats.sort(key=lambda stat: stat.path)
+        return stats
+
+    @requires_repo
+    def iter_diff(self, commit_ref1: Ref | None = None, commit_ref2: Ref | None = None,
+                  move_window: int = DEFAULT_MOVE_WINDOW, paths: Sequence[str] | None = None) -> Iterator[DiffEntry]:
+        """Stream the differences between two commits as they are found.
+
+        Unlike diff_commits, nothing is built up front: changes come out in path order while the trees are
+        still being compared, and memory stays bounded by the tree depth and the move window. A removed and an
+        added record with the same hash are reported as a move only if they are at most move_window changes
+        apart; records further apart are reported as removed and added.
+
+        :param commit_ref1: The reference to the first commit. If None, defaults to the current HEAD.
+        :param commit_ref2: The reference to the second commit. If None, defaults to the current HEAD.
+        :param move_window: The number of changes a record is held back for while looking for its move.
+        :param paths: Only compare these files or directories, as in diff_commits.
+        :return: An iterator over the changes, each with its full path.
+        :raises ValueError: If move_window is negative.
+        :raises RepositoryError: If a commit or tree cannot be loaded.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        if move_window < 0:
+            msg = 'move_window must not be negative'
+            raise ValueError(msg)
+
+        commit1, commit2 = self._load_commit_pair(commit_ref1, commit_ref2)
+
+        return _stream_diff(self.objects_dir(), commit1.tree_hash, commit2.tree_hash, move_window, paths or ())
+
+    def _load_commit_pair(self, commit_ref1: Ref | None, commit_ref2: Ref | None) -> tuple[Commit, Commit]:
+        if commit_ref1 is None:
+            commit_ref1 = self.head_ref()
+        if commit_ref2 is None:
+            commit_ref2 = self.head_ref()
+
+        try:
+            commit_hash1 = self.resolve_ref(commit_ref1)
+            commit_hash2 = self.resolve_ref(commit_ref2)
+
+            if commit_hash1 is None:
+                msg = f'Cannot resolve reference {commit_ref1}'
+                raise RefError(msg)
+            if commit_hash2 is None:
+                msg = f'Cannot resolve reference {commit_ref2}'
+                raise RefError(msg)
+
+            return load_commit(self.objects_dir(), commit_hash1), load_commit(self.objects_dir(), commit_hash2)
+        except Exception as e:
+            msg = 'Error loading commit'
+            raise RepositoryError(msg) from e
+
+    @requires_repo
+    def diff_blobs(self, old_hash: str | None, new_hash: str | None, context: int = DEFAULT_CONTEXT) -> list[Hunk]:
+        """Generate a line-level diff between two blobs.
+
+        :param old_hash: The hash of the old blob, or None for an added file.
+        :param new_hash: The hash of the new blob, or None for a removed file.
+        :param context: The number of unchanged lines to show around each change.
+        :return: The unified diff hunks, in file order.
+        :raises ValueError: If context is negative.
+        :raises RepositoryError: If a blob cannot be read.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        try:
+            return diff_blobs_core(self.objects_dir(), old_hash, new_hash, context)
+        except ValueError:
+            raise
+        except Exception as e:
+            msg = f'Error diffing blobs {old_hash} and {new_hash}'
+            raise RepositoryError(msg) from e
 
     @requires_repo
     def common_ancestor(self, commit_ref1: Ref | None = None, commit_ref2: Ref | None = None) -> HashRef | None:
@@ -671,14 +1255,44 @@ class Repository:
             raise RepositoryError(msg) from e
 
         try:
-            return find_common_ancestor_core(self.objects_dir(), commit_hash1, commit_hash2)
+            with self.commit_graph(commit_hash1, commit_hash2) as graph:
+                return find_common_ancestor_core(self.objects_dir(), commit_hash1, commit_hash2, graph)
         except MergeError as e:
             msg = 'Error finding common ancestor'
             raise RepositoryError(msg) from e
 
     @requires_repo
-    def merge_commits(self, commit_ref1: Ref | None = None, commit_ref2: Ref | None = None) -> MergeResult:
-        """Perform a 3-way merge between two commits using their common ancestor."""
+    def merge_commits(self, commit_ref1: Ref | None = None, commit_ref2: Ref | None = None,
+                      workers: int | None = None, *, dry_run: bool = False,
+                      stop_on_conflict: bool = False) -> MergeResult:
+        """Perform a 3-way merge between two commits using their common ancestor.
+
+        Blobs changed on both sides are merged by content after the trees have been walked. Big merges walk the
+        top-level subtrees and run the content merges in a pool of worker processes. The merged tree and the order
+        of the conflicts do not depend on the number of workers.
+
+        If one commit is an ancestor of the other, nothing is merged: the result is a FastForwardResult when their
+        commit descends from ours, so the ref can just be moved to it, or an UpToDateResult when ours already
+        contains theirs.
+
+        A dry run only predicts the conflicts: no merged blob or tree is written, and the result has no tree hash.
+        Content merges compute their merge regions without producing the merged text.
+
+        :param commit_ref1: The reference to our commit. If None, defaults to the current HEAD.
+        :param commit_ref2: The reference to their commit. If None, defaults to the current HEAD.
+        :param workers: The number of worker processes. If None, one per CPU.
+        :param dry_run: Whether to only find the conflicts, without writing anything.
+        :param stop_on_conflict: Whether a dry run stops at the first conflict in path order, reporting only it.
+        :return: The merged tree and the conflicting paths, or one of the results above.
+        :raises ValueError: If workers is not positive, or stop_on_conflict is given without dry_run.
+        :raises RepositoryError: If the commits cannot be resolved or merged.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        if workers is not None and workers < 1:
+            msg = 'workers must be positive'
+            raise ValueError(msg)
+        if stop_on_conflict and not dry_run:
+            msg = 'stop_on_conflict requires dry_run'
+            raise ValueError(msg)
         if commit_ref1 is None and commit_ref2 is None:
             raise RepositoryError('Both commit references are None — nothing to merge')
         if commit_ref1 is None:
@@ -699,11 +1313,40 @@ class Repository:
             raise RepositoryError(msg) from e
 
         try:
-            return merge_commits_core(self.objects_dir(), commit_hash1, commit_hash2)
+            with self.commit_graph(commit_hash1, commit_hash2) as graph:
+                return merge_commits_core(self.objects_dir(), commit_hash1, commit_hash2, graph, workers, dry_run,
+                                          stop_on_conflict)
         except MergeError as e:
             msg = 'Error merging commits'
             raise RepositoryError(msg) from e
 
+    @requires_repo
+    def record_resolution(self, conflicted_hash: str, resolved_file: Path) -> int:
+        """Record how the conflicts of a merged blob were resolved, so later merges resolve them the same way.
+
+        Each conflict hunk's resolution is keyed by the text of its two sides, so it applies wherever the same
+        conflict comes up again, e.g. when long-lived branches are merged repeatedly, or in the other direction.
+
+        :param conflicted_hash: The hash of a merged blob with conflict markers.
+        :param resolved_file: A file with the same content, its conflicts resolved. It is only read: the
+            resolutions are what is kept.
+        :return: The number of resolutions recorded.
+        :raises ValueError: If the file does not exist.
+        :raises RepositoryError: If the blob has no conflicts, or the file does not match it.
+        :raises RepositoryNotFoundError: If the repository does not exist."""
+        if not resolved_file.is_file():
+            msg = f'File {resolved_file} does not exist'
+            raise ValueError(msg)
+
+        try:
+            return record_resolution(self.objects_dir(), conflicted_hash, Path(resolved_file))
+        except MergeError as e:
+            msg = f'Error recording the resolution of {conflicted_hash}: {e}'
+            raise RepositoryError(msg) from e
+        except Exception as e:
+            msg = f'Error reading blob {conflicted_hash}'
+            raise RepositoryError(msg) from e
+
 
     def head_file(self) -> Path:
         """Get the path to the HEAD file within the repository.
@@ -723,3 +1366,229 @@ def branch_ref(branch: str) -> SymRef:
 def tag_ref(tag: str) -> SymRef:
     """Create a symbolic reference for a tag name."""
     return SymRef(f'{TAGS_DIR}/{tag}')
+
+
+def diff_path(diff: Diff) -> str:
+    """Get the full path of a diff's record from its parent chain.
+
+    :param diff: The diff whose path to build.
+    :return: The slash-separated path of the record from the root of the tree."""
+    names = []
+    current: Diff | None = diff
+    while current is not None and current.record.name:
+        names.append(current.record.name)
+        current = current.parent
+
+    return '/'.join(reversed(names))
+
+
+def _index_time_range(since: datetime | None, until: datetime | None) -> tuple[int | None, int | None]:
+    """Convert a time range to the whole-second timestamps of the commits it includes."""
+    return (math.ceil(since.timestamp()) if since is not None else None,
+            math.floor(until.timestamp()) if until is not None else None)
+
+
+def _matches_metadata(commit: Commit, author: str | None, message: str | None) -> bool:
+    """Check a commit against exact author and case-insensitive message filters."""
+    if author is not None and commit.author != author:
+        return False
+    return message is None or message.lower() in commit.message.lower()
+
+
+def _tree_entry_hash(objects_dir: Path, tree_hash: str | None, path: str) -> str | None:
+    """Get the hash of the record at a slash-separated path inside a tree, or None if there is no such record."""
+    record_hash = tree_hash
+    record_type = TreeRecordType.TREE
+
+    for name in path.split('/'):
+        if record_hash is None or record_type != TreeRecordType.TREE:
+            return None
+
+        record = load_tree(objects_dir, record_hash).records.get(name)
+        if record is None:
+            return None
+        record_hash, record_type = record.hash, record.type
+
+    return record_hash
+
+
+def _changes_any_path(objects_dir: Path, graph: CommitGraph, entry: CommitGraphEntry, paths: Sequence[str]) -> bool:
+    """Check whether a commit changed any of the given paths relative to its parent."""
+    changed_paths = graph.changed_paths(entry.position)
+    parent_tree = graph.entry(entry.parent_position).tree_hash if entry.parent_position is not None else None
+
+    for path in paths:
+        if changed_paths is not None and not changed_paths.might_contain(path):
+            continue
+        if _tree_entry_hash(objects_dir, entry.tree_hash, path) != _tree_entry_hash(objects_dir, parent_tree, path):
+            return True
+
+    return False
+
+
+def _changed_blobs(objects_dir: Path, diffs: Sequence[Diff]) -> Iterator[tuple[str, str | None, str | None]]:
+    """List the files behind a diff as (path, old blob hash, new blob hash), expanding added and removed trees.
+
+    A hash is None on the side where the file does not exist. Moves are listed once, from the side they were
+    moved to, with an 'old => new' path."""
+    stack = [(diff, '') for diff in reversed(diffs)]
+    while stack:
+        diff, prefix = stack.pop()
+        path = f'{prefix}{diff.record.name}'
+        stack.extend((child, f'{path}/') for child in reversed(diff.children))
+
+        match diff:
+            # Added and removed trees have children only when a pathspec made the diff search them
+            case AddedDiff(record, _, []):
+                yield from _record_blobs(objects_dir, path, record, added=True)
+            case RemovedDiff(record, _, []):
+                yield from _record_blobs(objects_dir, path, record, added=False)
+            case ModifiedDiff(record, _, _, new_record) if TreeRecordType.BLOB in (record.type, new_record.type):
+                if record.type == new_record.type:
+                    yield path, record.hash, new_record.hash
+                else:
+                    # A file replaced by a directory, or the other way around
+                    yield from _record_blobs(objects_dir, path, record, added=False)
+                    yield from _record_blobs(objects_dir, path, new_record, added=True)
+            case MovedFromDiff(record, _, _, moved_from) if moved_from is not None:
+                yield f'{diff_path(moved_from)} => {path}', moved_from.record.hash, record.hash
+
+
+def _record_blobs(objects_dir: Path, path: str, record: TreeRecord,
+                  added: bool) -> Iterator[tuple[str, str | None, str | None]]:
+    """List the files of an added or removed record, walking into it if it is a tree."""
+    stack = [(path, record)]
+    while stack:
+        current_path, current = stack.pop()
+        if current.type == TreeRecordType.TREE:
+            records = load_tree(objects_dir, current.hash).records
+            stack.extend((f'{current_path}/{name}', child) for name, child in reversed(records.items()))
+        elif added:
+            yield current_path, None, current.hash
+        else:
+            yield current_path, current.hash, None
+
+
+def _stream_diff(objects_dir: Path, old_tree_hash: str, new_tree_hash: str, move_window: int,
+                 paths: Sequence[str]) -> Iterator[DiffEntry]:
+    """Turn the native stream of tree changes into diff entries, pairing moves within a sliding window.
+
+    Every entry waits in the window until move_window later changes have been seen, so a move can still be
+    recorded on both sides before either is yielded. The output order is the order of the tree walk."""
+    window: deque[DiffEntry] = deque()
+    # Entries in the window that may still become one side of a move, oldest first, by record hash
+    pending_added: dict[str, deque[DiffEntry]] = defaultdict(deque)
+    pending_removed: dict[str, deque[DiffEntry]] = defaultdict(deque)
+
+    def unpend(pending: dict[str, deque[DiffEntry]], entry: DiffEntry) -> None:
+        entries = pending.get(entry.diff.record.hash)
+        if entries and entries[0] is entry:
+            entries.popleft()
+            if not entries:
+                del pending[entry.diff.record.hash]
+
+    try:
+        for change in stream_tree_diff(objects_dir, old_tree_hash, new_tree_hash, paths):
+            match change.kind:
+                case TreeChange.Kind.REMOVED:
+                    entry = DiffEntry(change.path, change.depth, RemovedDiff(change.old_record, None, []))
+                    _pair_or_pend(entry, pending_added, pending_removed, move_window)
+
+                case TreeChange.Kind.MODIFIED:
+                    entry = DiffEntry(change.path, change.depth,
+                                      ModifiedDiff(change.old_record, None, [], change.new_record))
+
+                case TreeChange.Kind.ADDED:
+                    entry = DiffEntry(change.path, change.depth, AddedDiff(change.new_record, None, []))
+                    _pair_or_pend(entry, pending_removed, pending_added, move_window)
+
+            window.append(entry)
+            if len(window) > move_window:
+                oldest = window.popleft()
+                unpend(pending_added, oldest)
+                unpend(pending_removed, oldest)
+                yield oldest
+    except Exception as e:
+        msg = 'Error loading tree'
+        raise RepositoryError(msg) from e
+
+    yield from window
+
+
+def _pair_or_pend(entry: DiffEntry, counterparts: dict[str, deque[DiffEntry]], pending: dict[str, deque[DiffEntry]],
+                  move_window: int) -> None:
+    """Pair an added or removed entry with the oldest pending entry of the opposite kind and the same hash, or
+    leave it pending itself."""
+    record_hash = entry.diff.record.hash
+    others = counterparts.get(record_hash)
+    if not others:
+        if move_window:
+            pending[record_hash].append(entry)
+        return
+
+    other = others.popleft()
+    if not others:
+        del counterparts[record_hash]
+
+    removed, added = (entry, other) if isinstance(entry.diff, RemovedDiff) else (other, entry)
+    moved_to_diff = MovedToDiff(removed.diff.record, None, [], None)
+    moved_from_diff = MovedFromDiff(added.diff.record, None, [], moved_to_diff)
+    moved_to_diff.moved_to = moved_from_diff
+
+    removed.diff, removed.other_path = moved_to_diff, added.path
+    added.diff, added.other_path = moved_from_diff, removed.path
+
+
+def _resolve_moves(added_by_hash: dict[str, list[tuple[Diff, int]]],
+                   removed_by_hash: dict[str, list[tuple[Diff, int]]]) -> \
+        tuple[list[tuple[Diff, int]], list[tuple[Diff, int]]]:
+    """Pair removed and added records with the same hash into moves, replacing them in place.
+
+    Records are paired in the order they were found. Each side of a move replaces the original diff at its
+    recorded position, so no children list is rebuilt.
+
+    :param added_by_hash: Added diffs and their positions in their parents' children, by record hash.
+    :param removed_by_hash: Removed diffs and their positions in their parents' children, by record hash.
+    :return: The added and the removed diffs that were left unpaired, with their positions."""
+    unpaired_removed: list[tuple[Diff, int]] = []
+    for record_hash, removed_diffs in removed_by_hash.items():
+        added_diffs = added_by_hash.pop(record_hash, [])
+        for removed, added in zip(removed_diffs, added_diffs):
+            _replace_with_move(removed, added)
+
+        unpaired_removed.extend(removed_diffs[len(added_diffs):])
+        if len(added_diffs) > len(removed_diffs):
+            added_by_hash[record_hash] = added_diffs[len(removed_diffs):]
+
+    unpaired_added = [added for added_diffs in added_by_hash.values() for added in added_diffs]
+    return unpaired_added, unpaired_removed
+
+
+def _resolve_similar_moves(objects_dir: Path, added: list[tuple[Diff, int]], removed: list[tuple[Diff, int]],
+                           threshold: float) -> None:
+    """Pair removed and added files whose contents are similar into moves, replacing them in place.
+
+    :param objects_dir: The objects directory to read blob contents from.
+    :param added: Added diffs that were not paired by hash, with their positions.
+    :param removed: Removed diffs that were not paired by hash, with their positions.
+    :param threshold: The minimum similarity, between 0 and 1."""
+    added = [item for item in added if item[0].record.type == TreeRecordType.BLOB]
+    removed = [item for item in removed if item[0].record.type == TreeRecordType.BLOB]
+
+    pairs = find_similar_pairs(objects_dir, [diff.record.hash for diff, _ in removed],
+                               [diff.record.hash for diff, _ in added], threshold)
+    for removed_index, added_index, similarity in pairs:
+        _replace_with_move(removed[removed_index], added[added_index], similarity)
+
+
+def _replace_with_move(removed: tuple[Diff, int], added: tuple[Diff, int], similarity: float = 1.0) -> None:
+    """Replace a removed and an added diff by the two linked sides of a move."""
+    removed_diff, removed_index = removed
+    added_diff, added_index = added
+
+    moved_to_diff = MovedToDiff(removed_diff.record, removed_diff.parent, [], None, similarity)
+    moved_from_diff = MovedFromDiff(added_diff.record, added_diff.parent, [], moved_to_diff, similarity)
+    moved_to_diff.moved_to = moved_from_diff
+
+    removed_diff.parent.children[removed_index] = moved_to_diff
+    added_diff.parent.children[added_index] = moved_from_diff
@@ -0,0 +1,138 @@
+"""Content similarity between blobs, for detecting edited renames."""
+
+import hashlib
+import heapq
+from array import array
+from collections import Counter, defaultdict
+from collections.abc import Sequence
+from pathlib import Path
+
+from .cache import ObjectCache
+from .plumbing import open_content_for_reading
+
+SKETCH_CACHE = 'sketches'
+
+# Number of smallest line hashes kept per blob (a bottom-k MinHash sketch)
+SKETCH_SIZE = 128
+# Sketch values shared by more blobs than this are too common (blank lines, license headers) to pick candidates
+MAX_POSTINGS = 64
+# Most similar-looking new blobs scored for each old blob
+MAX_CANDIDATES = 16
+
+DEFAULT_RENAME_THRESHOLD = 0.5
+
+
+def _line_hash(line: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(line, digest_size=8).digest(), 'little')
+
+
+def compute_sketch(content: bytes) -> array:
+    """Compute the bottom-k MinHash sketch of a blob's content.
+
+    The content is treated as a set of lines; the sketch keeps the SKETCH_SIZE smallest line hashes.
+
+    :param content: The blob content.
+    :return: The sketch, sorted ascending."""
+    return array('Q', heapq.nsmallest(SKETCH_SIZE, {_line_hash(line) for line in content.splitlines()}))
+
+
+def estimate_similarity(sketch1: Sequence[int], sketch2: Sequence[int]) -> float:
+    """Estimate the Jaccard similarity of the line sets behind two sketches.
+
+    The estimate is the fraction of the k smallest hashes of the union that appear in both sketches.
+
+    :param sketch1: A sorted sketch.
+    :param sketch2: Another sorted sketch.
+    :return: The estimated similarity, between 0 and 1. Empty content is not similar to anything."""
+    if not sketch1 or not sketch2:
+        return 0.0
+
+    set1 = set(sketch1)
+    set2 = set(sketch2)
+    union = heapq.nsmallest(min(SKETCH_SIZE, len(set1 | set2)), set1 | set2)
+    shared = sum(1 for value in union if value in set1 and value in set2)
+
+    return shared / len(union)
+
+
+def load_sketch(objects_dir: str | Path, blob_hash: str, cache: ObjectCache | None = None) -> array:
+    """Get the sketch of a blob, computing and caching it if needed.
+
+    :param objects_dir: The objects directory to read the blob from.
+    :param blob_hash: The hash of the blob.
+    :param cache: The sketch cache, or None to always compute the sketch.
+    :return: The sketch."""
+    if cache is not None:
+        cached = cache.get(blob_hash)
+        if cached is not None:
+            return array('Q', cached)
+
+    with open_content_for_reading(objects_dir, blob_hash) as f:
+        sketch = compute_sketch(f.read())
+
+    if cache is not None:
+        cache.put(blob_hash, sketch.tobytes())
+
+    return sketch
+
+
+def find_similar_pairs(objects_dir: str | Path, old_hashes: Sequence[str], new_hashes: Sequence[str],
+                       threshold: float = DEFAULT_RENAME_THRESHOLD) -> list[tuple[int, int, float]]:
+    """Pair up old and new blobs whose contents are similar.
+
+    Candidates come from an inverted index over sketch values, so only blobs sharing at least one uncommon line
+    are compared, and each old blob scores at most MAX_CANDIDATES of them. Pairs are then chosen greedily from
+    the most similar down, each blob being used at most once.
+
+    :param objects_dir: The objects directory to read blobs and cache sketches in.
+    :param old_hashes: The blobs that disappeared.
+    :param new_hashes: The blobs that appeared.
+    :param threshold: The minimum similarity of a pair, between 0 and 1.
+    :return: (old index, new index, similarity) triples, most similar first.
+    :raises ValueError: If threshold is not between 0 and 1."""
+    if not 0 <= threshold <= 1:
+        msg = 'threshold must be between 0 and 1'
+        raise ValueError(msg)
+
+    if not old_hashes or not new_hashes:
+        return []
+
+    cache = ObjectCache(objects_dir, SKETCH_CACHE)
+    sketches: dict[str, array] = {}
+    for blob_hash in {*old_hashes, *new_hashes}:
+        sketches[blob_hash] = load_sketch(objects_dir, blob_hash, cache)
+
+    postings: dict[int, list[int]] = defaultdict(list)
+    for new_index, new_hash in enumerate(new_hashes):
+        for value in sketches[new_hash]:
+            postings[value].append(new_index)
+
+    scored: list[tuple[float, int, int]] = []
+    for old_index, old_hash in enumerate(old_hashes):
+        old_sketch = sketches[old_hash]
+
+        shared_values: Counter[int] = Counter()
+        for value in old_sketch:
+            matches = postings.get(value)
+            if matches and len(matches) <= MAX_POSTINGS:
+                shared_values.update(matches)
+
+        for new_index, _ in shared_values.most_common(MAX_CANDIDATES):
+            similarity = estimate_similarity(old_sketch, sketches[new_hashes[new_index]])
+            if similarity >= threshold:
+                scored.append((similarity, old_index, new_index))
+
+    # Most similar first; ties go to the earliest old, then new, blob so the pairing is deterministic
+    scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+
+    used_old: set[int] = set()
+    used_new: set[int] = set()
+    pairs: list[tuple[int, int, float]] = []
+    for similarity, old_index, new_index in scored:
+        if old_index in used_old or new_index in used_new:
+            continue
+        used_old.add(old_index)
+        used_new.add(new_index)
+        pairs.append((old_index, new_index, similarity))
+
+    return pairs
@@ -0,0 +1,94 @@
+"""Stat cache of working directory file hashes, so unchanged files are not hashed again."""
+
+import os
+import struct
+import time
+from pathlib import Path
+
+from .constants import HASH_LENGTH
+from .plumbing import hash_file
+
+STAT_CACHE_SIGNATURE = b'CSTC'
+STAT_CACHE_VERSION = 1
+
+# Header: signature, format version, time the cache was written in nanoseconds, number of entries
+_HEADER = struct.Struct('<4sIqI')
+# Entry: modification time in nanoseconds, size, inode, hash, length of the path that follows
+_ENTRY = struct.Struct(f'<qQQ{HASH_LENGTH // 2}sH')
+
+
+class StatCache:
+    """Blob hashes of working directory files, keyed by path and validated against stat data.
+
+    An entry is only trusted if the file's modification time, size and inode still match. A file modified no
+    earlier than the cache was written is hashed again even if they do: it could have changed again within the
+    same timestamp tick, right after it was recorded."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._entries: dict[str, tuple[int, int, int, str]] = {}
+        self._seen: dict[str, tuple[int, int, int, str]] = {}
+        self._written_ns = 0
+        self._dirty = False
+
+        if not path.exists():
+            return
+
+        data = memoryview(path.read_bytes())
+        if len(data) < _HEADER.size:
+            return
+
+        signature, version, written_ns, count = _HEADER.unpack_from(data, 0)
+        if signature != STAT_CACHE_SIGNATURE or version != STAT_CACHE_VERSION:
+            # An unknown format is treated as an empty cache and gets rewritten on the next save
+            return
+
+        self._written_ns = written_ns
+        offset = _HEADER.size
+        for _ in range(count):
+            mtime_ns, size, inode, hash_bytes, path_length = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            file_path = bytes(data[offset:offset + path_length]).decode('utf-8', errors='surrogateescape')
+            offset += path_length
+            self._entries[file_path] = (mtime_ns, size, inode, hash_bytes.hex())
+
+    def file_hash(self, relative_path: str, file_path: Path) -> str:
+        """Get the blob hash of a file, hashing its content only if its stat data changed since it was recorded.
+
+        :param relative_path: The path of the file relative to the working directory, used as the key.
+        :param file_path: The path to the file on disk.
+        :return: The hash of the file's content."""
+        stat = file_path.stat()
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+        entry = self._entries.get(relative_path)
+        if entry is not None and entry[:3] == key and stat.st_mtime_ns < self._written_ns:
+            self._seen[relative_path] = entry
+            return entry[3]
+
+        file_hash = hash_file(file_path)
+        self._seen[relative_path] = (*key, file_hash)
+        self._dirty = True
+        return file_hash
+
+    def save(self) -> None:
+        """Write the entries looked up since the cache was loaded atomically, dropping those of files that were
+        not looked up, if anything changed."""
+        if not self._dirty and len(self._seen) == len(self._entries):
+            return
+
+        written_ns = time.time_ns()
+        parts = [_HEADER.pack(STAT_CACHE_SIGNATURE, STAT_CACHE_VERSION, written_ns, len(self._seen))]
+        for relative_path, (mtime_ns, size, inode, file_hash) in self._seen.items():
+            encoded_path = relative_path.encode('utf-8', errors='surrogateescape')
+            parts.append(_ENTRY.pack(mtime_ns, size, inode, bytes.fromhex(file_hash), len(encoded_path)))
+            parts.append(encoded_path)
+
+        tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+        with tmp_path.open('wb') as f:
+            f.write(b''.join(parts))
+        os.replace(tmp_path, self.path)
+
+        self._entries = dict(self._seen)
+        self._written_ns = written_ns
+        self._dirty = False
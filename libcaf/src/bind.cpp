@@ -3,6 +3,8 @@
 #include "caf.h"
 #include "hash_types.h"
 #include "object_io.h" 
+#include "diff.h"
+#include "tree_diff.h"
 
 using namespace std;
 namespace py = pybind11;
@@ -17,6 +19,18 @@ PYBIND11_MODULE(_libcaf, m) {
     m.def("delete_content", delete_content);
     m.def("open_content_for_reading", open_content_for_reading);
 
+    py::class_<ObjectWriter>(m, "ObjectWriter")
+        .def(py::init<const std::string&>(), py::arg("root_dir"))
+        .def("write", [](ObjectWriter& self, py::buffer buffer) {
+            const py::buffer_info info = buffer.request();
+            self.write(static_cast<const char*>(info.ptr), info.size * info.itemsize);
+        }, py::arg("data"))
+        .def("commit", &ObjectWriter::commit)
+        .def("abort", &ObjectWriter::abort)
+        .def("__enter__", [](ObjectWriter& self) -> ObjectWriter& { return self; },
+             py::return_value_policy::reference)
+        .def("__exit__", [](ObjectWriter& self, py::object, py::object, py::object) { self.abort(); });
+
     // hash_types
     m.def("hash_object", py::overload_cast<const Blob&>(&hash_object), py::arg("blob"));
     m.def("hash_object", py::overload_cast<const Tree&>(&hash_object), py::arg("tree"));
@@ -28,6 +42,66 @@ PYBIND11_MODULE(_libcaf, m) {
     m.def("save_tree", &save_tree);
     m.def("load_tree", &load_tree);
 
+    py::class_<TreeRecordStream>(m, "TreeRecordStream")
+        .def(py::init<const std::string&, const std::string&>(), py::arg("root_dir"), py::arg("tree_hash"))
+        .def("next", &TreeRecordStream::next, py::arg("max_records"), py::call_guard<py::gil_scoped_release>());
+
+    py::class_<TreeWriter>(m, "TreeWriter")
+        .def(py::init<const std::string&>(), py::arg("root_dir"))
+        .def("add", [](TreeWriter& self, const std::vector<TreeRecord>& records) {
+            for (const TreeRecord& record : records)
+                self.add(record);
+        }, py::arg("records"))
+        .def("commit", &TreeWriter::commit)
+        .def("abort", &TreeWriter::abort)
+        .def("__enter__", [](TreeWriter& self) -> TreeWriter& { return self; }, py::return_value_policy::reference)
+        .def("__exit__", [](TreeWriter& self, py::object, py::object, py::object) { self.abort(); });
+
+    // diff
+    m.def("diff_lines", &diff_lines, py::call_guard<py::gil_scoped_release>());
+    m.def("count_lines", &count_lines, py::call_guard<py::gil_scoped_release>());
+    m.def("diff_stat", &diff_stat, py::call_guard<py::gil_scoped_release>());
+    m.def("line_offsets", [](py::buffer buffer) {
+        std::vector<uint64_t> offsets;
+        {
+            // The view is released before returning, so the buffer's owner (e.g. an mmap) can be closed
+            const py::buffer_info info = buffer.request();
+            py::gil_scoped_release release;
+            offsets = line_offsets(static_cast<const char*>(info.ptr), info.size * info.itemsize);
+        }
+        return py::bytes(reinterpret_cast<const char*>(offsets.data()), offsets.size() * sizeof(uint64_t));
+    }, py::arg("buffer"));
+    m.def("merge_text", &merge_text, py::arg("root_dir"), py::arg("base_hash"), py::arg("ours_hash"),
+          py::arg("theirs_hash"), py::call_guard<py::gil_scoped_release>());
+    m.def("merge_regions", &merge_regions, py::arg("root_dir"), py::arg("base_hash"), py::arg("ours_hash"),
+          py::arg("theirs_hash"), py::call_guard<py::gil_scoped_release>());
+
+    py::class_<MergeRegion> merge_region(m, "MergeRegion");
+    merge_region
+        .def_readonly("kind", &MergeRegion::kind)
+        .def_readonly("base_start", &MergeRegion::base_start)
+        .def_readonly("base_end", &MergeRegion::base_end)
+        .def_readonly("ours_start", &MergeRegion::ours_start)
+        .def_readonly("ours_end", &MergeRegion::ours_end)
+        .def_readonly("theirs_start", &MergeRegion::theirs_start)
+        .def_readonly("theirs_end", &MergeRegion::theirs_end);
+
+    py::enum_<MergeRegion::Kind>(merge_region, "Kind")
+    .value("UNCHANGED", MergeRegion::Kind::UNCHANGED)
+    .value("OURS", MergeRegion::Kind::OURS)
+    .value("THEIRS", MergeRegion::Kind::THEIRS)
+    .value("SAME", MergeRegion::Kind::SAME)
+    .value("CONFLICT", MergeRegion::Kind::CONFLICT);
+
+    py::class_<TreeCache>(m, "TreeCache")
+        .def(py::init<size_t>(), py::arg("capacity"))
+        .def_property_readonly("size", &TreeCache::size)
+        .def_property_readonly("hits", &TreeCache::hits)
+        .def_property_readonly("misses", &TreeCache::misses);
+    m.def("diff_trees", &diff_trees, py::arg("root_dir"), py::arg("old_tree_hash"), py::arg("new_tree_hash"),
+          py::arg("paths") = std::vector<std::string>(), py::arg("cache") = nullptr,
+          py::call_guard<py::gil_scoped_release>());
+
     py::class_<Blob>(m, "Blob")
     .def(py::init<std::string>())
     .def_readonly("hash", &Blob::hash);
@@ -58,4 +132,29 @@ PYBIND11_MODULE(_libcaf, m) {
         .def_readonly("message", &Commit::message)
         .def_readonly("timestamp", &Commit::timestamp)
         .def_readonly("parent", &Commit::parent);
+
+    py::class_<TreeChange> tree_change(m, "TreeChange");
+    tree_change
+        .def_readonly("parent", &TreeChange::parent)
+        .def_readonly("kind", &TreeChange::kind)
+        .def_readonly("old_record", &TreeChange::old_record)
+        .def_readonly("new_record", &TreeChange::new_record);
+
+    py::enum_<TreeChange::Kind>(tree_change, "Kind")
+    .value("ADDED", TreeChange::Kind::ADDED)
+    .value("REMOVED", TreeChange::Kind::REMOVED)
+    .value("MODIFIED", TreeChange::Kind::MODIFIED);
+
+    py::class_<PathChange>(m, "PathChange")
+        .def_readonly("kind", &PathChange::kind)
+        .def_readonly("depth", &PathChange::depth)
+        .def_readonly("path", &PathChange::path)
+        .def_readonly("old_record", &PathChange::old_record)
+        .def_readonly("new_record", &PathChange::new_record);
+
+    py::class_<TreeDiffStream>(m, "TreeDiffStream")
+        .def(py::init<const std::string&, const std::string&, const std::string&, const std::vector<std::string>&>(),
+             py::arg("root_dir"), py::arg("old_tree_hash"), py::arg("new_tree_hash"),
+             py::arg("paths") = std::vector<std::string>())
+        .def("next", &TreeDiffStream::next, py::arg("max_changes"), py::call_guard<py::gil_scoped_release>());
 }
\ No newline at end of file
@@ -22,6 +22,7 @@
 
 constexpr size_t BUFFER_SIZE = 4096;
 constexpr size_t DIR_NAME_SIZE = 2;
+constexpr size_t OBJECT_WRITER_BUFFER_SIZE = 64 * 1024;
 
 std::string create_sub_dir(const std::string& content_root_dir, const std::string& hash);
 void lock_file_with_timeout(int fd, int operation, int timeout_sec);
@@ -238,8 +239,9 @@ int open_content_for_reading(const std::string& content_root_dir, const std::str
     if (fd < 0)
         throw std::runtime_error("Failed to open file");
 
+    // Readers share the lock, so they only wait for writers, and never for each other
     try{
-        lock_file_with_timeout(fd, LOCK_EX, 10);
+        lock_file_with_timeout(fd, LOCK_SH, 10);
     } catch (const std::exception& e){
         close(fd);
         throw;
@@ -248,6 +250,154 @@ int open_content_for_reading(const std::string& content_root_dir, const std::str
     return fd;
 }
 
+Sha1::Sha1() {
+    mdctx = EVP_MD_CTX_new();
+    if (!mdctx)
+        throw std::runtime_error("Failed to create EVP_MD_CTX");
+
+    if (EVP_DigestInit_ex(mdctx, EVP_sha1(), nullptr) != 1) {
+        EVP_MD_CTX_free(mdctx);
+        throw std::runtime_error("Failed to initialize digest");
+    }
+}
+
+Sha1::~Sha1() {
+    EVP_MD_CTX_free(mdctx);
+}
+
+void Sha1::update(const char* data, size_t size) {
+    if (EVP_DigestUpdate(mdctx, data, size) != 1)
+        throw std::runtime_error("Failed to update digest");
+}
+
+std::string Sha1::hex_digest() {
+    unsigned char hash[EVP_MAX_MD_SIZE];
+    unsigned int hash_len;
+    if (EVP_DigestFinal_ex(mdctx, hash, &hash_len) != 1)
+        throw std::runtime_error("Failed to finalize digest");
+
+    std::ostringstream oss;
+    oss << std::hex << std::setfill('0');
+    for (unsigned int i = 0; i < hash_len; ++i) {
+        oss << std::setw(2) << static_cast<unsigned int>(hash[i]);
+    }
+
+    return oss.str();
+}
+
+TempObjectFile::TempObjectFile(const std::string& content_root_dir)
+    : content_root_dir(content_root_dir), fd(-1), buffer(OBJECT_WRITER_BUFFER_SIZE), buffered(0) {
+    std::error_code ec;
+    std::filesystem::create_directories(content_root_dir, ec);
+    if (ec && ec != std::errc::file_exists) {
+        throw std::runtime_error("Failed to create root directory: " + ec.message());
+    }
+
+    // In the content root rather than a sub directory, so it is never mistaken for an object
+    std::string path_template = content_root_dir + "/.tmp-object-XXXXXX";
+    fd = mkstemp(path_template.data());
+    if (fd < 0)
+        throw std::runtime_error("Failed to create temporary object file");
+    fchmod(fd, 0644);
+    tmp_path = path_template;
+}
+
+TempObjectFile::~TempObjectFile() {
+    abort();
+}
+
+void TempObjectFile::write(const char* data, size_t size) {
+    if (fd < 0)
+        throw std::runtime_error("Object writer is closed");
+
+    if (buffered + size > buffer.size()) {
+        flush();
+        if (size >= buffer.size()) {
+            buffer.assign(data, data + size);
+            buffered = size;
+            flush();
+            buffer.resize(OBJECT_WRITER_BUFFER_SIZE);
+            return;
+        }
+    }
+
+    memcpy(buffer.data() + buffered, data, size);
+    buffered += size;
+}
+
+void TempObjectFile::write_at(size_t offset, const char* data, size_t size) {
+    if (fd < 0)
+        throw std::runtime_error("Object writer is closed");
+
+    flush();
+    if (pwrite(fd, data, size, static_cast<off_t>(offset)) != static_cast<ssize_t>(size))
+        throw std::runtime_error("Failed to write temporary object file");
+}
+
+void TempObjectFile::flush() {
+    const char* cursor = buffer.data();
+    while (buffered > 0) {
+        const ssize_t written = ::write(fd, cursor, buffered);
+        if (written < 0) {
+            if (errno == EINTR)
+                continue;
+            throw std::runtime_error("Failed to write temporary object file");
+        }
+        cursor += written;
+        buffered -= written;
+    }
+}
+
+void TempObjectFile::publish(const std::string& hash) {
+    if (fd < 0)
+        throw std::runtime_error("Object writer is closed");
+
+    std::string content_path;
+    try {
+        flush();
+        close_file();
+        create_content_path(content_root_dir, hash, content_path);
+    } catch (const std::exception& e) {
+        abort();
+        throw;
+    }
+
+    // Objects are immutable, so replacing an existing one with the same content is harmless, and readers
+    // holding it open keep reading the file they opened
+    if (rename(tmp_path.c_str(), content_path.c_str()) != 0) {
+        abort();
+        throw std::runtime_error("Failed to publish object " + hash);
+    }
+    tmp_path.clear();
+}
+
+void TempObjectFile::abort() {
+    close_file();
+    if (!tmp_path.empty()) {
+        unlink(tmp_path.c_str());
+        tmp_path.clear();
+    }
+}
+
+void TempObjectFile::close_file() {
+    if (fd >= 0) {
+        close(fd);
+        fd = -1;
+    }
+    buffered = 0;
+}
+
+void ObjectWriter::write(const char* data, size_t size) {
+    file.write(data, size);
+    digest.update(data, size);
+}
+
+std::string ObjectWriter::commit() {
+    const std::string object_hash = digest.hex_digest();
+    file.publish(object_hash);
+    return object_hash;
+}
+
 void copy_file(const std::string& src, const std::string& dest) {
     std::ifstream source_file(src, std::ios::binary);
     if (!source_file) {
@@ -4,6 +4,8 @@
 #include <unistd.h>
 #include <string>
 #include <cstddef>
+#include <vector>
+#include <openssl/evp.h>
 
 #include "blob.h"
 
@@ -13,9 +15,72 @@ std::string hash_file(const std::string& file_path);
 std::string hash_string(const std::string& content);
 
 Blob save_file_content(const std::string& content_root_dir, const std::string& file_path);
+// Open an object for reading under a shared lock, which writers and delete_content wait for
 int open_content_for_reading(const std::string& content_root_dir, const std::string& content_hash);
 int open_content_for_writing(const std::string& content_root_dir, const std::string& content_hash);
 
 void delete_content(const std::string& content_root_dir, const std::string& content_hash);
 
+// Incremental SHA-1, the hash of objects
+class Sha1 {
+public:
+    Sha1();
+    ~Sha1();
+
+    Sha1(const Sha1&) = delete;
+    Sha1& operator=(const Sha1&) = delete;
+
+    void update(const char* data, size_t size);
+    // The hex digest of everything updated so far; the digest cannot be updated any more
+    std::string hex_digest();
+
+private:
+    EVP_MD_CTX* mdctx;
+};
+
+// A buffered temporary file in the content root, which publish() renames into place under an object's hash,
+// so the object is never seen partially written. The file is removed if it is not published.
+class TempObjectFile {
+public:
+    explicit TempObjectFile(const std::string& content_root_dir);
+    ~TempObjectFile();
+
+    TempObjectFile(const TempObjectFile&) = delete;
+    TempObjectFile& operator=(const TempObjectFile&) = delete;
+
+    void write(const char* data, size_t size);
+    // Overwrite bytes written before, e.g. a header only known at the end
+    void write_at(size_t offset, const char* data, size_t size);
+    void publish(const std::string& hash);
+    // Discard the content written so far
+    void abort();
+
+private:
+    void flush();
+    void close_file();
+
+    std::string content_root_dir;
+    std::string tmp_path;
+    int fd;
+    std::vector<char> buffer;
+    size_t buffered;
+};
+
+// Writes an object whose hash is only known once all of its content has been written. The content is hashed
+// as it is written to a temporary file in the content root, which commit() then renames into place.
+class ObjectWriter {
+public:
+    explicit ObjectWriter(const std::string& content_root_dir) : file(content_root_dir) {}
+
+    void write(const char* data, size_t size);
+    // Publish the object and return its hash
+    std::string commit();
+    // Discard the content written so far
+    void abort() { file.abort(); }
+
+private:
+    TempObjectFile file;
+    Sha1 digest;
+};
+
 #endif // CAF_H
\ No newline at end of file
@@ -0,0 +1,497 @@
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <memory>
+#include <stdexcept>
+#include <string_view>
+#include <unordered_map>
+
+#include "caf.h"
+#include "diff.h"
+#include "mapped_blob.h"
+
+namespace {
+
+// Replaces every line by a small integer, equal lines getting equal ids, so that diffs compare integers.
+// Lines of all blobs interned by the same interner share ids.
+class LineInterner {
+public:
+    explicit LineInterner(size_t expected_lines) { ids.reserve(expected_lines); }
+
+    std::vector<uint32_t> intern(const MappedBlob& blob) {
+        std::vector<uint32_t> line_ids;
+        line_ids.reserve(blob.line_count());
+        for (size_t i = 0; i < blob.line_count(); ++i) {
+            auto [it, inserted] = ids.try_emplace(blob.line(i), static_cast<uint32_t>(ids.size()));
+            line_ids.push_back(it->second);
+        }
+        return line_ids;
+    }
+
+private:
+    std::unordered_map<std::string_view, uint32_t> ids;
+};
+
+// Myers' O(ND) difference algorithm with the linear-space refinement: find the middle snake of an optimal
+// edit script, then recurse on the two halves around it. Changed lines are marked in old_changed/new_changed.
+class MyersDiff {
+public:
+    MyersDiff(const std::vector<uint32_t>& a, const std::vector<uint32_t>& b)
+        : a(a), b(b), old_changed(a.size(), false), new_changed(b.size(), false) {
+        size_t diagonals = 2 * (a.size() + b.size()) + 3;
+        forward.resize(diagonals);
+        backward.resize(diagonals);
+    }
+
+    void run() { compare(0, a.size(), 0, b.size()); }
+
+    std::vector<ChangeBlock> blocks() const {
+        std::vector<ChangeBlock> result;
+        size_t i = 0, j = 0;
+        while (i < a.size() || j < b.size()) {
+            if (i < a.size() && j < b.size() && !old_changed[i] && !new_changed[j]) {
+                ++i;
+                ++j;
+                continue;
+            }
+
+            size_t old_start = i, new_start = j;
+            while (i < a.size() && old_changed[i])
+                ++i;
+            while (j < b.size() && new_changed[j])
+                ++j;
+            result.emplace_back(old_start, i - old_start, new_start, j - new_start);
+        }
+
+        return result;
+    }
+
+private:
+    const std::vector<uint32_t>& a;
+    const std::vector<uint32_t>& b;
+    std::vector<bool> old_changed;
+    std::vector<bool> new_changed;
+    std::vector<long> forward;
+    std::vector<long> backward;
+
+    struct Snake {
+        long x_start, y_start, x_end, y_end;
+    };
+
+    void compare(size_t a_lo, size_t a_hi, size_t b_lo, size_t b_hi) {
+        while (a_lo < a_hi && b_lo < b_hi && a[a_lo] == b[b_lo]) {
+            ++a_lo;
+            ++b_lo;
+        }
+        while (a_lo < a_hi && b_lo < b_hi && a[a_hi - 1] == b[b_hi - 1]) {
+            --a_hi;
+            --b_hi;
+        }
+
+        if (a_lo == a_hi) {
+            for (size_t j = b_lo; j < b_hi; ++j)
+                new_changed[j] = true;
+            return;
+        }
+        if (b_lo == b_hi) {
+            for (size_t i = a_lo; i < a_hi; ++i)
+                old_changed[i] = true;
+            return;
+        }
+
+        Snake snake = middle_snake(a_lo, a_hi, b_lo, b_hi);
+        compare(a_lo, a_lo + snake.x_start, b_lo, b_lo + snake.y_start);
+        compare(a_lo + snake.x_end, a_hi, b_lo + snake.y_end, b_hi);
+    }
+
+    Snake middle_snake(size_t a_lo, size_t a_hi, size_t b_lo, size_t b_hi) {
+        const long n = static_cast<long>(a_hi - a_lo);
+        const long m = static_cast<long>(b_hi - b_lo);
+        const long delta = n - m;
+        const bool odd = (delta & 1) != 0;
+        const long max_d = (n + m + 1) / 2;
+        const long offset = max_d + 1;
+
+        long* vf = forward.data() + offset;
+        long* vb = backward.data() + offset;
+        vf[1] = 0;
+        vb[1] = 0;
+
+        for (long d = 0; d <= max_d; ++d) {
+            for (long k = -d; k <= d; k += 2) {
+                long x = (k == -d || (k != d && vf[k - 1] < vf[k + 1])) ? vf[k + 1] : vf[k - 1] + 1;
+                long y = x - k;
+                const long x_start = x, y_start = y;
+                while (x < n && y < m && a[a_lo + x] == b[b_lo + y]) {
+                    ++x;
+                    ++y;
+                }
+                vf[k] = x;
+
+                const long c = delta - k;
+                if (odd && c >= -(d - 1) && c <= d - 1 && vf[k] + vb[c] >= n)
+                    return {x_start, y_start, x, y};
+            }
+
+            for (long c = -d; c <= d; c += 2) {
+                long x = (c == -d || (c != d && vb[c - 1] < vb[c + 1])) ? vb[c + 1] : vb[c - 1] + 1;
+                long y = x - c;
+                const long x_start = x, y_start = y;
+                while (x < n && y < m && a[a_hi - 1 - x] == b[b_hi - 1 - y]) {
+                    ++x;
+                    ++y;
+                }
+                vb[c] = x;
+
+                const long k = delta - c;
+                if (!odd && k >= -d && k <= d && vb[c] + vf[k] >= n)
+                    return {n - x, m - y, n - x_start, m - y_start};
+            }
+        }
+
+        // Unreachable: an edit script of length at most n + m always exists
+        return {0, 0, n, m};
+    }
+};
+
+std::vector<ChangeBlock> diff_ids(const std::vector<uint32_t>& a, const std::vector<uint32_t>& b) {
+    MyersDiff diff(a, b);
+    diff.run();
+    return diff.blocks();
+}
+
+// A run of lines equal in two sequences: (start in the first, start in the second, length)
+using MatchingBlock = std::tuple<size_t, size_t, size_t>;
+
+// The matching blocks of two sequences exactly as difflib.SequenceMatcher finds them for merge3: the longest
+// run of equal lines is matched first, then the stretches on either side of it, recursively. There is no junk,
+// but with at least 200 lines in b, the lines making up more than 1% of it are popular, as with autojunk: they
+// never start a match, though they may extend one.
+class SequenceMatcher {
+public:
+    SequenceMatcher(const std::vector<uint32_t>& a, const std::vector<uint32_t>& b)
+        : a(a), b(b), lengths(b.size() + 1, 0), next_lengths(b.size() + 1, 0) {
+        uint32_t id_count = 0;
+        for (uint32_t id : b)
+            id_count = std::max(id_count, id + 1);
+
+        // The positions of each line of b, in order, grouped by line id
+        starts.assign(id_count + 1, 0);
+        for (uint32_t id : b)
+            ++starts[id + 1];
+        const size_t popular_count = b.size() / 100 + 1;
+        for (uint32_t id = 0; id < id_count; ++id) {
+            if (b.size() >= 200 && starts[id + 1] > popular_count)
+                starts[id + 1] = 0;
+            starts[id + 1] += starts[id];
+        }
+        positions.resize(starts[id_count]);
+        std::vector<size_t> filled(starts.begin(), starts.end() - 1);
+        for (size_t j = 0; j < b.size(); ++j) {
+            if (filled[b[j]] < starts[b[j] + 1])
+                positions[filled[b[j]]++] = j;
+        }
+    }
+
+    std::vector<MatchingBlock> matching_blocks() {
+        std::vector<MatchingBlock> blocks;
+        std::vector<std::tuple<size_t, size_t, size_t, size_t>> queue{{0, a.size(), 0, b.size()}};
+        while (!queue.empty()) {
+            const auto [a_low, a_high, b_low, b_high] = queue.back();
+            queue.pop_back();
+            const auto [i, j, k] = longest_match(a_low, a_high, b_low, b_high);
+            if (k == 0)
+                continue;
+
+            blocks.emplace_back(i, j, k);
+            if (a_low < i && b_low < j)
+                queue.emplace_back(a_low, i, b_low, j);
+            if (i + k < a_high && j + k < b_high)
+                queue.emplace_back(i + k, a_high, j + k, b_high);
+        }
+        std::sort(blocks.begin(), blocks.end());
+
+        // Adjacent blocks are joined
+        std::vector<MatchingBlock> joined;
+        for (const auto& [i, j, k] : blocks) {
+            if (!joined.empty()) {
+                auto& [last_i, last_j, last_k] = joined.back();
+                if (last_i + last_k == i && last_j + last_k == j) {
+                    last_k += k;
+                    continue;
+                }
+            }
+            joined.emplace_back(i, j, k);
+        }
+
+        return joined;
+    }
+
+private:
+    const std::vector<uint32_t>& a;
+    const std::vector<uint32_t>& b;
+    std::vector<size_t> starts;
+    std::vector<size_t> positions;
+    // Length of the run of equal lines ending at a[i - 1] and b[j - 1], indexed by j, for the previous and
+    // the current i; only the touched entries are cleared again
+    std::vector<size_t> lengths;
+    std::vector<size_t> next_lengths;
+    std::vector<size_t> touched;
+    std::vector<size_t> next_touched;
+
+    MatchingBlock longest_match(size_t a_low, size_t a_high, size_t b_low, size_t b_high) {
+        size_t best_i = a_low, best_j = b_low, best_size = 0;
+        for (size_t i = a_low; i < a_high; ++i) {
+            if (a[i] + 1 < starts.size()) {
+                const auto first = positions.begin() + starts[a[i]];
+                const auto last = positions.begin() + starts[a[i] + 1];
+                for (auto it = std::lower_bound(first, last, b_low); it != last && *it < b_high; ++it) {
+                    const size_t j = *it;
+                    const size_t k = next_lengths[j + 1] = lengths[j] + 1;
+                    next_touched.push_back(j + 1);
+                    if (k > best_size) {
+                        best_i = i + 1 - k;
+                        best_j = j + 1 - k;
+                        best_size = k;
+                    }
+                }
+            }
+            for (size_t j : touched)
+                lengths[j] = 0;
+            touched.clear();
+            std::swap(lengths, next_lengths);
+            std::swap(touched, next_touched);
+        }
+        for (size_t j : touched)
+            lengths[j] = 0;
+        touched.clear();
+
+        // Popular lines do not start a match, but extend one on either side
+        while (best_i > a_low && best_j > b_low && a[best_i - 1] == b[best_j - 1]) {
+            --best_i;
+            --best_j;
+            ++best_size;
+        }
+        while (best_i + best_size < a_high && best_j + best_size < b_high &&
+               a[best_i + best_size] == b[best_j + best_size])
+            ++best_size;
+
+        return {best_i, best_j, best_size};
+    }
+};
+
+bool equal_ranges(const std::vector<uint32_t>& a, size_t a_start, size_t a_end,
+                  const std::vector<uint32_t>& b, size_t b_start, size_t b_end) {
+    return a_end - a_start == b_end - b_start && std::equal(a.begin() + a_start, a.begin() + a_end,
+                                                            b.begin() + b_start);
+}
+
+// Three-way merge over interned lines, following merge3: the regions where both sides match the base are
+// found by intersecting the matching blocks of each side against the base, and each stretch between them is
+// then taken from the side that changed it, or is a conflict if both did differently. The blocks are matched
+// as by merge3's sequence matcher rather than with the Myers diff, so the result is the same as merge3's.
+std::vector<MergeRegion> merge_ids(const std::vector<uint32_t>& base, const std::vector<uint32_t>& ours,
+                                   const std::vector<uint32_t>& theirs) {
+    const std::vector<MatchingBlock> ours_matches = SequenceMatcher(base, ours).matching_blocks();
+    const std::vector<MatchingBlock> theirs_matches = SequenceMatcher(base, theirs).matching_blocks();
+
+    // Sync regions (base start, base end, ours start, theirs start), ending with an empty one at the very end
+    std::vector<std::tuple<size_t, size_t, size_t, size_t>> syncs;
+    for (size_t i = 0, j = 0; i < ours_matches.size() && j < theirs_matches.size();) {
+        const auto& [ours_base, ours_start, ours_length] = ours_matches[i];
+        const auto& [theirs_base, theirs_start, theirs_length] = theirs_matches[j];
+
+        const size_t start = std::max(ours_base, theirs_base);
+        const size_t end = std::min(ours_base + ours_length, theirs_base + theirs_length);
+        if (start < end)
+            syncs.emplace_back(start, end, ours_start + (start - ours_base), theirs_start + (start - theirs_base));
+
+        // Advance whichever block ends first in the base
+        if (ours_base + ours_length < theirs_base + theirs_length)
+            ++i;
+        else
+            ++j;
+    }
+    syncs.emplace_back(base.size(), base.size(), ours.size(), theirs.size());
+
+    std::vector<MergeRegion> regions;
+    size_t base_pos = 0, ours_pos = 0, theirs_pos = 0;
+    for (const auto& [sync_base, sync_end, sync_ours, sync_theirs] : syncs) {
+        if (sync_ours > ours_pos || sync_theirs > theirs_pos) {
+            MergeRegion::Kind kind;
+            if (equal_ranges(ours, ours_pos, sync_ours, theirs, theirs_pos, sync_theirs))
+                kind = MergeRegion::Kind::SAME;
+            else if (equal_ranges(ours, ours_pos, sync_ours, base, base_pos, sync_base))
+                kind = MergeRegion::Kind::THEIRS;
+            else if (equal_ranges(theirs, theirs_pos, sync_theirs, base, base_pos, sync_base))
+                kind = MergeRegion::Kind::OURS;
+            else
+                kind = MergeRegion::Kind::CONFLICT;
+
+            regions.push_back({kind, base_pos, sync_base, ours_pos, sync_ours, theirs_pos, sync_theirs});
+            ours_pos = sync_ours;
+            theirs_pos = sync_theirs;
+        }
+
+        // A stretch of the base deleted on both sides is simply skipped
+        if (sync_end > sync_base) {
+            const size_t length = sync_end - sync_base;
+            regions.push_back({MergeRegion::Kind::UNCHANGED, sync_base, sync_end, ours_pos, ours_pos + length,
+                               theirs_pos, theirs_pos + length});
+            ours_pos += length;
+            theirs_pos += length;
+        }
+        base_pos = sync_end;
+    }
+
+    return regions;
+}
+
+// Maps the three blobs of a merge, each distinct blob once, since the base is often the same as a side
+class MergeInputs {
+    // Declared first, so that it is constructed before the references into it
+    std::vector<std::pair<std::string, std::unique_ptr<MappedBlob>>> blobs;
+
+    const MappedBlob& map(const std::string& root_dir, const std::string& hash) {
+        for (const auto& [mapped_hash, blob] : blobs) {
+            if (mapped_hash == hash)
+                return *blob;
+        }
+        blobs.emplace_back(hash, std::make_unique<MappedBlob>(root_dir, hash));
+        return *blobs.back().second;
+    }
+
+public:
+    MergeInputs(const std::string& root_dir, const std::string& base_hash, const std::string& ours_hash,
+                const std::string& theirs_hash)
+        : base(map(root_dir, base_hash)), ours(map(root_dir, ours_hash)), theirs(map(root_dir, theirs_hash)) {}
+
+    const MappedBlob& base;
+    const MappedBlob& ours;
+    const MappedBlob& theirs;
+};
+
+std::vector<MergeRegion> merge_inputs(const MergeInputs& inputs) {
+    LineInterner interner(inputs.base.line_count() + inputs.ours.line_count() + inputs.theirs.line_count());
+    const std::vector<uint32_t> base_ids = interner.intern(inputs.base);
+    const std::vector<uint32_t> ours_ids = interner.intern(inputs.ours);
+    const std::vector<uint32_t> theirs_ids = interner.intern(inputs.theirs);
+
+    return merge_ids(base_ids, ours_ids, theirs_ids);
+}
+
+// Write lines [start, end) of a blob, which are contiguous in its memory map
+void write_lines(ObjectWriter& out, const MappedBlob& blob, size_t start, size_t end) {
+    if (start == end)
+        return;
+
+    const char* first = blob.line(start).data();
+    const std::string_view last = blob.line(end - 1);
+    out.write(first, last.data() + last.size() - first);
+}
+
+void write_marker(ObjectWriter& out, std::string_view marker) {
+    out.write(marker.data(), marker.size());
+}
+
+}  // namespace
+
+std::vector<ChangeBlock> diff_lines(const std::string& root_dir, const std::string& old_hash,
+                                    const std::string& new_hash) {
+    if (old_hash == new_hash)
+        return {};
+
+    MappedBlob old_blob(root_dir, old_hash);
+    MappedBlob new_blob(root_dir, new_hash);
+
+    LineInterner interner(old_blob.line_count() + new_blob.line_count());
+    return diff_ids(interner.intern(old_blob), interner.intern(new_blob));
+}
+
+size_t count_lines(const std::string& root_dir, const std::string& hash) {
+    const MappedBlob blob(root_dir, hash, false);
+    if (blob.size() == 0)
+        return 0;
+
+    size_t lines = 0;
+    const char* end = blob.data() + blob.size();
+    for (const char* cursor = blob.data();
+         (cursor = static_cast<const char*>(memchr(cursor, '\n', end - cursor))) != nullptr; ++cursor)
+        ++lines;
+
+    return end[-1] == '\n' ? lines : lines + 1;
+}
+
+std::vector<uint64_t> line_offsets(const char* data, size_t size) {
+    std::vector<uint64_t> offsets;
+    if (size > 0) {
+        offsets.push_back(0);
+        const char* end = data + size;
+        for (const char* cursor = data;
+             (cursor = static_cast<const char*>(memchr(cursor, '\n', end - cursor))) != nullptr && cursor + 1 != end;)
+            offsets.push_back(++cursor - data);
+    }
+    offsets.push_back(size);
+
+    return offsets;
+}
+
+std::pair<size_t, size_t> diff_stat(const std::string& root_dir, const std::string& old_hash,
+                                    const std::string& new_hash) {
+    if (old_hash == new_hash)
+        return {0, 0};
+    if (old_hash.empty())
+        return {count_lines(root_dir, new_hash), 0};
+    if (new_hash.empty())
+        return {0, count_lines(root_dir, old_hash)};
+
+    size_t added = 0;
+    size_t removed = 0;
+    for (const auto& [old_start, old_count, new_start, new_count] : diff_lines(root_dir, old_hash, new_hash)) {
+        removed += old_count;
+        added += new_count;
+    }
+
+    return {added, removed};
+}
+
+std::vector<MergeRegion> merge_regions(const std::string& root_dir, const std::string& base_hash,
+                                       const std::string& ours_hash, const std::string& theirs_hash) {
+    const MergeInputs inputs(root_dir, base_hash, ours_hash, theirs_hash);
+    return merge_inputs(inputs);
+}
+
+std::pair<std::string, bool> merge_text(const std::string& root_dir, const std::string& base_hash,
+                                       const std::string& ours_hash, const std::string& theirs_hash) {
+    const MergeInputs inputs(root_dir, base_hash, ours_hash, theirs_hash);
+    const std::vector<MergeRegion> regions = merge_inputs(inputs);
+
+    ObjectWriter out(root_dir);
+    bool conflict = false;
+    for (const MergeRegion& region : regions) {
+        switch (region.kind) {
+            case MergeRegion::Kind::UNCHANGED:
+                write_lines(out, inputs.base, region.base_start, region.base_end);
+                break;
+            case MergeRegion::Kind::OURS:
+            case MergeRegion::Kind::SAME:
+                write_lines(out, inputs.ours, region.ours_start, region.ours_end);
+                break;
+            case MergeRegion::Kind::THEIRS:
+                write_lines(out, inputs.theirs, region.theirs_start, region.theirs_end);
+                break;
+            case MergeRegion::Kind::CONFLICT:
+                conflict = true;
+                write_marker(out, CONFLICT_START_MARKER);
+                write_lines(out, inputs.ours, region.ours_start, region.ours_end);
+                write_marker(out, CONFLICT_SEPARATOR);
+                write_lines(out, inputs.theirs, region.theirs_start, region.theirs_end);
+                write_marker(out, CONFLICT_END_MARKER);
+                break;
+        }
+    }
+
+    // The inputs stay mapped while the result is published: it may replace one of them, which is harmless
+    // since the content is the same
+    return {out.commit(), conflict};
+}
@@ -0,0 +1,59 @@
+#ifndef DIFF_H
+#define DIFF_H
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <tuple>
+#include <utility>
+#include <vector>
+
+// A block of changed lines: (old start, old count, new start, new count), with 0-based line numbers.
+// A count of zero means a pure insertion or deletion at that position.
+using ChangeBlock = std::tuple<size_t, size_t, size_t, size_t>;
+
+// Compute the line-level changes between two blobs with a linear-space Myers diff.
+// An empty hash stands for empty content, so added and removed files can be diffed too.
+std::vector<ChangeBlock> diff_lines(const std::string& root_dir, const std::string& old_hash,
+                                    const std::string& new_hash);
+
+// Count the lines of a blob by scanning its memory map for newlines; a last line without one counts too.
+size_t count_lines(const std::string& root_dir, const std::string& hash);
+
+// Byte offsets of the start of every line of a buffer, followed by its size, so line i spans
+// [offsets[i], offsets[i + 1]). Lines include their trailing newline, if any; empty content has no lines.
+std::vector<uint64_t> line_offsets(const char* data, size_t size);
+
+// Count the lines added and removed between two blobs, as (added, removed), without building any diff text.
+// Added and removed files are counted by newline scanning alone.
+std::pair<size_t, size_t> diff_stat(const std::string& root_dir, const std::string& old_hash,
+                                    const std::string& new_hash);
+
+// Markers around the two sides of a conflicting region in merged text
+constexpr const char* CONFLICT_START_MARKER = "<<<<<<< ours\n";
+constexpr const char* CONFLICT_SEPARATOR = "=======\n";
+constexpr const char* CONFLICT_END_MARKER = ">>>>>>> theirs\n";
+
+// A region of a three-way merge, with half-open ranges of 0-based line numbers in the base, ours and theirs.
+// UNCHANGED regions match the base on both sides; OURS and THEIRS were changed on one side only, SAME
+// identically on both, and CONFLICT differently on both.
+struct MergeRegion {
+    enum class Kind { UNCHANGED, OURS, THEIRS, SAME, CONFLICT };
+
+    Kind kind;
+    size_t base_start, base_end;
+    size_t ours_start, ours_end;
+    size_t theirs_start, theirs_end;
+};
+
+// Compute the regions of a three-way merge of blobs, the same as merge3's merge_regions: each side is matched
+// against the base as by merge3's sequence matcher. An empty hash stands for empty content.
+std::vector<MergeRegion> merge_regions(const std::string& root_dir, const std::string& base_hash,
+                                       const std::string& ours_hash, const std::string& theirs_hash);
+
+// Merge three blobs into a new object, with conflict markers around conflicting regions. The result is
+// streamed into the object store as it is produced. Returns its hash and whether there were any conflicts.
+std::pair<std::string, bool> merge_text(const std::string& root_dir, const std::string& base_hash,
+                                       const std::string& ours_hash, const std::string& theirs_hash);
+
+#endif // DIFF_H
@@ -0,0 +1,69 @@
+#include <cstring>
+#include <stdexcept>
+#include <sys/file.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include "caf.h"
+#include "mapped_blob.h"
+
+MappedBlob::MappedBlob(const std::string& root_dir, const std::string& hash, bool with_line_index) {
+    if (hash.empty())
+        return;
+
+    fd = open_content_for_reading(root_dir, hash);
+
+    struct stat st;
+    if (fstat(fd, &st) != 0) {
+        flock(fd, LOCK_UN);
+        close(fd);
+        throw std::runtime_error("Failed to stat blob " + hash);
+    }
+
+    length = static_cast<size_t>(st.st_size);
+    if (length > 0) {
+        void* mapped = mmap(nullptr, length, PROT_READ, MAP_PRIVATE, fd, 0);
+        if (mapped == MAP_FAILED) {
+            flock(fd, LOCK_UN);
+            close(fd);
+            throw std::runtime_error("Failed to map blob " + hash);
+        }
+        content = static_cast<const char*>(mapped);
+        madvise(mapped, length, MADV_SEQUENTIAL);
+    }
+
+    if (with_line_index)
+        index_lines();
+}
+
+MappedBlob::~MappedBlob() {
+    if (content)
+        munmap(const_cast<char*>(content), length);
+    if (fd >= 0) {
+        flock(fd, LOCK_UN);
+        close(fd);
+    }
+}
+
+void MappedBlob::index_lines() {
+    if (length == 0)
+        return;
+
+    line_starts.push_back(0);
+    const char* end = content + length;
+    const char* cursor = content;
+    while (true) {
+        const char* newline = static_cast<const char*>(memchr(cursor, '\n', end - cursor));
+        if (!newline || newline + 1 == end)
+            break;
+        cursor = newline + 1;
+        line_starts.push_back(cursor - content);
+    }
+}
+
+std::string_view MappedBlob::line(size_t index) const {
+    size_t start = line_starts[index];
+    size_t end = index + 1 < line_starts.size() ? line_starts[index + 1] : length;
+    return std::string_view(content + start, end - start);
+}
@@ -0,0 +1,37 @@
+#ifndef MAPPED_BLOB_H
+#define MAPPED_BLOB_H
+
+#include <cstddef>
+#include <string>
+#include <string_view>
+#include <vector>
+
+// Read-only memory map of a blob in the object store, with an index of line start offsets.
+// Lines include their trailing newline, if any. An empty hash stands for empty content.
+// Without the line index, only size and data are available.
+// The blob stays locked while it is mapped, since saving a file's content again rewrites it in place. The lock is
+// shared, so blobs mapped at the same time by other readers, e.g. by concurrent diffs, never wait for each other.
+class MappedBlob {
+public:
+    MappedBlob(const std::string& root_dir, const std::string& hash, bool with_line_index = true);
+    ~MappedBlob();
+
+    MappedBlob(const MappedBlob&) = delete;
+    MappedBlob& operator=(const MappedBlob&) = delete;
+
+    size_t size() const { return length; }
+    const char* data() const { return content; }
+
+    size_t line_count() const { return line_starts.size(); }
+    std::string_view line(size_t index) const;
+
+private:
+    int fd = -1;
+    const char* content = nullptr;
+    size_t length = 0;
+    std::vector<size_t> line_starts;
+
+    void index_lines();
+};
+
+#endif // MAPPED_BLOB_H
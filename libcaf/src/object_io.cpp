@@ -6,6 +6,8 @@
 #include <cstring>
 #include <stdexcept>
 #include <map>
+#include <sys/stat.h>
+#include <sys/mman.h>
 
 #include "caf.h"
 #include "object_io.h"
@@ -17,7 +19,10 @@ constexpr uint32_t MAX_LENGTH = 1024 * 1024;  // 1 MB limit for strings
 std::string read_length_prefixed_string(int fd); // Helper function to read a length-prefixed string safely
 void write_with_length(int fd, const std::string &data); // Helper function to write a length-prefixed string safely
 void save_tree_record(int fd, const TreeRecord &record); // Helper function to serialize a TreeRecord
-TreeRecord load_tree_record(int fd); // Helper function to deserialize a TreeRecord
+TreeRecord parse_tree_record(std::string_view data, size_t &offset); // Helper function to deserialize a TreeRecord from a buffer
+std::string read_all(int fd); // Helper function to read a whole object into memory
+void read_from_buffer(std::string_view data, size_t &offset, void *out, size_t size, const char *error); // Helper function to copy a fixed-size field out of a buffer
+std::string parse_length_prefixed_string(std::string_view data, size_t &offset); // Helper function to parse a length-prefixed string from a buffer
 
 // Serialize Commit to disk
 void save_commit(const std::string &root_dir, const Commit &commit) {
@@ -93,22 +98,120 @@ void save_tree(const std::string &root_dir, const Tree &tree) {
 }
 
 Tree load_tree(const std::string &root_dir, const std::string &tree_hash) {
+    // Records are stored sorted by name, so each one is appended at the end of the map
+    std::map<std::string, TreeRecord> records;
+    for (TreeRecord &record : load_tree_records(root_dir, tree_hash)) {
+        std::string name = record.name;
+        records.emplace_hint(records.end(), std::move(name), std::move(record));
+    }
+
+    return Tree(records);
+}
+
+std::vector<TreeRecord> load_tree_records(const std::string &root_dir, const std::string &tree_hash) {
     int fd = open_content_for_reading(root_dir.c_str(), tree_hash.c_str());
 
+    // Read the whole object at once and parse it from memory, rather than issuing reads per field
+    std::string data;
+    try {
+        data = read_all(fd);
+    } catch (const std::exception &e) {
+        flock(fd, LOCK_UN);
+        close(fd);
+        throw;
+    }
+
+    flock(fd, LOCK_UN);
+    close(fd);
+
+    size_t offset = 0;
     uint32_t num_records;
-    if (read(fd, &num_records, sizeof(num_records)) != sizeof(num_records))
-        throw std::runtime_error("Failed to read the number of records");
+    read_from_buffer(data, offset, &num_records, sizeof(num_records), "Failed to read the number of records");
 
-    std::map<std::string, TreeRecord> records;
-    for (uint32_t i = 0; i < num_records; ++i) {
-        TreeRecord record = load_tree_record(fd);
-        records.emplace(record.name, record);
+    std::vector<TreeRecord> records;
+    records.reserve(num_records);
+    for (uint32_t i = 0; i < num_records; ++i)
+        records.push_back(parse_tree_record(data, offset));
+
+    return records;
+}
+
+TreeRecordStream::TreeRecordStream(const std::string &root_dir, const std::string &tree_hash) {
+    if (tree_hash.empty())
+        return;
+
+    int fd = open_content_for_reading(root_dir, tree_hash);
+
+    struct stat st;
+    if (fstat(fd, &st) != 0 || st.st_size < static_cast<off_t>(sizeof(remaining))) {
+        flock(fd, LOCK_UN);
+        close(fd);
+        throw std::runtime_error("Failed to read the number of records");
     }
 
+    length = static_cast<size_t>(st.st_size);
+    void *mapped = mmap(nullptr, length, PROT_READ, MAP_PRIVATE, fd, 0);
+    // The map outlives the descriptor, so the object is only locked while it is opened, and streams of the same
+    // tree never wait for each other. A tree saved again is rewritten in place with the same bytes or replaced,
+    // so the mapped content cannot change.
     flock(fd, LOCK_UN);
     close(fd);
+    if (mapped == MAP_FAILED)
+        throw std::runtime_error("Failed to map tree " + tree_hash);
 
-    return Tree(records);
+    content = static_cast<const char *>(mapped);
+    madvise(mapped, length, MADV_SEQUENTIAL);
+    read_from_buffer(std::string_view(content, length), offset, &remaining, sizeof(remaining),
+                     "Failed to read the number of records");
+}
+
+TreeRecordStream::~TreeRecordStream() {
+    if (content)
+        munmap(const_cast<char *>(content), length);
+}
+
+std::vector<TreeRecord> TreeRecordStream::next(size_t max_records) {
+    std::vector<TreeRecord> records;
+    records.reserve(std::min<size_t>(max_records, remaining));
+    const std::string_view data(content, length);
+    for (; remaining > 0 && records.size() < max_records; --remaining)
+        records.push_back(parse_tree_record(data, offset));
+
+    return records;
+}
+
+TreeWriter::TreeWriter(const std::string &root_dir) : file(root_dir) {
+    // Room for the number of records, which is only known at the end
+    file.write(reinterpret_cast<const char *>(&count), sizeof(count));
+}
+
+void TreeWriter::add(const TreeRecord &record) {
+    if (count > 0 && record.name <= last_name)
+        throw std::invalid_argument("Tree records must be added in increasing name order: " + record.name);
+
+    // The same serialization as save_tree, and the same hash as hash_object: the records in name order
+    const uint8_t type = static_cast<uint8_t>(record.type);
+    file.write(reinterpret_cast<const char *>(&type), sizeof(type));
+    for (const std::string *field : {&record.hash, &record.name}) {
+        const uint32_t field_length = field->length();
+        file.write(reinterpret_cast<const char *>(&field_length), sizeof(field_length));
+        file.write(field->data(), field_length);
+    }
+
+    const std::string type_digit = std::to_string(static_cast<int>(record.type));
+    digest.update(record.name.data(), record.name.size());
+    digest.update(type_digit.data(), type_digit.size());
+    digest.update(record.hash.data(), record.hash.size());
+
+    last_name = record.name;
+    ++count;
+}
+
+std::string TreeWriter::commit() {
+    file.write_at(0, reinterpret_cast<const char *>(&count), sizeof(count));
+    const std::string tree_hash = digest.hex_digest();
+    file.publish(tree_hash);
+    return tree_hash;
 }
 
 std::string read_length_prefixed_string(int fd) {
@@ -143,16 +246,52 @@ void save_tree_record(int fd, const TreeRecord &record) {
     write_with_length(fd, record.name);
 }
 
-TreeRecord load_tree_record(int fd) {
+TreeRecord parse_tree_record(std::string_view data, size_t &offset) {
     uint8_t type;
-
-    if (read(fd, &type, sizeof(type)) != sizeof(type)) {
-        throw std::runtime_error("Failed to read TreeRecord type");
-    }
+    read_from_buffer(data, offset, &type, sizeof(type), "Failed to read TreeRecord type");
 
     TreeRecord::Type record_type = static_cast<TreeRecord::Type>(type);
-    std::string hash = read_length_prefixed_string(fd);
-    std::string name = read_length_prefixed_string(fd);
+    std::string hash = parse_length_prefixed_string(data, offset);
+    std::string name = parse_length_prefixed_string(data, offset);
 
     return TreeRecord(record_type, hash, name);
-}
\ No newline at end of file
+}
+
+std::string read_all(int fd) {
+    struct stat st;
+    if (fstat(fd, &st) != 0)
+        throw std::runtime_error("Failed to stat object");
+
+    std::string data(static_cast<size_t>(st.st_size), '\0');
+    size_t total = 0;
+    while (total < data.size()) {
+        ssize_t count = read(fd, &data[total], data.size() - total);
+        if (count <= 0)
+            throw std::runtime_error("Failed to read object");
+        total += static_cast<size_t>(count);
+    }
+
+    return data;
+}
+
+void read_from_buffer(std::string_view data, size_t &offset, void *out, size_t size, const char *error) {
+    if (size > data.size() - offset)
+        throw std::runtime_error(error);
+
+    std::memcpy(out, data.data() + offset, size);
+    offset += size;
+}
+
+std::string parse_length_prefixed_string(std::string_view data, size_t &offset) {
+    uint32_t length;
+    read_from_buffer(data, offset, &length, sizeof(length), "Failed to read length");
+
+    if (length > MAX_LENGTH)
+        throw std::runtime_error("Length exceeds maximum");
+    if (length > data.size() - offset)
+        throw std::runtime_error("Failed to read string");
+
+    std::string result(data.substr(offset, length));
+    offset += length;
+    return result;
+}
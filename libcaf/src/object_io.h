@@ -2,11 +2,13 @@
 #define OBJECT_IO_H
 
 #include <string>
+#include <string_view>
 #include <utility>
 #include <vector>
 #include <stdexcept>
 #include <cstdint>
 
+#include "caf.h"
 #include "commit.h"
 #include "tree.h"
 
@@ -14,6 +16,48 @@ void save_commit(const std::string &root_dir, const Commit &commit);
 Commit load_commit(const std::string &root_dir, const std::string &hash);
 void save_tree(const std::string &root_dir, const Tree &tree);
 Tree load_tree(const std::string &root_dir, const std::string &hash);
+// The records of a tree in stored order, which is sorted by name
+std::vector<TreeRecord> load_tree_records(const std::string &root_dir, const std::string &hash);
+
+// Incremental reader of the records of a stored tree, in stored order, which is sorted by name. The tree is
+// memory-mapped, so only the records of the current batch are held in memory. An empty hash stands for an
+// empty tree.
+class TreeRecordStream {
+public:
+    TreeRecordStream(const std::string &root_dir, const std::string &tree_hash);
+    ~TreeRecordStream();
+
+    TreeRecordStream(const TreeRecordStream &) = delete;
+    TreeRecordStream &operator=(const TreeRecordStream &) = delete;
+
+    // Get the next batch of up to max_records records. An empty result means the tree is exhausted.
+    std::vector<TreeRecord> next(size_t max_records);
+
+private:
+    const char *content = nullptr;
+    size_t length = 0;
+    size_t offset = 0;
+    uint32_t remaining = 0;
+};
+
+// Incremental writer of a tree, stored as save_tree would store a Tree of the same records, with the same
+// hash. Records must be added in increasing name order; only the last name is kept in memory. The tree is
+// written to a temporary file and published by commit(), which returns its hash.
+class TreeWriter {
+public:
+    explicit TreeWriter(const std::string &root_dir);
+
+    void add(const TreeRecord &record);
+    std::string commit();
+    // Discard the records added so far
+    void abort() { file.abort(); }
+
+private:
+    TempObjectFile file;
+    Sha1 digest;
+    uint32_t count = 0;
+    std::string last_name;
+};
 
 
 #endif // OBJECT_IO_H
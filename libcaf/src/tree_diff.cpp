@@ -0,0 +1,345 @@
+#include <fnmatch.h>
+
+#include <utility>
+
+#include "object_io.h"
+#include "tree_diff.h"
+
+namespace {
+
+bool starts_with(const std::string& text, const std::string& prefix) {
+    return text.compare(0, prefix.size(), prefix) == 0;
+}
+
+// Records read from a streamed tree per batch
+constexpr size_t RECORD_BATCH_SIZE = 1024;
+
+// The trees to compare below a change that involves a tree, with an empty hash for a side that has none
+std::optional<std::pair<std::string, std::string>> subtrees_to_search(TreeChange::Kind kind,
+                                                                      const TreeRecord* old_record,
+                                                                      const TreeRecord* new_record) {
+    switch (kind) {
+        case TreeChange::Kind::REMOVED:
+            if (old_record->type == TreeRecord::Type::TREE)
+                return std::make_pair(old_record->hash, std::string());
+            break;
+        case TreeChange::Kind::ADDED:
+            if (new_record->type == TreeRecord::Type::TREE)
+                return std::make_pair(std::string(), new_record->hash);
+            break;
+        case TreeChange::Kind::MODIFIED:
+            if (old_record->type == TreeRecord::Type::TREE && new_record->type == TreeRecord::Type::TREE)
+                return std::make_pair(old_record->hash, new_record->hash);
+            break;
+    }
+
+    return std::nullopt;
+}
+
+std::optional<TreeRecord> optional_record(const TreeRecord* record) {
+    return record ? std::optional<TreeRecord>(*record) : std::nullopt;
+}
+
+} // namespace
+
+RecordCursor::RecordCursor(const std::string& root_dir, const std::string& tree_hash, TreeCache* cache) {
+    if (tree_hash.empty())
+        return;
+
+    if (cache)
+        cached = cache->get(root_dir, tree_hash);
+    else
+        stream = std::make_unique<TreeRecordStream>(root_dir, tree_hash);
+}
+
+const TreeRecord* RecordCursor::current() {
+    if (cached)
+        return position < cached->size() ? &(*cached)[position] : nullptr;
+
+    if (position == batch.size() && stream) {
+        batch = stream->next(RECORD_BATCH_SIZE);
+        position = 0;
+        if (batch.empty())
+            stream.reset();
+    }
+
+    return position < batch.size() ? &batch[position] : nullptr;
+}
+
+TreeCache::TreeCache(size_t capacity) : capacity(capacity) {}
+
+std::shared_ptr<const std::vector<TreeRecord>> TreeCache::get(const std::string& root_dir,
+                                                              const std::string& tree_hash) {
+    {
+        std::lock_guard<std::mutex> lock(mutex);
+        auto it = entries.find(tree_hash);
+        if (it != entries.end()) {
+            order.splice(order.begin(), order, it->second.second);
+            ++hit_count;
+            return it->second.first;
+        }
+        ++miss_count;
+    }
+
+    // Load without holding the lock, so other threads keep hitting the cache meanwhile
+    Records records = std::make_shared<const std::vector<TreeRecord>>(load_tree_records(root_dir, tree_hash));
+    if (capacity == 0)
+        return records;
+
+    std::lock_guard<std::mutex> lock(mutex);
+    if (entries.find(tree_hash) == entries.end()) {
+        order.push_front(tree_hash);
+        entries.emplace(tree_hash, std::make_pair(records, order.begin()));
+        if (entries.size() > capacity) {
+            entries.erase(order.back());
+            order.pop_back();
+        }
+    }
+
+    return records;
+}
+
+size_t TreeCache::size() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return entries.size();
+}
+
+size_t TreeCache::hits() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return hit_count;
+}
+
+size_t TreeCache::misses() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return miss_count;
+}
+
+Pathspec::Pathspec(const std::vector<std::string>& raw_patterns) {
+    for (const std::string& raw : raw_patterns) {
+        const size_t first = raw.find_first_not_of('/');
+        if (first == std::string::npos) {
+            // The root selects everything
+            patterns.clear();
+            return;
+        }
+
+        std::string text = raw.substr(first, raw.find_last_not_of('/') - first + 1);
+        const size_t wildcard = text.find_first_of("*?[");
+        std::string literal_prefix = text.substr(0, wildcard);
+        patterns.push_back({std::move(text), std::move(literal_prefix), wildcard != std::string::npos});
+    }
+}
+
+bool Pathspec::matches(const std::string& path) const {
+    for (const Pattern& pattern : patterns) {
+        if (pattern.is_glob) {
+            if (fnmatch(pattern.text.c_str(), path.c_str(), 0) == 0)
+                return true;
+        } else if (starts_with(path, pattern.text) &&
+                   (path.size() == pattern.text.size() || path[pattern.text.size()] == '/')) {
+            return true;
+        }
+    }
+
+    return false;
+}
+
+bool Pathspec::may_match_below(const std::string& path) const {
+    const std::string directory = path + "/";
+    for (const Pattern& pattern : patterns) {
+        if (starts_with(pattern.literal_prefix, directory) || starts_with(directory, pattern.literal_prefix))
+            return true;
+    }
+
+    return false;
+}
+
+std::vector<TreeChange> diff_trees(const std::string& root_dir, const std::string& old_tree_hash,
+                                   const std::string& new_tree_hash, const std::vector<std::string>& paths,
+                                   TreeCache* cache) {
+    std::vector<TreeChange> changes;
+    if (old_tree_hash == new_tree_hash)
+        return changes;
+
+    const Pathspec pathspec(paths);
+
+    struct Pending {
+        std::string old_hash;
+        std::string new_hash;
+        long parent;
+        // Path of the tree followed by a slash; only tracked while outside the pathspec
+        std::string prefix;
+        bool selected;
+    };
+    std::vector<Pending> stack{{old_tree_hash, new_tree_hash, -1, "", pathspec.empty()}};
+    // Streamed records do not outlive their batch, so added records are copied until they are considered
+    std::vector<TreeRecord> added;
+    // Changes of directories that were only entered to reach the pathspec, by change index
+    std::vector<bool> tentative;
+    bool any_tentative = false;
+
+    while (!stack.empty()) {
+        Pending pending = std::move(stack.back());
+        stack.pop_back();
+
+        // Cached trees are shared rather than copied, and others streamed
+        RecordCursor old_records(root_dir, pending.old_hash, cache);
+        RecordCursor new_records(root_dir, pending.new_hash, cache);
+
+        // Report a change if it is in the pathspec, or search below it if it may lead there
+        auto consider = [&](TreeChange::Kind kind, const TreeRecord* old_record, const TreeRecord* new_record) {
+            std::string path;
+            bool selected = pending.selected;
+            if (!selected) {
+                path = pending.prefix + (old_record ? old_record : new_record)->name;
+                selected = pathspec.matches(path);
+            }
+
+            const auto subtrees = subtrees_to_search(kind, old_record, new_record);
+            if (!selected && !(subtrees && pathspec.may_match_below(path)))
+                return;
+
+            changes.push_back({pending.parent, kind, optional_record(old_record), optional_record(new_record)});
+            tentative.push_back(!selected);
+            any_tentative = any_tentative || !selected;
+
+            // Selected added and removed trees are reported as a whole; modified ones are always descended into
+            if (subtrees && (!selected || kind == TreeChange::Kind::MODIFIED))
+                stack.push_back({subtrees->first, subtrees->second, static_cast<long>(changes.size() - 1),
+                                 selected ? std::string() : path + "/", selected});
+        };
+
+        added.clear();
+
+        while (true) {
+            const TreeRecord* old_record = old_records.current();
+            const TreeRecord* new_record = new_records.current();
+            if (!old_record && !new_record)
+                break;
+
+            if (!new_record || (old_record && old_record->name < new_record->name)) {
+                consider(TreeChange::Kind::REMOVED, old_record, nullptr);
+                old_records.advance();
+            } else if (!old_record || new_record->name < old_record->name) {
+                added.push_back(*new_record);
+                new_records.advance();
+            } else {
+                if (old_record->hash != new_record->hash)
+                    consider(TreeChange::Kind::MODIFIED, old_record, new_record);
+                old_records.advance();
+                new_records.advance();
+            }
+        }
+
+        for (const TreeRecord& record : added)
+            consider(TreeChange::Kind::ADDED, nullptr, &record);
+    }
+
+    if (!any_tentative)
+        return changes;
+
+    // Keep a directory entered only to reach the pathspec if something below it is kept. Children always come
+    // after their parent, so a single backwards pass settles every directory.
+    std::vector<bool> keep(changes.size());
+    for (size_t i = changes.size(); i-- > 0;) {
+        keep[i] = keep[i] || !tentative[i];
+        if (keep[i] && changes[i].parent >= 0)
+            keep[changes[i].parent] = true;
+    }
+
+    std::vector<long> new_index(changes.size(), -1);
+    std::vector<TreeChange> kept;
+    for (size_t i = 0; i < changes.size(); ++i) {
+        if (!keep[i])
+            continue;
+        new_index[i] = static_cast<long>(kept.size());
+        kept.push_back(std::move(changes[i]));
+        if (kept.back().parent >= 0)
+            kept.back().parent = new_index[kept.back().parent];
+    }
+
+    return kept;
+}
+
+TreeDiffStream::TreeDiffStream(const std::string& root_dir, const std::string& old_tree_hash,
+                               const std::string& new_tree_hash, const std::vector<std::string>& paths)
+    : root_dir(root_dir), pathspec(paths) {
+    if (old_tree_hash != new_tree_hash)
+        push_frame(old_tree_hash, new_tree_hash, "", 0, pathspec.empty());
+}
+
+void TreeDiffStream::push_frame(const std::string& old_tree_hash, const std::string& new_tree_hash,
+                                std::string prefix, size_t depth, bool selected, std::optional<PathChange> header) {
+    if (header)
+        ++pending_headers;
+
+    frames.push_back({RecordCursor(root_dir, old_tree_hash), RecordCursor(root_dir, new_tree_hash),
+                      std::move(prefix), depth, selected, std::move(header)});
+}
+
+void TreeDiffStream::flush_headers(std::vector<PathChange>& changes) {
+    if (pending_headers == 0)
+        return;
+
+    for (Frame& frame : frames) {
+        if (frame.header) {
+            changes.push_back(std::move(*frame.header));
+            frame.header.reset();
+        }
+    }
+    pending_headers = 0;
+}
+
+std::vector<PathChange> TreeDiffStream::next(size_t max_changes) {
+    std::vector<PathChange> changes;
+
+    while (changes.size() < max_changes && !frames.empty()) {
+        Frame& frame = frames.back();
+        const TreeRecord* old_record = frame.old_records.current();
+        const TreeRecord* new_record = frame.new_records.current();
+        if (!old_record && !new_record) {
+            if (frame.header)
+                --pending_headers;
+            frames.pop_back();
+            continue;
+        }
+
+        // Advancing keeps the current records valid until the next call to current
+        TreeChange::Kind kind;
+        if (!new_record || (old_record && old_record->name < new_record->name)) {
+            kind = TreeChange::Kind::REMOVED;
+            new_record = nullptr;
+            frame.old_records.advance();
+        } else if (!old_record || new_record->name < old_record->name) {
+            kind = TreeChange::Kind::ADDED;
+            old_record = nullptr;
+            frame.new_records.advance();
+        } else {
+            frame.old_records.advance();
+            frame.new_records.advance();
+            if (old_record->hash == new_record->hash)
+                continue;
+            kind = TreeChange::Kind::MODIFIED;
+        }
+
+        std::string path = frame.prefix + (old_record ? old_record : new_record)->name;
+        const bool selected = frame.selected || pathspec.matches(path);
+        const auto subtrees = subtrees_to_search(kind, old_record, new_record);
+        const size_t depth = frame.depth;
+
+        // Pushing a frame invalidates frame and the records, so everything needed is copied out first
+        PathChange change{kind, depth, path, optional_record(old_record), optional_record(new_record)};
+
+        if (selected) {
+            flush_headers(changes);
+            changes.push_back(std::move(change));
+            // Added and removed trees are reported as a whole; modified ones are descended into right away
+            if (subtrees && kind == TreeChange::Kind::MODIFIED)
+                push_frame(subtrees->first, subtrees->second, path + "/", depth + 1, true);
+        } else if (subtrees && pathspec.may_match_below(path)) {
+            push_frame(subtrees->first, subtrees->second, path + "/", depth + 1, false, std::move(change));
+        }
+    }
+
+    return changes;
+}
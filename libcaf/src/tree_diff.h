@@ -0,0 +1,160 @@
+#ifndef TREE_DIFF_H
+#define TREE_DIFF_H
+
+#include <list>
+#include <memory>
+#include <mutex>
+#include <optional>
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+#include "object_io.h"
+#include "tree_record.h"
+
+// A single change between two trees. Changes below a modified subtree point to that subtree's change through
+// parent, an index into the change list; top-level changes have parent -1.
+struct TreeChange {
+    enum class Kind {
+        ADDED,
+        REMOVED,
+        MODIFIED
+    };
+
+    long parent;
+    Kind kind;
+    std::optional<TreeRecord> old_record;
+    std::optional<TreeRecord> new_record;
+};
+
+// A bounded, thread-safe cache of loaded trees, shared by diffs over related commits. Trees are immutable, so
+// entries never go stale; the least recently used ones are dropped once capacity is reached.
+class TreeCache {
+public:
+    explicit TreeCache(size_t capacity);
+
+    // Get the records of a tree, loading them on a miss. Concurrent misses on the same tree may both load it.
+    std::shared_ptr<const std::vector<TreeRecord>> get(const std::string& root_dir, const std::string& tree_hash);
+
+    size_t size() const;
+    size_t hits() const;
+    size_t misses() const;
+
+private:
+    using Records = std::shared_ptr<const std::vector<TreeRecord>>;
+
+    const size_t capacity;
+    mutable std::mutex mutex;
+    // Most recently used first
+    std::list<std::string> order;
+    std::unordered_map<std::string, std::pair<Records, std::list<std::string>::iterator>> entries;
+    size_t hit_count = 0;
+    size_t miss_count = 0;
+};
+
+// The records of one side of a tree comparison, in name order: read from a tree held by a TreeCache, or streamed
+// from the object store a batch at a time through a TreeRecordStream. An empty tree hash stands for an empty tree.
+class RecordCursor {
+public:
+    RecordCursor(const std::string& root_dir, const std::string& tree_hash, TreeCache* cache = nullptr);
+
+    // The current record, or nullptr once the tree is exhausted. A streamed record stays valid until current is
+    // called again after advance, which may read the next batch.
+    const TreeRecord* current();
+    void advance() { ++position; }
+
+private:
+    std::shared_ptr<const std::vector<TreeRecord>> cached;
+    std::unique_ptr<TreeRecordStream> stream;
+    std::vector<TreeRecord> batch;
+    size_t position = 0;
+};
+
+// Paths limiting a tree diff, relative to the root tree. A pattern without wildcards selects that path and
+// everything below it. A pattern containing *, ? or [ is matched against whole paths with fnmatch, where
+// wildcards also match '/', and selects everything below the directories it matches. An empty pathspec, or an
+// empty pattern, selects everything.
+class Pathspec {
+public:
+    explicit Pathspec(const std::vector<std::string>& patterns);
+
+    bool empty() const { return patterns.empty(); }
+
+    // Whether path, and therefore everything below it, is selected.
+    bool matches(const std::string& path) const;
+
+    // Whether something below the directory path may be selected.
+    bool may_match_below(const std::string& path) const;
+
+private:
+    struct Pattern {
+        std::string text;
+        // The part of the pattern before its first wildcard; the whole pattern if it has none
+        std::string literal_prefix;
+        bool is_glob;
+    };
+
+    std::vector<Pattern> patterns;
+};
+
+// Compare two trees by merge-joining their sorted records, descending only into subtrees whose hashes differ.
+// Within each tree, removed and modified records are listed first and added records after them, both in name
+// order; a modified subtree's changes follow once all changes of its enclosing tree have been listed.
+//
+// With a non-empty pathspec, only selected records are reported, and only trees that may contain selected
+// records are loaded. Added or removed trees that are not selected themselves are descended into as well, and a
+// directory leading to selected records is reported as their parent only if one of them changed.
+//
+// An empty tree hash stands for an empty tree. Trees are loaded through cache, if one is given; otherwise their
+// records are streamed, and only a batch of the two trees being compared, plus the added records of the current
+// tree, are held besides the changes.
+std::vector<TreeChange> diff_trees(const std::string& root_dir, const std::string& old_tree_hash,
+                                   const std::string& new_tree_hash, const std::vector<std::string>& paths = {},
+                                   TreeCache* cache = nullptr);
+
+// A change between two trees identified by its full path, as produced by TreeDiffStream.
+struct PathChange {
+    TreeChange::Kind kind;
+    size_t depth;
+    std::string path;
+    std::optional<TreeRecord> old_record;
+    std::optional<TreeRecord> new_record;
+};
+
+// Incremental, depth-first comparison of two trees. Changes come out in path order: the records of each tree
+// are merge-joined by name, and a modified subtree is descended into right after its own change. The records of
+// the trees on the current path are streamed, so only a batch of each is held in memory. A pathspec limits the
+// changes as in diff_trees.
+class TreeDiffStream {
+public:
+    TreeDiffStream(const std::string& root_dir, const std::string& old_tree_hash, const std::string& new_tree_hash,
+                   const std::vector<std::string>& paths = {});
+
+    // Get the next batch of changes: up to max_changes, plus the directories leading to them that were not
+    // reported yet. An empty result means the comparison is complete.
+    std::vector<PathChange> next(size_t max_changes);
+
+private:
+    struct Frame {
+        RecordCursor old_records;
+        RecordCursor new_records;
+        std::string prefix;
+        size_t depth;
+        // Everything in this tree is in the pathspec
+        bool selected;
+        // The change of this directory, held back until something below it is reported
+        std::optional<PathChange> header;
+    };
+
+    std::string root_dir;
+    Pathspec pathspec;
+    std::vector<Frame> frames;
+    size_t pending_headers = 0;
+
+    // An empty hash stands for a tree that does not exist on that side
+    void push_frame(const std::string& old_tree_hash, const std::string& new_tree_hash, std::string prefix,
+                    size_t depth, bool selected, std::optional<PathChange> header = std::nullopt);
+    void flush_headers(std::vector<PathChange>& changes);
+};
+
+#endif // TREE_DIFF_H
@@ -214,3 +214,139 @@ def test_diff_nested_children_indentation(temp_repo: Repository, parse_commit_ha
 
     assert found_directory_diff, 'Directory modification should be detected'
     assert found_nested_indentation, 'Nested children should be indented by 3 spaces'
+
+
+def test_diff_patch(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                    capsys: CaptureFixture[str]) -> None:
+    file1 = temp_repo.working_dir / 'file1.txt'
+    file1.write_text('one\ntwo\nthree\n')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Initial commit') == 0
+    commit_hash1 = parse_commit_hash()
+
+    file1.write_text('one\n2\nthree\n')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Modified file1') == 0
+    commit_hash2 = parse_commit_hash()
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2,
+                             patch=True) == 0
+    output = capsys.readouterr().out
+    assert '--- a/file1.txt\n+++ b/file1.txt\n@@ -1,3 +1,3 @@\n one\n-two\n+2\n three\n' in output
+
+
+def test_diff_find_renames(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                           capsys: CaptureFixture[str]) -> None:
+    content = ''.join(f'line {i}\n' for i in range(20))
+    (temp_repo.working_dir / 'before.txt').write_text(content)
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Initial commit') == 0
+    commit_hash1 = parse_commit_hash()
+
+    (temp_repo.working_dir / 'before.txt').unlink()
+    (temp_repo.working_dir / 'after.txt').write_text(content + 'one more line\n')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Rename') == 0
+    commit_hash2 = parse_commit_hash()
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2,
+                             find_renames=50, patch=True) == 0
+    output = capsys.readouterr().out
+    assert 'Moved: before.txt -> after.txt (95% similar)' in output
+    assert '--- a/before.txt\n+++ b/after.txt\n' in output
+    assert '+one more line\n' in output
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2,
+                             find_renames=150) == -1
+
+
+def test_diff_streams_nested_move_with_full_path(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                                                  capsys: CaptureFixture[str]) -> None:
+    (temp_repo.working_dir / 'dst').mkdir()
+    (temp_repo.working_dir / 'dst' / 'existing.txt').write_text('Existing content')
+    (temp_repo.working_dir / 'src').mkdir()
+    (temp_repo.working_dir / 'src' / 'file.txt').write_text('Moving content')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Initial commit') == 0
+    commit_hash1 = parse_commit_hash()
+
+    (temp_repo.working_dir / 'src' / 'file.txt').rename(temp_repo.working_dir / 'dst' / 'file.txt')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Move file') == 0
+    commit_hash2 = parse_commit_hash()
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2) == 0
+    lines = capsys.readouterr().out.splitlines()
+
+    assert lines[lines.index('Modified: dst') + 1:] == ['Modified: src', '   Moved: file.txt -> dst/file.txt']
+
+
+def test_diff_limited_to_paths(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                               capsys: CaptureFixture[str]) -> None:
+    for name in ('api', 'web'):
+        (temp_repo.working_dir / name).mkdir()
+        (temp_repo.working_dir / name / 'main.py').write_text(f'{name} v1')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Initial commit') == 0
+    commit_hash1 = parse_commit_hash()
+
+    for name in ('api', 'web'):
+        (temp_repo.working_dir / name / 'main.py').write_text(f'{name} v2')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Update both') == 0
+    commit_hash2 = parse_commit_hash()
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2,
+                             paths=['web']) == 0
+    output = capsys.readouterr().out
+    assert 'Modified: web' in output
+    assert 'api' not in output
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2,
+                             paths=['docs']) == 0
+    assert 'No changes detected between commits.' in capsys.readouterr().out
+
+
+def test_diff_stat_and_numstat(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                               capsys: CaptureFixture[str]) -> None:
+    (temp_repo.working_dir / 'file.txt').write_text('a\nb\n')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Initial commit') == 0
+    commit_hash1 = parse_commit_hash()
+
+    (temp_repo.working_dir / 'file.txt').write_text('a\nc\nd\n')
+    (temp_repo.working_dir / 'data.bin').write_bytes(b'\x00\x01')
+
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Edit') == 0
+    commit_hash2 = parse_commit_hash()
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2,
+                             numstat=True) == 0
+    assert capsys.readouterr().out.splitlines() == ['-\t-\tdata.bin', '2\t1\tfile.txt']
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash1, commit2=commit_hash2,
+                             stat=True) == 0
+    assert capsys.readouterr().out.splitlines() == [' data.bin | Bin',
+                                                    ' file.txt |   3 ++-',
+                                                    ' 2 files changed, 2 insertions(+), 1 deletions(-)']
+
+
+def test_diff_worktree(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                       capsys: CaptureFixture[str]) -> None:
+    (temp_repo.working_dir / 'file1.txt').write_text('Content of file1')
+    assert cli_commands.commit(working_dir_path=temp_repo.working_dir, author='Test', message='Initial commit') == 0
+    commit_hash = parse_commit_hash()
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, worktree=True) == 0
+    assert 'No changes detected in the working directory.' in capsys.readouterr().out
+
+    (temp_repo.working_dir / 'file1.txt').write_text('Edited content of file1')
+    (temp_repo.working_dir / 'file2.txt').write_text('Content of file2')
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, commit1=commit_hash, worktree=True) == 0
+    output = capsys.readouterr().out
+    assert 'Modified: file1.txt' in output
+    assert 'Added: file2.txt' in output
+
+    assert cli_commands.diff(working_dir_path=temp_repo.working_dir, worktree=True, patch=True) == -1
+    assert '--worktree cannot be combined' in capsys.readouterr().err
@@ -1,4 +1,5 @@
 from collections.abc import Callable
+from datetime import datetime, timedelta
 from pathlib import Path
 
 from libcaf.constants import DEFAULT_REPO_DIR, HEAD_FILE
@@ -32,6 +33,76 @@ def test_log_command(temp_repo: Repository, parse_commit_hash: Callable[[], str]
     assert 'Second commit' in output
 
 
+def test_log_max_count_and_skip(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                                capsys: CaptureFixture[str]) -> None:
+    working_dir = temp_repo.working_dir
+    temp_file = working_dir / 'log_test.txt'
+    commit_hashes = []
+    for i in range(3):
+        temp_file.write_text(f'Commit {i} content')
+        assert cli_commands.commit(working_dir_path=working_dir, author='Log Tester', message=f'Commit {i}') == 0
+        commit_hashes.append(parse_commit_hash())
+
+    assert cli_commands.log(working_dir_path=working_dir, max_count=1, skip=1) == 0
+
+    output: str = capsys.readouterr().out
+    assert commit_hashes[1] in output
+    assert commit_hashes[0] not in output
+    assert commit_hashes[2] not in output
+
+
+def test_log_paths(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                   capsys: CaptureFixture[str]) -> None:
+    working_dir = temp_repo.working_dir
+    (working_dir / 'tracked.txt').write_text('Tracked v1')
+    assert cli_commands.commit(working_dir_path=working_dir, author='Log Tester', message='Add tracked') == 0
+    tracked_hash = parse_commit_hash()
+
+    (working_dir / 'other.txt').write_text('Other')
+    assert cli_commands.commit(working_dir_path=working_dir, author='Log Tester', message='Add other') == 0
+    other_hash = parse_commit_hash()
+
+    assert cli_commands.log(working_dir_path=working_dir, paths=['tracked.txt']) == 0
+
+    output: str = capsys.readouterr().out
+    assert tracked_hash in output
+    assert other_hash not in output
+
+
+def test_log_author_and_grep(temp_repo: Repository, parse_commit_hash: Callable[[], str],
+                             capsys: CaptureFixture[str]) -> None:
+    working_dir = temp_repo.working_dir
+    temp_file = working_dir / 'log_test.txt'
+
+    temp_file.write_text('First')
+    assert cli_commands.commit(working_dir_path=working_dir, author='Alice', message='Fix parser bug') == 0
+    alice_hash = parse_commit_hash()
+
+    temp_file.write_text('Second')
+    assert cli_commands.commit(working_dir_path=working_dir, author='Bob', message='Fix lexer bug') == 0
+    bob_hash = parse_commit_hash()
+
+    assert cli_commands.log(working_dir_path=working_dir, author='Alice') == 0
+    output: str = capsys.readouterr().out
+    assert alice_hash in output
+    assert bob_hash not in output
+
+    assert cli_commands.log(working_dir_path=working_dir, grep='LEXER') == 0
+    output = capsys.readouterr().out
+    assert bob_hash in output
+    assert alice_hash not in output
+
+
+def test_log_no_matching_commits(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    working_dir = temp_repo.working_dir
+    (working_dir / 'log_test.txt').write_text('Content')
+    assert cli_commands.commit(working_dir_path=working_dir, author='Log Tester', message='Commit') == 0
+    capsys.readouterr()
+
+    assert cli_commands.log(working_dir_path=working_dir, since=datetime.now() + timedelta(days=1)) == 0
+    assert 'No commits match the given filters' in capsys.readouterr().out
+
+
 def test_log_no_repo(temp_repo_dir: Path, capsys: CaptureFixture[str]) -> None:
     assert cli_commands.log(working_dir_path=temp_repo_dir) == -1
     assert 'No repository found' in capsys.readouterr().err
@@ -48,3 +119,18 @@ def test_log_repo_error(temp_repo: Repository, capsys: CaptureFixture[str]) -> N
 def test_log_no_commits(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
     assert cli_commands.log(working_dir_path=temp_repo.working_dir) == 0
     assert 'No commits in the repository' in capsys.readouterr().out
+
+
+def test_log_stat(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    working_dir = temp_repo.working_dir
+    (working_dir / 'log_test.txt').write_text('one\n')
+    assert cli_commands.commit(working_dir_path=working_dir, author='Log Tester', message='First') == 0
+    (working_dir / 'log_test.txt').write_text('one\ntwo\n')
+    assert cli_commands.commit(working_dir_path=working_dir, author='Log Tester', message='Second') == 0
+    capsys.readouterr()
+
+    assert cli_commands.log(working_dir_path=working_dir, stat=True) == 0
+    output = capsys.readouterr().out
+
+    assert output.count(' log_test.txt | 1 +\n') == 2
+    assert output.count(' 1 file changed, 1 insertions(+), 0 deletions(-)') == 2
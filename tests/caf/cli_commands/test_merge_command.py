@@ -0,0 +1,83 @@
+from pathlib import Path
+
+from libcaf.constants import DEFAULT_BRANCH
+from libcaf.ref import write_ref
+from libcaf.repository import Repository, branch_ref
+from pytest import CaptureFixture
+
+from caf import cli_commands
+
+
+def _branches(temp_repo: Repository, *, conflicting: bool) -> tuple[str, str]:
+    file_path = temp_repo.working_dir / 'file.txt'
+    file_path.write_text('first\nsecond\nthird\n')
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+
+    temp_repo.add_branch('feature')
+    temp_repo.update_ref('heads/feature', base_commit)
+    write_ref(temp_repo.head_file(), branch_ref('feature'))
+    file_path.write_text('first\nsecond\nfeature third\n')
+    feature_commit = temp_repo.commit_working_dir('Author', 'Feature commit')
+
+    write_ref(temp_repo.head_file(), branch_ref(DEFAULT_BRANCH))
+    file_path.write_text('main first\nsecond\nmain third\n' if conflicting else 'main first\nsecond\nthird\n')
+    main_commit = temp_repo.commit_working_dir('Author', 'Main commit')
+    return main_commit, feature_commit
+
+
+def test_merge_check_clean(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    main_commit, feature_commit = _branches(temp_repo, conflicting=False)
+    objects = set(temp_repo.objects_dir().glob('??/*'))
+
+    assert cli_commands.merge(working_dir_path=temp_repo.working_dir, commit1=main_commit, commit2=feature_commit,
+                              check=True) == 0
+    assert 'The commits merge cleanly.' in capsys.readouterr().out
+    assert set(temp_repo.objects_dir().glob('??/*')) == objects
+
+
+def test_merge_check_conflicts(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    main_commit, feature_commit = _branches(temp_repo, conflicting=True)
+    objects = set(temp_repo.objects_dir().glob('??/*'))
+
+    assert cli_commands.merge(working_dir_path=temp_repo.working_dir, commit1=main_commit, commit2=feature_commit,
+                              check=True, stop_on_conflict=True) == -1
+    output = capsys.readouterr().out
+    assert 'First conflict:\n  file.txt' in output
+    assert 'Merged tree' not in output
+    assert set(temp_repo.objects_dir().glob('??/*')) == objects
+
+
+def test_merge(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    main_commit, feature_commit = _branches(temp_repo, conflicting=True)
+
+    assert cli_commands.merge(working_dir_path=temp_repo.working_dir, commit1=main_commit,
+                              commit2=feature_commit) == -1
+    output = capsys.readouterr().out
+    assert 'Merged tree: ' in output
+    assert 'Conflicts:\n  file.txt' in output
+
+
+def test_merge_fast_forward(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    (temp_repo.working_dir / 'file.txt').write_text('base')
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+    (temp_repo.working_dir / 'file.txt').write_text('change')
+    head_commit = temp_repo.commit_working_dir('Author', 'Second commit')
+
+    assert cli_commands.merge(working_dir_path=temp_repo.working_dir, commit1=base_commit,
+                              commit2=head_commit) == 0
+    assert f'Fast-forward to {head_commit}' in capsys.readouterr().out
+
+    assert cli_commands.merge(working_dir_path=temp_repo.working_dir, commit1=head_commit,
+                              commit2=base_commit) == 0
+    assert 'Already up to date.' in capsys.readouterr().out
+
+
+def test_merge_stop_on_conflict_requires_check(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    assert cli_commands.merge(working_dir_path=temp_repo.working_dir, commit1='HEAD', commit2='HEAD',
+                              stop_on_conflict=True) == -1
+    assert '--stop_on_conflict can only be used with --check' in capsys.readouterr().err
+
+
+def test_merge_no_repo(temp_repo_dir: Path, capsys: CaptureFixture[str]) -> None:
+    assert cli_commands.merge(working_dir_path=temp_repo_dir, commit1='HEAD', commit2='HEAD') == -1
+    assert 'No repository found' in capsys.readouterr().err
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+from libcaf.repository import Repository
+from pytest import CaptureFixture
+
+from caf import cli_commands
+
+
+def test_record_resolution(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    conflicted_file = temp_repo.working_dir / 'file.txt'
+    conflicted_file.write_text('<<<<<<< ours\nours\n=======\ntheirs\n>>>>>>> theirs\nend\n')
+    conflicted_hash = temp_repo.save_file_content(conflicted_file).hash
+    conflicted_file.write_text('both\nend\n')
+
+    assert cli_commands.record_resolution(working_dir_path=temp_repo.working_dir, conflicted_hash=conflicted_hash,
+                                          path=conflicted_file) == 0
+    assert 'Recorded 1 resolution.' in capsys.readouterr().out
+
+
+def test_record_resolution_mismatch(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    conflicted_file = temp_repo.working_dir / 'file.txt'
+    conflicted_file.write_text('start\n<<<<<<< ours\nours\n=======\ntheirs\n>>>>>>> theirs\n')
+    conflicted_hash = temp_repo.save_file_content(conflicted_file).hash
+    conflicted_file.write_text('both\n')
+
+    assert cli_commands.record_resolution(working_dir_path=temp_repo.working_dir, conflicted_hash=conflicted_hash,
+                                          path=conflicted_file) == -1
+    assert 'does not match' in capsys.readouterr().err
+
+
+def test_record_resolution_missing_file(temp_repo: Repository, capsys: CaptureFixture[str]) -> None:
+    assert cli_commands.record_resolution(working_dir_path=temp_repo.working_dir, conflicted_hash='0' * 40,
+                                          path=temp_repo.working_dir / 'missing.txt') == -1
+    assert 'does not exist' in capsys.readouterr().err
+
+
+def test_record_resolution_no_repo(temp_repo_dir: Path, capsys: CaptureFixture[str]) -> None:
+    path = temp_repo_dir / 'file.txt'
+    path.write_text('content\n')
+
+    assert cli_commands.record_resolution(working_dir_path=temp_repo_dir, conflicted_hash='0' * 40, path=path) == -1
+    assert 'No repository found' in capsys.readouterr().err
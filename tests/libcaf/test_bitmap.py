@@ -0,0 +1,135 @@
+import random
+
+from libcaf import TreeRecordType
+from libcaf.bitmap import BitmapIndex, ewah_decode, ewah_encode
+from libcaf.plumbing import load_commit, load_tree
+from libcaf.repository import Repository
+
+
+def _walk_objects(temp_repo: Repository, commit_hash: str) -> set[str]:
+    objects_dir = temp_repo.objects_dir()
+    objects = set()
+    current: str | None = commit_hash
+    while current:
+        commit = load_commit(objects_dir, current)
+        objects.add(current)
+        stack = [commit.tree_hash]
+        while stack:
+            tree_hash = stack.pop()
+            objects.add(tree_hash)
+            for record in load_tree(objects_dir, tree_hash).records.values():
+                if record.type == TreeRecordType.TREE:
+                    stack.append(record.hash)
+                else:
+                    objects.add(record.hash)
+        current = commit.parent
+    return objects
+
+
+def _make_history(temp_repo: Repository) -> list[str]:
+    sub_dir = temp_repo.working_dir / 'sub'
+    sub_dir.mkdir()
+    (sub_dir / 'nested.txt').write_text('nested')
+
+    commits = []
+    for i in range(5):
+        (temp_repo.working_dir / f'file{i}.txt').write_text(f'content {i}')
+        commits.append(temp_repo.commit_working_dir('Author', f'Commit {i}'))
+    return commits
+
+
+def test_ewah_round_trip() -> None:
+    rng = random.Random(7)
+    samples = [0, 1, (1 << 64) - 1, (1 << 640) - 1, 1 << 5000, (1 << 200) | ((1 << 64) - 1) << 1000]
+    samples.extend(rng.getrandbits(rng.randint(1, 4000)) for _ in range(50))
+
+    for bits in samples:
+        assert ewah_decode(ewah_encode(bits)) == bits
+
+    # Long clean runs compress to a handful of words
+    assert len(ewah_encode(1 << 100_000)) <= 24
+
+
+def test_reachable_objects_match_tree_walk(temp_repo: Repository) -> None:
+    commits = _make_history(temp_repo)
+
+    assert temp_repo.reachable_objects(commits[2]) == _walk_objects(temp_repo, commits[2])
+    assert temp_repo.reachable_objects() == _walk_objects(temp_repo, commits[-1])
+    assert temp_repo.count_objects(commits[-1]) == len(_walk_objects(temp_repo, commits[-1]))
+
+
+def test_bitmaps_persisted(temp_repo: Repository) -> None:
+    commits = _make_history(temp_repo)
+    temp_repo.count_objects()
+
+    bitmaps = BitmapIndex(temp_repo.bitmap_file())
+    assert commits[-1] in bitmaps
+    assert set(bitmaps.hashes(bitmaps.reachable(temp_repo.objects_dir(), None, commits[-1]))) == \
+        _walk_objects(temp_repo, commits[-1])
+
+
+def test_unreachable_objects(temp_repo: Repository) -> None:
+    _make_history(temp_repo)
+    orphan = temp_repo.save_file_content(temp_repo.working_dir / 'file0.txt')
+    assert orphan.hash not in temp_repo.unreachable_objects()
+
+    (temp_repo.working_dir / 'orphan.txt').write_text('never committed')
+    orphan = temp_repo.save_file_content(temp_repo.working_dir / 'orphan.txt')
+
+    assert temp_repo.unreachable_objects() == [orphan.hash]
+
+
+def test_objects_to_send(temp_repo: Repository) -> None:
+    commits = _make_history(temp_repo)
+
+    to_send = temp_repo.objects_to_send([commits[-1]], [commits[2]])
+    assert to_send == _walk_objects(temp_repo, commits[-1]) - _walk_objects(temp_repo, commits[2])
+    assert commits[2] not in to_send
+    assert {commits[3], commits[4]} <= to_send
+
+    # Commits the other side has but this repository does not know are ignored
+    assert temp_repo.objects_to_send([commits[1]], ['f' * 40]) == _walk_objects(temp_repo, commits[1])
+
+
+def test_bitmaps_saved_by_appending(temp_repo: Repository) -> None:
+    commits = _make_history(temp_repo)
+    temp_repo.count_objects(commits[2])
+    saved = temp_repo.bitmap_file().read_bytes()
+
+    temp_repo.count_objects(commits[-1])
+    data = temp_repo.bitmap_file().read_bytes()
+    assert data.startswith(saved)
+    assert len(data) > len(saved)
+
+    bitmaps = BitmapIndex(temp_repo.bitmap_file())
+    assert commits[2] in bitmaps
+    assert commits[-1] in bitmaps
+
+
+def test_bitmaps_recover_from_partial_save(temp_repo: Repository) -> None:
+    commits = _make_history(temp_repo)
+    temp_repo.count_objects(commits[2])
+    saved = temp_repo.bitmap_file().read_bytes()
+    with temp_repo.bitmap_file().open('ab') as f:
+        f.write(b'\x05\x00\x00\x00\x00\x00\x00\x00partial')
+
+    assert temp_repo.reachable_objects(commits[-1]) == _walk_objects(temp_repo, commits[-1])
+    assert temp_repo.bitmap_file().read_bytes().startswith(saved)
+    assert commits[-1] in BitmapIndex(temp_repo.bitmap_file())
+
+
+def test_bitmaps_not_saved_over_concurrent_save(temp_repo: Repository) -> None:
+    commits = _make_history(temp_repo)
+    temp_repo.count_objects(commits[0])
+    first = BitmapIndex(temp_repo.bitmap_file())
+    second = BitmapIndex(temp_repo.bitmap_file())
+
+    with temp_repo.commit_graph(*commits) as graph:
+        first.reachable(temp_repo.objects_dir(), graph, commits[2])
+        second.reachable(temp_repo.objects_dir(), graph, commits[-1])
+    first.save()
+    second.save()
+
+    bitmaps = BitmapIndex(temp_repo.bitmap_file())
+    assert commits[2] in bitmaps
+    assert commits[-1] not in bitmaps
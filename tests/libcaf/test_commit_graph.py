@@ -0,0 +1,220 @@
+from pathlib import Path
+
+from libcaf.commit_graph import CommitGraph, CommitGraphRow, layers_dir, update_commit_graph, write_commit_graph
+from libcaf.plumbing import load_commit
+from libcaf.repository import Repository
+
+
+def test_commit_updates_commit_graph(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    temp_file.write_text('First')
+    first = temp_repo.commit_working_dir('Author', 'First commit')
+
+    temp_file.write_text('Second')
+    second = temp_repo.commit_working_dir('Author', 'Second commit')
+
+    with CommitGraph(temp_repo.commit_graph_file()) as graph:
+        assert len(graph) == 2
+
+        first_entry = graph.get(first)
+        second_entry = graph.get(second)
+        assert first_entry is not None
+        assert second_entry is not None
+
+        assert first_entry.parent_position is None
+        assert first_entry.generation == 1
+        assert second_entry.parent_position == first_entry.position
+        assert second_entry.generation == 2
+
+        second_commit = load_commit(temp_repo.objects_dir(), second)
+        assert second_entry.tree_hash == second_commit.tree_hash
+        assert second_entry.timestamp == second_commit.timestamp
+
+
+def test_commit_graph_rebuilt_when_missing(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    commits = []
+    for i in range(3):
+        temp_file.write_text(f'Content {i}')
+        commits.append(temp_repo.commit_working_dir('Author', f'Commit {i}'))
+
+    temp_repo.commit_graph_file().unlink()
+
+    assert [entry.commit_ref for entry in temp_repo.log()] == list(reversed(commits))
+    with CommitGraph(temp_repo.commit_graph_file()) as graph:
+        assert len(graph) == 3
+
+
+def test_commit_graph_appends_layers(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    commits = []
+    layers = []
+    for i in range(8):
+        temp_file.write_text(f'Content {i}')
+        commits.append(temp_repo.commit_working_dir('Author', f'Commit {i}'))
+        with CommitGraph(temp_repo.commit_graph_file()) as graph:
+            layers.append(graph.layers)
+
+    # Each commit adds a layer, merged into those below it while they are not twice its size
+    assert [[count for _, count in chain] for chain in layers] == [[1], [2], [2, 1], [4], [4, 1], [4, 2], [4, 2, 1],
+                                                                  [8]]
+    # Commits on top of a layer leave it untouched
+    assert layers[3][0] == layers[4][0] == layers[5][0] == layers[6][0]
+    # and layers merged away are removed
+    assert [path.name for path in layers_dir(temp_repo.commit_graph_file()).iterdir()] == [layers[7][0][0]]
+
+    with CommitGraph(temp_repo.commit_graph_file()) as graph:
+        for generation, commit in enumerate(commits, start=1):
+            entry = graph.get(commit)
+            assert entry is not None
+            assert entry.generation == generation
+        assert [entry.commit_hash for entry in graph.walk(commits[-1])] == list(reversed(commits))
+
+
+def test_commit_graph_layers_reference_lower_layers(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    commits = []
+    for i in range(7):
+        temp_file.write_text(f'Content {i}')
+        commits.append(temp_repo.commit_working_dir('Author', f'Commit {i}'))
+
+    with CommitGraph(temp_repo.commit_graph_file()) as graph:
+        assert len(graph.layers) == 3
+        tip = graph.get(commits[-1])
+        assert tip is not None
+        assert [entry.commit_hash for entry in graph.walk(commits[-1])] == list(reversed(commits))
+        for generation in range(1, 8):
+            assert graph.ancestor_at(tip, generation).commit_hash == commits[generation - 1]
+        assert graph.merge_base(commits[-1], commits[2]) == commits[2]
+        assert graph.changed_paths(tip.position).might_contain('test_file.txt')
+
+
+def test_commit_graph_replaces_single_file_format(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    temp_file.write_text('First')
+    first = temp_repo.commit_working_dir('Author', 'First commit')
+
+    # A single-file commit-graph of an older version reads as an empty chain
+    temp_repo.commit_graph_file().write_bytes(b'CGPH\x03\x00\x00\x00' + bytes(100))
+    with CommitGraph(temp_repo.commit_graph_file()) as graph:
+        assert len(graph) == 0
+
+    update_commit_graph(temp_repo.commit_graph_file(), temp_repo.objects_dir(), [first])
+    with CommitGraph(temp_repo.commit_graph_file()) as graph:
+        assert first in graph
+
+
+def test_common_ancestor_does_not_load_commits(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    temp_file.write_text('Base')
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+
+    temp_file.write_text('Tip')
+    tip_commit = temp_repo.commit_working_dir('Author', 'Tip commit')
+
+    # Remove the commit objects; the ancestor search must be answered from the commit-graph alone
+    for commit_ref in (base_commit, tip_commit):
+        (temp_repo.objects_dir() / commit_ref[:2] / commit_ref).unlink()
+
+    assert temp_repo.common_ancestor(tip_commit, base_commit) == base_commit
+
+
+def _fake_hash(number: int) -> str:
+    return f'{number:040x}'
+
+
+def test_merge_base_matches_full_walk(temp_repo_dir: Path) -> None:
+    # Build a synthetic history: a long trunk with branches forking at various depths, plus an unrelated root
+    parents: dict[str, str | None] = {}
+    generations: dict[str, int] = {}
+
+    def add(number: int, parent: int | None) -> str:
+        commit_hash = _fake_hash(number)
+        parent_hash = _fake_hash(parent) if parent is not None else None
+        parents[commit_hash] = parent_hash
+        generations[commit_hash] = generations[parent_hash] + 1 if parent_hash else 1
+        return commit_hash
+
+    trunk = [add(0, None)]
+    for number in range(1, 300):
+        trunk.append(add(number, number - 1))
+
+    branch_a = [add(1000, 57)]
+    for number in range(1001, 1090):
+        branch_a.append(add(number, number - 1))
+
+    branch_b = [add(2000, 211)]
+    for number in range(2001, 2013):
+        branch_b.append(add(number, number - 1))
+
+    unrelated = add(3000, None)
+
+    rows = {commit_hash: CommitGraphRow('0' * 40, parent_hash, generations[commit_hash], 0)
+            for commit_hash, parent_hash in parents.items()}
+    graph_file = temp_repo_dir / 'commit-graph'
+    write_commit_graph(graph_file, rows)
+
+    def naive_merge_base(hash1: str, hash2: str) -> str | None:
+        ancestors = set()
+        current: str | None = hash1
+        while current:
+            ancestors.add(current)
+            current = parents[current]
+        current = hash2
+        while current:
+            if current in ancestors:
+                return current
+            current = parents[current]
+        return None
+
+    with CommitGraph(graph_file) as graph:
+        pairs = [(trunk[-1], branch_a[-1]), (branch_a[-1], branch_b[-1]), (branch_b[5], trunk[250]),
+                 (trunk[10], trunk[299]), (branch_a[0], branch_a[0]), (trunk[-1], unrelated)]
+        for hash1, hash2 in pairs:
+            assert graph.merge_base(hash1, hash2) == naive_merge_base(hash1, hash2)
+            assert graph.merge_base(hash2, hash1) == naive_merge_base(hash1, hash2)
+
+        tip = graph.get(trunk[-1])
+        assert tip is not None
+        for generation in (1, 2, 64, 150, 300):
+            assert graph.ancestor_at(tip, generation).commit_hash == trunk[generation - 1]
+
+
+def test_log_filtered_by_path(temp_repo: Repository) -> None:
+    docs = temp_repo.working_dir / 'docs'
+    docs.mkdir()
+    readme = docs / 'readme.txt'
+    other = temp_repo.working_dir / 'other.txt'
+
+    readme.write_text('v1')
+    other.write_text('v1')
+    first = temp_repo.commit_working_dir('Author', 'Add files')
+
+    other.write_text('v2')
+    temp_repo.commit_working_dir('Author', 'Change other')
+
+    readme.write_text('v2')
+    third = temp_repo.commit_working_dir('Author', 'Change readme')
+
+    assert [entry.commit_ref for entry in temp_repo.log(paths=['docs/readme.txt'])] == [third, first]
+    assert [entry.commit_ref for entry in temp_repo.log(paths=['docs/'])] == [third, first]
+    assert list(temp_repo.log(paths=['missing.txt'])) == []
+
+
+def test_changed_path_filters_recorded(temp_repo: Repository) -> None:
+    nested = temp_repo.working_dir / 'a' / 'b'
+    nested.mkdir(parents=True)
+    (nested / 'file.txt').write_text('v1')
+    temp_repo.commit_working_dir('Author', 'First')
+
+    (nested / 'file.txt').write_text('v2')
+    second = temp_repo.commit_working_dir('Author', 'Second')
+
+    with CommitGraph(temp_repo.commit_graph_file()) as graph:
+        position = graph.position(second)
+        assert position is not None
+
+        changed_paths = graph.changed_paths(position)
+        assert changed_paths is not None
+        for path in ('a', 'a/b', 'a/b/file.txt'):
+            assert changed_paths.might_contain(path)
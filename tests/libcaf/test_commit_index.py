@@ -0,0 +1,97 @@
+import shutil
+from datetime import datetime, timedelta
+
+from libcaf.plumbing import load_commit
+from libcaf.repository import Repository
+
+
+def _commit_history(temp_repo: Repository) -> list[str]:
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    commits = []
+    for author, message in [('Alice', 'Add parser'), ('Bob', 'Fix parser crash'), ('Alice', 'Update README')]:
+        temp_file.write_text(message)
+        commits.append(temp_repo.commit_working_dir(author, message))
+    return commits
+
+
+def test_find_commits_by_author(temp_repo: Repository) -> None:
+    add_parser, _, update_readme = _commit_history(temp_repo)
+
+    found = [entry.commit_ref for entry in temp_repo.find_commits(author='Alice')]
+    assert sorted(found) == sorted([update_readme, add_parser])
+    assert temp_repo.find_commits(author='Carol') == []
+
+
+def test_find_commits_by_message(temp_repo: Repository) -> None:
+    add_parser, fix_parser, _ = _commit_history(temp_repo)
+
+    found = [entry.commit_ref for entry in temp_repo.find_commits(message='PARSER')]
+    assert sorted(found) == sorted([fix_parser, add_parser])
+    assert [entry.commit_ref for entry in temp_repo.find_commits(author='Bob', message='parser')] == [fix_parser]
+    assert temp_repo.find_commits(message='no such text') == []
+
+
+def test_find_commits_by_time(temp_repo: Repository) -> None:
+    commits = _commit_history(temp_repo)
+    timestamp = datetime.fromtimestamp(load_commit(temp_repo.objects_dir(), commits[0]).timestamp)
+
+    assert len(temp_repo.find_commits(since=timestamp - timedelta(days=1))) == 3
+    assert temp_repo.find_commits(since=datetime.now() + timedelta(days=1)) == []
+    assert temp_repo.find_commits(until=timestamp - timedelta(days=1)) == []
+
+
+def test_commit_index_rebuilt_when_missing(temp_repo: Repository) -> None:
+    _, fix_parser, _ = _commit_history(temp_repo)
+    shutil.rmtree(temp_repo.commit_index_dir())
+
+    assert [entry.commit_ref for entry in temp_repo.find_commits(author='Bob')] == [fix_parser]
+    assert temp_repo.commit_index_dir().exists()
+
+    # Commits made after the rebuild are indexed incrementally
+    (temp_repo.working_dir / 'test_file.txt').write_text('More')
+    new_commit = temp_repo.commit_working_dir('Bob', 'Another change')
+    assert sorted(entry.commit_ref for entry in temp_repo.find_commits(author='Bob')) == \
+        sorted([new_commit, fix_parser])
+
+
+def test_log_filtered_by_author_and_message(temp_repo: Repository) -> None:
+    add_parser, fix_parser, update_readme = _commit_history(temp_repo)
+
+    assert [entry.commit_ref for entry in temp_repo.log(author='Alice')] == [update_readme, add_parser]
+    assert [entry.commit_ref for entry in temp_repo.log(message='parser', skip=1)] == [add_parser]
+    assert [entry.commit_ref for entry in temp_repo.log(author='Bob', message='crash')] == [fix_parser]
+
+
+def test_commit_index_merges_segments(temp_repo: Repository) -> None:
+    commits = _commit_history(temp_repo)
+    temp_file = temp_repo.working_dir / 'test_file.txt'
+    for i in range(4):
+        temp_file.write_text(f'Change {i}')
+        commits.append(temp_repo.commit_working_dir('Carol', f'Change {i}'))
+
+    # Each commit is added as a segment of one row, merged like a binary counter: 7 rows are 4 + 2 + 1
+    segments = (temp_repo.commit_index_dir() / 'time.chain').read_text().split()
+    assert [len((temp_repo.commit_index_dir() / name).read_bytes()) // 28 for name in segments] == [4, 2, 1]
+    assert sorted(path.name for path in temp_repo.commit_index_dir().glob('time-*')) == sorted(segments)
+    assert sorted(entry.commit_ref for entry in temp_repo.find_commits()) == sorted(commits)
+    assert len(temp_repo.find_commits(author='Carol')) == 4
+
+
+def test_commit_index_rebuilt_from_older_format(temp_repo: Repository) -> None:
+    _, fix_parser, _ = _commit_history(temp_repo)
+    shutil.rmtree(temp_repo.commit_index_dir())
+    temp_repo.commit_index_dir().mkdir()
+    (temp_repo.commit_index_dir() / 'time').write_bytes(b'')
+
+    assert [entry.commit_ref for entry in temp_repo.find_commits(author='Bob')] == [fix_parser]
+    assert not (temp_repo.commit_index_dir() / 'time').exists()
+
+
+def test_log_since_until_uses_commit_index(temp_repo: Repository) -> None:
+    commits = _commit_history(temp_repo)
+    timestamp = datetime.fromtimestamp(load_commit(temp_repo.objects_dir(), commits[0]).timestamp)
+
+    assert [entry.commit_ref for entry in temp_repo.log(since=timestamp)] == commits[::-1]
+    assert [entry.commit_ref for entry in temp_repo.log(since=timestamp, author='Bob')] == [commits[1]]
+    assert list(temp_repo.log(until=timestamp - timedelta(days=1))) == []
+    assert list(temp_repo.log(since=datetime.now() + timedelta(days=1))) == []
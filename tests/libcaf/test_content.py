@@ -2,7 +2,7 @@ import hashlib
 from pathlib import Path
 
 from libcaf.plumbing import (delete_content, hash_file, open_content_for_reading, open_content_for_writing,
-                             save_file_content)
+                             open_object_writer, save_file_content)
 from pytest import mark, raises
 
 
@@ -62,6 +62,18 @@ class TestContent:
 
         assert saved_content == expected_content
 
+    def test_open_object_writer(self, temp_repo_dir: Path, temp_content: tuple[Path, str]) -> None:
+        _, expected_content = temp_content
+
+        with open_object_writer(temp_repo_dir) as writer:
+            for start in range(0, len(expected_content), 4096):
+                writer.write(expected_content[start:start + 4096])
+            object_hash = writer.commit()
+
+        assert object_hash == hashlib.sha1(expected_content).hexdigest()
+        assert (temp_repo_dir / f'{object_hash[:2]}/{object_hash}').read_bytes() == expected_content
+        assert [path.name for path in temp_repo_dir.iterdir()] == [object_hash[:2]]
+
     def test_save_and_delete_content(self, temp_repo_dir: Path, temp_content: tuple[Path, str]) -> None:
         file, _ = temp_content
 
@@ -72,3 +84,26 @@ class TestContent:
 
         delete_content(temp_repo_dir, blob.hash)
         assert not saved_file_path.exists()
+
+
+def test_object_writer_replaces_open_object(temp_repo_dir: Path) -> None:
+    with open_object_writer(temp_repo_dir) as writer:
+        writer.write(b'same content\n')
+        object_hash = writer.commit()
+
+    # Publishing takes no lock, so the object can be written again while it is open for reading
+    with open_content_for_reading(temp_repo_dir, object_hash) as f, open_object_writer(temp_repo_dir) as writer:
+        writer.write(b'same content\n')
+        assert writer.commit() == object_hash
+        assert f.read() == b'same content\n'
+
+
+def test_object_writer_discards_uncommitted_content(temp_repo_dir: Path) -> None:
+    with raises(ValueError), open_object_writer(temp_repo_dir) as writer:
+        writer.write(b'partial content')
+        raise ValueError
+
+    assert list(temp_repo_dir.iterdir()) == []
+
+    with raises(RuntimeError):
+        writer.write(b'more content')
@@ -1,6 +1,12 @@
 from collections.abc import Sequence
 
-from libcaf.repository import (AddedDiff, Diff, ModifiedDiff, MovedFromDiff, MovedToDiff, RemovedDiff, Repository)
+from _libcaf import TreeCache
+from libcaf import TreeChange, TreeRecord, TreeRecordType
+from libcaf import stat_cache
+from libcaf.plumbing import delete_content, diff_trees, load_commit, load_tree, open_tree_writer, stream_tree_diff
+from libcaf.repository import (AddedDiff, Diff, DiffEntry, ModifiedDiff, MovedFromDiff, MovedToDiff, RemovedDiff,
+                               Repository, RepositoryError)
+from pytest import MonkeyPatch, raises
 
 
 def split_diffs_by_type(diffs: Sequence[Diff]) -> \
@@ -279,3 +285,337 @@ def test_diff_moved_file_removed_first(temp_repo: Repository) -> None:
     assert len(modified_child.moved_to.parent.children) == 1
     assert modified_child.moved_to.parent.record.name == 'dir1'
     assert modified_child.moved_to.record.name == 'file_c.txt'
+
+
+def test_diff_trees_descends_only_into_changed_subtrees(temp_repo: Repository) -> None:
+    for name in ('changed', 'same'):
+        (temp_repo.working_dir / name).mkdir()
+        (temp_repo.working_dir / name / 'file.txt').write_text('v1')
+    (temp_repo.working_dir / 'removed.txt').write_text('gone soon')
+    commit1 = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    (temp_repo.working_dir / 'changed' / 'file.txt').write_text('v2')
+    (temp_repo.working_dir / 'removed.txt').unlink()
+    (temp_repo.working_dir / 'added.txt').write_text('new')
+    commit2 = temp_repo.commit_working_dir('Tester', 'Second commit')
+
+    objects_dir = temp_repo.objects_dir()
+    changes = diff_trees(objects_dir, load_commit(objects_dir, commit1).tree_hash,
+                         load_commit(objects_dir, commit2).tree_hash)
+
+    summary = [(change.parent, change.kind,
+                (change.old_record or change.new_record).name) for change in changes]
+    assert summary == [(-1, TreeChange.Kind.MODIFIED, 'changed'),
+                       (-1, TreeChange.Kind.REMOVED, 'removed.txt'),
+                       (-1, TreeChange.Kind.ADDED, 'added.txt'),
+                       (0, TreeChange.Kind.MODIFIED, 'file.txt')]
+    assert changes[3].new_record.hash != changes[3].old_record.hash
+
+
+def test_diff_moves_of_identical_files(temp_repo: Repository) -> None:
+    source_dir = temp_repo.working_dir / 'src'
+    target_dir = temp_repo.working_dir / 'dst'
+    source_dir.mkdir()
+    target_dir.mkdir()
+    for i in range(3):
+        (source_dir / f'copy{i}.txt').write_text('Same content')
+    (source_dir / 'kept.txt').write_text('Kept content')
+    (target_dir / 'existing.txt').write_text('Existing content')
+    commit1 = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    for i in range(2):
+        (source_dir / f'copy{i}.txt').rename(target_dir / f'moved{i}.txt')
+    (source_dir / 'copy2.txt').unlink()
+    commit2 = temp_repo.commit_working_dir('Tester', 'Move copies')
+
+    diff_result = temp_repo.diff_commits(commit1, commit2)
+    source_diff = next(d for d in diff_result if d.record.name == 'src')
+    target_diff = next(d for d in diff_result if d.record.name == 'dst')
+
+    moved_to = [d for d in source_diff.children if isinstance(d, MovedToDiff)]
+    removed = [d for d in source_diff.children if isinstance(d, RemovedDiff)]
+    assert len(moved_to) == 2
+    assert len(removed) == 1
+    assert len(target_diff.children) == 2
+    assert all(isinstance(d, MovedFromDiff) for d in target_diff.children)
+    assert sorted(d.moved_to.record.name for d in moved_to) == ['moved0.txt', 'moved1.txt']
+    assert {id(d.moved_to) for d in moved_to} == {id(d) for d in target_diff.children}
+
+
+def _commit_moved_copies(temp_repo: Repository) -> tuple[str, str]:
+    source_dir = temp_repo.working_dir / 'src'
+    target_dir = temp_repo.working_dir / 'dst'
+    source_dir.mkdir()
+    target_dir.mkdir()
+    for i in range(3):
+        (source_dir / f'copy{i}.txt').write_text('Same content')
+    (source_dir / 'kept.txt').write_text('Kept content')
+    (target_dir / 'existing.txt').write_text('Existing content')
+    commit1 = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    for i in range(2):
+        (source_dir / f'copy{i}.txt').rename(target_dir / f'moved{i}.txt')
+    (source_dir / 'copy2.txt').unlink()
+    commit2 = temp_repo.commit_working_dir('Tester', 'Move copies')
+
+    return commit1, commit2
+
+
+def _summarize(entries: Sequence[DiffEntry]) -> list[tuple[str, str, int, str | None]]:
+    return [(type(entry.diff).__name__, entry.path, entry.depth, entry.other_path) for entry in entries]
+
+
+def test_iter_diff_streams_in_path_order(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_moved_copies(temp_repo)
+
+    assert _summarize(list(temp_repo.iter_diff(commit1, commit2))) == [
+        ('ModifiedDiff', 'dst', 0, None),
+        ('MovedFromDiff', 'dst/moved0.txt', 1, 'src/copy0.txt'),
+        ('MovedFromDiff', 'dst/moved1.txt', 1, 'src/copy1.txt'),
+        ('ModifiedDiff', 'src', 0, None),
+        ('MovedToDiff', 'src/copy0.txt', 1, 'dst/moved0.txt'),
+        ('MovedToDiff', 'src/copy1.txt', 1, 'dst/moved1.txt'),
+        ('RemovedDiff', 'src/copy2.txt', 1, None),
+    ]
+
+
+def test_iter_diff_links_both_sides_of_a_move(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_moved_copies(temp_repo)
+
+    entries = {entry.path: entry for entry in temp_repo.iter_diff(commit1, commit2)}
+    moved_to = entries['src/copy0.txt'].diff
+    moved_from = entries['dst/moved0.txt'].diff
+
+    assert isinstance(moved_to, MovedToDiff)
+    assert moved_to.moved_to is moved_from
+    assert moved_from.moved_from is moved_to
+
+
+def test_iter_diff_only_pairs_moves_within_the_window(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_moved_copies(temp_repo)
+
+    # The copies share their content, so the first removal is two changes away from the nearest addition and
+    # the second one three changes away from the other
+    for move_window, expected_moves in ((3, 2), (2, 1), (1, 0)):
+        entries = list(temp_repo.iter_diff(commit1, commit2, move_window=move_window))
+        assert sum(isinstance(entry.diff, MovedToDiff) for entry in entries) == expected_moves
+        assert [entry.path for entry in entries] == ['dst', 'dst/moved0.txt', 'dst/moved1.txt', 'src',
+                                                     'src/copy0.txt', 'src/copy1.txt', 'src/copy2.txt']
+
+
+def test_iter_diff_identical_commits(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'file.txt').write_text('Same content')
+    commit_ref = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    assert list(temp_repo.iter_diff(commit_ref, commit_ref)) == []
+
+
+def test_iter_diff_rejects_negative_window(temp_repo: Repository) -> None:
+    with raises(ValueError, match='move_window'):
+        temp_repo.iter_diff(move_window=-1)
+
+
+def _commit_service_changes(temp_repo: Repository) -> tuple[str, str]:
+    for service in ('api', 'web'):
+        service_dir = temp_repo.working_dir / 'services' / service
+        service_dir.mkdir(parents=True)
+        (service_dir / 'main.py').write_text(f'{service} v1')
+        (service_dir / 'README.md').write_text(f'{service} docs')
+    commit1 = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    for service in ('api', 'web'):
+        (temp_repo.working_dir / 'services' / service / 'main.py').write_text(f'{service} v2')
+    (temp_repo.working_dir / 'docs').mkdir()
+    (temp_repo.working_dir / 'docs' / 'guide.md').write_text('Guide')
+    (temp_repo.working_dir / 'docs' / 'conf.py').write_text('Config')
+    commit2 = temp_repo.commit_working_dir('Tester', 'Second commit')
+
+    return commit1, commit2
+
+
+def _diff_paths(diffs: Sequence[Diff], prefix: str = '') -> list[str]:
+    paths = []
+    for diff in diffs:
+        paths.append(f'{prefix}{diff.record.name}')
+        paths.extend(_diff_paths(diff.children, f'{prefix}{diff.record.name}/'))
+
+    return paths
+
+
+def test_diff_commits_limited_to_path_prefix(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_service_changes(temp_repo)
+
+    diff_result = temp_repo.diff_commits(commit1, commit2, paths=['services/api/'])
+
+    assert _diff_paths(diff_result) == ['services', 'services/api', 'services/api/main.py']
+
+
+def test_diff_commits_limited_to_glob(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_service_changes(temp_repo)
+
+    diff_result = temp_repo.diff_commits(commit1, commit2, paths=['*.py'])
+
+    # The added directory is searched, and reported only as the parent of its matching file
+    assert sorted(_diff_paths(diff_result)) == ['docs', 'docs/conf.py', 'services', 'services/api',
+                                                'services/api/main.py', 'services/web', 'services/web/main.py']
+
+
+def test_diff_commits_without_matches(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_service_changes(temp_repo)
+
+    assert temp_repo.diff_commits(commit1, commit2, paths=['services/api/README.md', 'missing']) == []
+
+
+def test_diff_commits_never_loads_trees_outside_paths(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_service_changes(temp_repo)
+
+    # Both versions of services/web are gone, so they cannot be loaded without failing
+    objects_dir = temp_repo.objects_dir()
+    for commit_ref in (commit1, commit2):
+        services = load_tree(objects_dir, load_tree(objects_dir, load_commit(objects_dir, commit_ref).tree_hash)
+                             .records['services'].hash)
+        delete_content(objects_dir, services.records['web'].hash)
+
+    assert _diff_paths(temp_repo.diff_commits(commit1, commit2, paths=['services/api'])) == \
+        ['services', 'services/api', 'services/api/main.py']
+    assert [entry.path for entry in temp_repo.iter_diff(commit1, commit2, paths=['services/api'])] == \
+        ['services', 'services/api', 'services/api/main.py']
+    with raises(RepositoryError):
+        temp_repo.diff_commits(commit1, commit2)
+
+
+def test_iter_diff_limited_to_paths(temp_repo: Repository) -> None:
+    commit1, commit2 = _commit_service_changes(temp_repo)
+
+    entries = list(temp_repo.iter_diff(commit1, commit2, paths=['docs/*.py', 'services/web']))
+
+    assert [(entry.path, entry.depth) for entry in entries] == [
+        ('docs', 0), ('docs/conf.py', 1), ('services', 0), ('services/web', 1), ('services/web/main.py', 2)]
+
+
+def test_diff_stats(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'file.txt').write_text('a\nb\nc\n')
+    (temp_repo.working_dir / 'old').mkdir()
+    (temp_repo.working_dir / 'old' / 'one.txt').write_text('1\n2\n')
+    (temp_repo.working_dir / 'old' / 'two.txt').write_text('3\n')
+    (temp_repo.working_dir / 'image.bin').write_bytes(b'\x00\x01')
+    (temp_repo.working_dir / 'same.txt').write_text('Moved content\n')
+    commit1 = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    (temp_repo.working_dir / 'file.txt').write_text('a\nB\nc\nd\n')
+    for name in ('one.txt', 'two.txt'):
+        (temp_repo.working_dir / 'old' / name).unlink()
+    (temp_repo.working_dir / 'old').rmdir()
+    (temp_repo.working_dir / 'image.bin').write_bytes(b'\x00\x02')
+    (temp_repo.working_dir / 'same.txt').rename(temp_repo.working_dir / 'moved.txt')
+    commit2 = temp_repo.commit_working_dir('Tester', 'Second commit')
+
+    stats = temp_repo.diff_stats(commit1, commit2)
+
+    assert [(stat.path, stat.added, stat.removed) for stat in stats] == [
+        ('file.txt', 2, 1),
+        ('image.bin', None, None),
+        ('old/one.txt', 0, 2),
+        ('old/two.txt', 0, 1),
+        ('same.txt => moved.txt', 0, 0),
+    ]
+    assert [stat.path for stat in temp_repo.diff_stats(commit1, commit2, paths=['old'])] == \
+        ['old/one.txt', 'old/two.txt']
+
+
+def test_diff_trees_shares_tree_cache(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'dir').mkdir()
+    commits = []
+    for i in range(3):
+        (temp_repo.working_dir / 'dir' / 'file.txt').write_text(f'v{i}')
+        commits.append(load_commit(temp_repo.objects_dir(), temp_repo.commit_working_dir('Tester', f'Commit {i}')))
+
+    cache = TreeCache(16)
+    objects_dir = temp_repo.objects_dir()
+    first = diff_trees(objects_dir, commits[0].tree_hash, commits[1].tree_hash, cache=cache)
+    second = diff_trees(objects_dir, commits[1].tree_hash, commits[2].tree_hash, cache=cache)
+
+    assert len(first) == len(second) == 2
+    # The trees of the middle commit are loaded once, for the first diff
+    assert (cache.misses, cache.hits, cache.size) == (6, 2, 6)
+
+
+def test_diff_trees_streams_records_across_batches(temp_repo: Repository) -> None:
+    objects_dir = temp_repo.objects_dir()
+
+    def write_tree(names: range, changed: range) -> str:
+        with open_tree_writer(objects_dir) as writer:
+            writer.add([TreeRecord(TreeRecordType.BLOB, f'{i:039x}{int(i in changed)}', f'file{i:05d}')
+                        for i in names])
+            return writer.commit()
+
+    # Larger than a batch of streamed records on both sides
+    old_hash = write_tree(range(3000), range(0))
+    new_hash = write_tree(range(1000, 4000), range(2000, 2010))
+
+    streamed = diff_trees(objects_dir, old_hash, new_hash)
+    cached = diff_trees(objects_dir, old_hash, new_hash, cache=TreeCache(4))
+
+    def changes(diff: list[TreeChange]) -> list[tuple[TreeChange.Kind, str]]:
+        return [(change.kind, (change.new_record or change.old_record).name) for change in diff]
+
+    assert changes(streamed) == changes(cached)
+    assert [kind for kind, _ in changes(streamed)] == \
+        [TreeChange.Kind.REMOVED] * 1000 + [TreeChange.Kind.MODIFIED] * 10 + [TreeChange.Kind.ADDED] * 1000
+    assert [(change.kind, change.path) for change in stream_tree_diff(objects_dir, old_hash, new_hash)] == \
+        sorted(changes(streamed), key=lambda change: change[1])
+
+
+def test_diff_working_dir(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'dir').mkdir()
+    (temp_repo.working_dir / 'dir' / 'moved.txt').write_text('Moved content')
+    (temp_repo.working_dir / 'edited.txt').write_text('Original content')
+    (temp_repo.working_dir / 'removed.txt').write_text('Removed content')
+    temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    (temp_repo.working_dir / 'edited.txt').write_text('Edited content')
+    (temp_repo.working_dir / 'removed.txt').unlink()
+    (temp_repo.working_dir / 'dir' / 'moved.txt').rename(temp_repo.working_dir / 'moved.txt')
+    (temp_repo.working_dir / 'new').mkdir()
+    (temp_repo.working_dir / 'new' / 'added.txt').write_text('Added content')
+    objects = sorted(temp_repo.objects_dir().rglob('*'))
+
+    diffs = temp_repo.diff_working_dir()
+
+    added, modified, moved_to, moved_from, removed = split_diffs_by_type(diffs)
+    assert [d.record.name for d in added] == ['new']
+    assert [d.record.name for d in modified] == ['dir', 'edited.txt']
+    # The source of the move is nested in dir, so it is not a top-level change
+    assert moved_to == []
+    assert [d.record.name for d in moved_from] == ['moved.txt']
+    assert [d.record.name for d in removed] == ['removed.txt']
+    assert isinstance(modified[0].children[0], MovedToDiff)
+    # The working directory is only hashed, never saved
+    assert sorted(temp_repo.objects_dir().rglob('*')) == objects
+
+
+def test_diff_working_dir_reuses_unchanged_hashes(temp_repo: Repository, monkeypatch: MonkeyPatch) -> None:
+    for name in ('a.txt', 'b.txt', 'c.txt'):
+        (temp_repo.working_dir / name).write_text(f'Content of {name}')
+    commit_ref = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    hashed = []
+    hash_file = stat_cache.hash_file
+    monkeypatch.setattr(stat_cache, 'hash_file', lambda path: hashed.append(path.name) or hash_file(path))
+
+    assert temp_repo.diff_working_dir(commit_ref) == []
+    assert sorted(hashed) == ['a.txt', 'b.txt', 'c.txt']
+
+    hashed.clear()
+    assert temp_repo.diff_working_dir(commit_ref) == []
+    assert hashed == []
+
+    (temp_repo.working_dir / 'b.txt').write_text('Edited content of b.txt')
+    diffs = temp_repo.diff_working_dir(commit_ref)
+    assert hashed == ['b.txt']
+    assert [(type(d), d.record.name) for d in diffs] == [(ModifiedDiff, 'b.txt')]
+
+
+def test_diff_working_dir_invalid_ref(temp_repo: Repository) -> None:
+    with raises(RepositoryError):
+        temp_repo.diff_working_dir('nonexistent')
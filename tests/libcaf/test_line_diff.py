@@ -0,0 +1,109 @@
+import random
+
+from libcaf.cache import ObjectCache
+from libcaf.line_diff import STATS_CACHE, Hunk, count_changed_lines, format_hunks
+from libcaf.plumbing import delete_content
+from libcaf.repository import Repository
+
+
+def _save(temp_repo: Repository, content: bytes) -> str:
+    path = temp_repo.working_dir / 'blob.txt'
+    path.write_bytes(content)
+    return temp_repo.save_file_content(path).hash
+
+
+def _apply(old_lines: list[bytes], hunks: list[Hunk]) -> list[bytes]:
+    result: list[bytes] = []
+    position = 0
+    for hunk in hunks:
+        start = hunk.old_start - 1
+        result.extend(old_lines[position:start])
+        position = start
+        for prefix, content in hunk.lines:
+            if prefix == ' ':
+                assert old_lines[position] == content
+                result.append(content)
+                position += 1
+            elif prefix == '-':
+                assert old_lines[position] == content
+                position += 1
+            else:
+                result.append(content)
+    result.extend(old_lines[position:])
+    return result
+
+
+def test_diff_blobs_single_change(temp_repo: Repository) -> None:
+    old_lines = [f'line {i}\n'.encode() for i in range(1, 11)]
+    new_lines = list(old_lines)
+    new_lines[4] = b'changed\n'
+
+    hunks = temp_repo.diff_blobs(_save(temp_repo, b''.join(old_lines)), _save(temp_repo, b''.join(new_lines)))
+
+    assert len(hunks) == 1
+    assert hunks[0].header() == '@@ -2,7 +2,7 @@'
+    assert format_hunks(hunks) == ('@@ -2,7 +2,7 @@\n line 2\n line 3\n line 4\n-line 5\n+changed\n'
+                                   ' line 6\n line 7\n line 8\n')
+
+
+def test_diff_blobs_separate_and_merged_hunks(temp_repo: Repository) -> None:
+    old_lines = [f'line {i}\n'.encode() for i in range(30)]
+    new_lines = list(old_lines)
+    new_lines[2] = b'first\n'
+    new_lines[25] = b'second\n'
+    old_hash = _save(temp_repo, b''.join(old_lines))
+    new_hash = _save(temp_repo, b''.join(new_lines))
+
+    assert len(temp_repo.diff_blobs(old_hash, new_hash)) == 2
+    assert len(temp_repo.diff_blobs(old_hash, new_hash, context=15)) == 1
+    assert [len(hunk.lines) for hunk in temp_repo.diff_blobs(old_hash, new_hash, context=0)] == [2, 2]
+
+
+def test_diff_blobs_added_removed_and_identical(temp_repo: Repository) -> None:
+    blob_hash = _save(temp_repo, b'a\nb')
+
+    added = temp_repo.diff_blobs(None, blob_hash)
+    assert format_hunks(added) == '@@ -0,0 +1,2 @@\n+a\n+b\n\\ No newline at end of file\n'
+
+    removed = temp_repo.diff_blobs(blob_hash, None)
+    assert removed[0].header() == '@@ -1,2 +0,0 @@'
+
+    assert temp_repo.diff_blobs(blob_hash, blob_hash) == []
+
+
+def test_diff_blobs_reconstructs_new_content(temp_repo: Repository) -> None:
+    rng = random.Random(3)
+    for _ in range(50):
+        old_lines = [f'{rng.randint(0, 6)}\n'.encode() for _ in range(rng.randint(0, 40))]
+        new_lines = [f'{rng.randint(0, 6)}\n'.encode() for _ in range(rng.randint(0, 40))]
+        old_hash = _save(temp_repo, b''.join(old_lines)) if old_lines else None
+        new_hash = _save(temp_repo, b''.join(new_lines)) if new_lines else None
+
+        hunks = temp_repo.diff_blobs(old_hash, new_hash, context=rng.randint(0, 3))
+        assert _apply(old_lines, hunks) == new_lines
+
+
+def test_count_changed_lines(temp_repo: Repository) -> None:
+    objects_dir = temp_repo.objects_dir()
+    old_hash = _save(temp_repo, b'a\nb\nc\n')
+    new_hash = _save(temp_repo, b'a\nB\nc\nd')
+
+    assert count_changed_lines(objects_dir, old_hash, new_hash) == (2, 1)
+    assert count_changed_lines(objects_dir, None, new_hash) == (4, 0)
+    assert count_changed_lines(objects_dir, old_hash, None) == (0, 3)
+    assert count_changed_lines(objects_dir, old_hash, old_hash) == (0, 0)
+    assert count_changed_lines(objects_dir, old_hash, _save(temp_repo, b'\x00\x01')) is None
+
+
+def test_count_changed_lines_uses_cache(temp_repo: Repository) -> None:
+    objects_dir = temp_repo.objects_dir()
+    old_hash = _save(temp_repo, b'a\nb\n')
+    new_hash = _save(temp_repo, b'a\nc\n')
+    cache = ObjectCache(objects_dir, STATS_CACHE)
+
+    assert count_changed_lines(objects_dir, old_hash, new_hash, cache) == (1, 1)
+
+    # Once cached, the blobs are not read again
+    delete_content(objects_dir, old_hash)
+    delete_content(objects_dir, new_hash)
+    assert count_changed_lines(objects_dir, old_hash, new_hash, cache) == (1, 1)
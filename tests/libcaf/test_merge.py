@@ -1,9 +1,22 @@
 
-from libcaf.constants import DEFAULT_BRANCH
-from libcaf.plumbing import load_commit, load_tree, open_content_for_reading
+import os
+import random
+import shutil
+from contextlib import ExitStack
+
+from _libcaf import MergeRegion, merge_regions
+from libcaf import Tree, TreeRecord, TreeRecordType, merge
+from libcaf.cache import AttributeTable, ObjectCache
+from libcaf.constants import ATTRIBUTES_FILE, DEFAULT_BRANCH, HASH_LENGTH, LINE_TABLE_MIN_CACHED_SIZE
+from libcaf.merge import (LINES_CACHE, MERGES_CACHE, RESOLUTIONS_CACHE, TREE_MERGES_CACHE, FastForwardResult,
+                          MergeResult, UpToDateResult, _open_line_sequence, is_binary_blob, merge_blob, merge_blob_text,
+                          merge_blob_text_native, merge_trees_core)
+from libcaf.plumbing import (delete_content, hash_object, load_commit, load_tree, open_content_for_reading,
+                             open_object_writer, save_tree)
 from libcaf.ref import write_ref
 from libcaf.repository import Repository, RepositoryError, branch_ref
-from pytest import raises
+from merge3 import Merge3
+from pytest import MonkeyPatch, mark, raises
 
 
 def test_common_ancestor_linear_history(temp_repo: Repository) -> None:
@@ -68,6 +81,7 @@ def test_merge_commits_non_conflicting(temp_repo: Repository) -> None:
     main_commit = temp_repo.commit_working_dir('Author', 'Main commit')
 
     merge_result = temp_repo.merge_commits(main_commit, feature_commit)
+    assert type(merge_result) is MergeResult
     assert merge_result.conflicts == []
 
     merged_tree = load_tree(temp_repo.objects_dir(), merge_result.tree_hash)
@@ -80,6 +94,27 @@ def test_merge_commits_non_conflicting(temp_repo: Repository) -> None:
     assert merged_tree.records['file_b.txt'].hash == feature_tree.records['file_b.txt'].hash
 
 
+def test_merge_commits_fast_forward_and_up_to_date(temp_repo: Repository, monkeypatch: MonkeyPatch) -> None:
+    file_path = temp_repo.working_dir / 'file.txt'
+    file_path.write_text('base')
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+    file_path.write_text('first change')
+    temp_repo.commit_working_dir('Author', 'First commit')
+    file_path.write_text('second change')
+    head_commit = temp_repo.commit_working_dir('Author', 'Second commit')
+    head_tree = load_commit(temp_repo.objects_dir(), head_commit).tree_hash
+
+    def fail(*_: object) -> None:
+        raise AssertionError
+
+    # Neither case needs any tree
+    monkeypatch.setattr(merge, 'stream_tree_records', fail)
+
+    assert temp_repo.merge_commits(base_commit, head_commit) == FastForwardResult(head_tree, [], head_commit)
+    assert temp_repo.merge_commits(head_commit, base_commit) == UpToDateResult(head_tree, [], head_commit)
+    assert temp_repo.merge_commits(head_commit, head_commit) == UpToDateResult(head_tree, [], head_commit)
+
+
 def test_merge_commits_conflict_same_file(temp_repo: Repository) -> None:
     base_file = temp_repo.working_dir / 'file_a.txt'
     base_file.write_text('base')
@@ -114,6 +149,92 @@ def test_merge_commits_conflict_same_file(temp_repo: Repository) -> None:
     assert merged_content == expected_conflict
 
 
+def _merged_file(temp_repo: Repository, tree_hash: str, name: str) -> bytes:
+    blob_hash = load_tree(temp_repo.objects_dir(), tree_hash).records[name].hash
+    with open_content_for_reading(temp_repo.objects_dir(), blob_hash) as handle:
+        return handle.read()
+
+
+@mark.parametrize('native', [False, True])
+def test_merge_commits_reuses_recorded_resolutions(temp_repo: Repository, monkeypatch: MonkeyPatch,
+                                                   native: bool) -> None:
+    if native:
+        monkeypatch.setattr(merge, 'NATIVE_MERGE_MIN_SIZE', 0)
+
+    file_path = temp_repo.working_dir / 'file.txt'
+    file_path.write_text('first\nsecond\nthird\nfourth\nfifth\n')
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+
+    temp_repo.add_branch('feature')
+    temp_repo.update_ref('heads/feature', base_commit)
+    write_ref(temp_repo.head_file(), branch_ref('feature'))
+    file_path.write_text('feature first\nsecond\nthird\nfourth\nfeature fifth\n')
+    feature_commit = temp_repo.commit_working_dir('Author', 'Feature commit')
+
+    write_ref(temp_repo.head_file(), branch_ref(DEFAULT_BRANCH))
+    file_path.write_text('main first\nsecond\nmain third\nfourth\nmain fifth\n')
+    main_commit = temp_repo.commit_working_dir('Author', 'Main commit')
+
+    result = temp_repo.merge_commits(main_commit, feature_commit)
+    assert result.conflicts == ['file.txt']
+    conflicted_hash = load_tree(temp_repo.objects_dir(), result.tree_hash).records['file.txt'].hash
+
+    resolved_file = temp_repo.working_dir.parent / 'resolved.txt'
+    resolved_file.write_text('first resolved\nsecond\nmain third\nfourth\nfifth resolved\n')
+    assert temp_repo.record_resolution(conflicted_hash, resolved_file) == 2
+
+    assert temp_repo.merge_commits(main_commit, feature_commit, dry_run=True).conflicts == []
+    result = temp_repo.merge_commits(main_commit, feature_commit)
+    assert result.conflicts == []
+    assert _merged_file(temp_repo, result.tree_hash, 'file.txt') == resolved_file.read_bytes()
+
+    # The conflicts are the same, with the sides swapped
+    result = temp_repo.merge_commits(feature_commit, main_commit)
+    assert result.conflicts == []
+    assert _merged_file(temp_repo, result.tree_hash, 'file.txt') == resolved_file.read_bytes()
+
+
+def test_record_resolution_errors(temp_repo: Repository) -> None:
+    conflicted_file = temp_repo.working_dir / 'conflicted.txt'
+    conflicted_file.write_text('line\n<<<<<<< ours\nours\n=======\ntheirs\n>>>>>>> theirs\nend\n')
+    conflicted_hash = temp_repo.save_file_content(conflicted_file).hash
+    resolved_file = temp_repo.working_dir / 'resolved.txt'
+
+    resolved_file.write_text('line\nresolved\n')
+    with raises(RepositoryError, match='does not match'):
+        temp_repo.record_resolution(conflicted_hash, resolved_file)
+
+    resolved_file.write_text('line\n<<<<<<< ours\nresolved\n')
+    with raises(RepositoryError, match='conflict markers'):
+        temp_repo.record_resolution(conflicted_hash, resolved_file)
+
+    # Resolved files that do not match are not saved either
+    assert [path.name for path in temp_repo.objects_dir().glob('??/*')] == [conflicted_hash]
+
+    with raises(RepositoryError, match='no conflicts'):
+        temp_repo.record_resolution(temp_repo.save_file_content(resolved_file).hash, conflicted_file)
+    assert not ObjectCache(temp_repo.objects_dir(), RESOLUTIONS_CACHE).cache_dir.exists()
+
+
+def test_record_resolution_ambiguous(temp_repo: Repository) -> None:
+    hunk = '<<<<<<< ours\n{0} ours\n=======\n{0} theirs\n>>>>>>> theirs\n'
+    conflicted_file = temp_repo.working_dir / 'conflicted.txt'
+    resolved_file = temp_repo.working_dir / 'resolved.txt'
+
+    # Adjacent hunks, or text between them that also occurs in a resolution, do not show where each one ends
+    for between, resolved in [('', 'first\nsecond\n'), ('middle\n', 'middle\nmiddle\n')]:
+        conflicted_file.write_text(f'start\n{hunk.format(1)}{between}{hunk.format(2)}end\n')
+        conflicted_hash = temp_repo.save_file_content(conflicted_file).hash
+        resolved_file.write_text(f'start\n{resolved}end\n')
+
+        with raises(RepositoryError, match='ambiguous'):
+            temp_repo.record_resolution(conflicted_hash, resolved_file)
+    assert not ObjectCache(temp_repo.objects_dir(), RESOLUTIONS_CACHE).cache_dir.exists()
+
+    resolved_file.write_text('start\nfirst\nmiddle\nsecond\nend\n')
+    assert temp_repo.record_resolution(conflicted_hash, resolved_file) == 2
+
+
 def test_merge_commits_no_common_ancestor_raises_error(temp_repo: Repository) -> None:
     temp_file = temp_repo.working_dir / 'test_file.txt'
     temp_file.write_text('Root A')
@@ -153,3 +274,356 @@ def test_merge_commits_binary_file_conflict(temp_repo: Repository) -> None:
     with open_content_for_reading(temp_repo.objects_dir(), merged_blob_hash) as handle:
         merged_content = handle.read()
     assert merged_content == b'\x00\x01\x02\x03\x04main binary data'
+
+
+def test_is_binary_blob(temp_repo: Repository) -> None:
+    contents = {
+        b'plain text\twith tabs\r\n': False,
+        b'': False,
+        b'text with a null byte\x00': True,
+        b'\x01\x02\x7f\x1b' * 4 + b'mostly control': True,
+        b'\x1b[1mbold\x1b[0m and some more text': False,
+    }
+    blobs = {}
+    for i, (content, _) in enumerate(contents.items()):
+        file_path = temp_repo.working_dir / f'file{i}'
+        file_path.write_bytes(content)
+        blobs[content] = temp_repo.save_file_content(file_path).hash
+
+    for content, binary in contents.items():
+        assert is_binary_blob(temp_repo.objects_dir(), blobs[content]) is binary
+    assert is_binary_blob(temp_repo.objects_dir(), None) is False
+
+    # The result is kept per blob, so the content is not read again
+    binary_hash = blobs[b'text with a null byte\x00']
+    delete_content(temp_repo.objects_dir(), binary_hash)
+    assert is_binary_blob(temp_repo.objects_dir(), binary_hash) is True
+
+    # All in one file, which a table opened later, e.g. by another process, reads
+    table = AttributeTable(temp_repo.objects_dir())
+    assert [file.name for file in table.path.parent.iterdir()] == [ATTRIBUTES_FILE]
+    assert table.get(binary_hash) == 1
+    assert table.get(blobs[b'plain text\twith tabs\r\n']) == 0
+    assert table.get('0' * HASH_LENGTH) is None
+
+
+def test_line_sequence(temp_repo: Repository) -> None:
+    for content in (b'one\ntwo\n', b'one\n\nthree', b'\n', b'single line', b'a\r\nb\r\n\n\nc\n'):
+        file_path = temp_repo.working_dir / 'file'
+        file_path.write_bytes(content)
+        blob_hash = temp_repo.save_file_content(file_path).hash
+        expected = content.splitlines(keepends=True)
+
+        with ExitStack() as stack:
+            lines = _open_line_sequence(stack, temp_repo.objects_dir(), blob_hash)
+            assert list(lines) == expected
+            assert len(lines) == len(expected)
+            assert lines[-1] == expected[-1]
+            assert lines[1:] == expected[1:]
+            assert lines[::-1] == expected[::-1]
+            assert lines[5:2] == []
+            with raises(IndexError):
+                lines[len(expected)]
+
+
+def test_line_sequence_caches_large_line_tables(temp_repo: Repository) -> None:
+    file_path = temp_repo.working_dir / 'large'
+    line_count = LINE_TABLE_MIN_CACHED_SIZE // 10 + 1
+    file_path.write_bytes(b''.join(b'line %04d\n' % (i % 10000) for i in range(line_count)))
+    blob_hash = temp_repo.save_file_content(file_path).hash
+    cache = ObjectCache(temp_repo.objects_dir(), LINES_CACHE)
+
+    with ExitStack() as stack:
+        assert len(_open_line_sequence(stack, temp_repo.objects_dir(), blob_hash)) == line_count
+    table = cache.get(blob_hash)
+    assert table is not None and len(table) == (line_count + 1) * 8
+
+    # A cached table is used as is, and one that does not end with the blob size is ignored
+    cache.put(blob_hash, table[:-8] + bytes(8) + table[-8:])
+    with ExitStack() as stack:
+        assert len(_open_line_sequence(stack, temp_repo.objects_dir(), blob_hash)) == line_count + 1
+    cache.put(blob_hash, table[:-8])
+    with ExitStack() as stack:
+        assert len(_open_line_sequence(stack, temp_repo.objects_dir(), blob_hash)) == line_count
+    assert cache.get(blob_hash) == table
+
+
+def test_merge_blob_text_native_matches_merge3(temp_repo: Repository) -> None:
+    base = [f'line {i}\n' for i in range(20)]
+    ours, theirs = list(base), list(base)
+    ours[2] = 'ours edits line 2\n'
+    ours[10:12] = []
+    theirs[15:15] = ['theirs inserts a line\n']
+    ours[5] = theirs[5] = 'both edit line 5\n'
+    conflicting_theirs = list(theirs)
+    conflicting_theirs[2] = 'theirs edits line 2 too\n'
+    ours.append('without a trailing newline')
+
+    def save(lines: list[str]) -> str:
+        file_path = temp_repo.working_dir / 'file.txt'
+        file_path.write_text(''.join(lines))
+        return temp_repo.save_file_content(file_path).hash
+
+    objects_dir = temp_repo.objects_dir()
+    for other in (theirs, conflicting_theirs, []):
+        hashes = (save(base), save(ours), save(other) if other else None)
+        merged_hash, conflict = merge_blob_text_native(objects_dir, *hashes)
+
+        assert (merged_hash, conflict) == merge_blob_text(objects_dir, *hashes)
+        assert conflict is (other is not theirs)
+        with open_content_for_reading(objects_dir, merged_hash) as f:
+            merged = f.read().decode()
+        if other is theirs:
+            assert 'theirs inserts a line\n' in merged and 'ours edits line 2\n' in merged
+        else:
+            assert '<<<<<<< ours\n' in merged and '>>>>>>> theirs\n' in merged
+
+
+@mark.parametrize('line_count', [7, 40, 300])
+def test_merge_regions_native_matches_merge3_fuzzed(temp_repo: Repository, line_count: int) -> None:
+    # Few distinct lines, so that they repeat and allow more than one alignment. From 200 lines on, lines making
+    # up more than 1% of a side are popular to merge3's sequence matcher.
+    rng = random.Random(line_count)
+    objects_dir = temp_repo.objects_dir()
+    kinds = {'unchanged': MergeRegion.Kind.UNCHANGED, 'same': MergeRegion.Kind.SAME, 'a': MergeRegion.Kind.OURS,
+             'b': MergeRegion.Kind.THEIRS, 'conflict': MergeRegion.Kind.CONFLICT}
+
+    def edit(lines: list[bytes]) -> list[bytes]:
+        lines = list(lines)
+        for _ in range(rng.randint(1, 3)):
+            position = rng.randint(0, len(lines))
+            action = rng.choice(['insert', 'delete', 'replace'])
+            if action != 'insert' and position < len(lines):
+                del lines[position]
+            if action != 'delete':
+                lines.insert(position, f'{action[0]}{rng.randint(0, 2)}\n'.encode())
+        return lines
+
+    def save(lines: list[bytes]) -> str:
+        with open_object_writer(objects_dir) as writer:
+            writer.write(b''.join(lines))
+            return writer.commit()
+
+    for _ in range(300 if line_count < 100 else 30):
+        base = [f'l{rng.randint(0, 6)}\n'.encode() for _ in range(line_count)]
+        sides = [base, edit(base), edit(base)]
+        hashes = [save(lines) for lines in sides]
+
+        actual = []
+        for region in merge_regions(str(objects_dir), *hashes):
+            bounds = {MergeRegion.Kind.UNCHANGED: (region.base_start, region.base_end),
+                      MergeRegion.Kind.SAME: (region.ours_start, region.ours_end),
+                      MergeRegion.Kind.OURS: (region.ours_start, region.ours_end),
+                      MergeRegion.Kind.THEIRS: (region.theirs_start, region.theirs_end),
+                      MergeRegion.Kind.CONFLICT: (region.base_start, region.base_end, region.ours_start,
+                                                  region.ours_end, region.theirs_start, region.theirs_end)}
+            actual.append((region.kind, *bounds[region.kind]))
+
+        assert actual == [(kinds[name], *bounds) for name, *bounds in Merge3(*sides).merge_regions()], sides
+        assert merge_blob_text_native(objects_dir, *hashes) == merge_blob_text(objects_dir, *hashes)
+
+
+def test_merge_commits_parallel_is_deterministic(temp_repo: Repository, monkeypatch: MonkeyPatch) -> None:
+    def write_files(edit: str | None) -> None:
+        for d in range(4):
+            (temp_repo.working_dir / f'dir{d}').mkdir(exist_ok=True)
+            for f in range(6):
+                # Every other file has the same base content, so their merges read the same blob
+                lines = [f'line {i} of {d if f % 2 else "shared"}\n' for i in range(5)]
+                if edit == 'ours' or (edit == 'theirs' and f == 3):
+                    lines[0] = f'{edit} {d}/{f}\n'
+                elif edit == 'theirs':
+                    lines[-1] = f'{edit} {d}/{f}\n'
+                (temp_repo.working_dir / f'dir{d}' / f'file{f}.txt').write_text(''.join(lines))
+
+    write_files(None)
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+    write_files('ours')
+    ours_commit = temp_repo.commit_working_dir('Author', 'Our commit')
+
+    temp_repo.add_branch('feature')
+    temp_repo.update_ref('heads/feature', base_commit)
+    write_ref(temp_repo.head_file(), branch_ref('feature'))
+    write_files('theirs')
+    theirs_commit = temp_repo.commit_working_dir('Author', 'Their commit')
+
+    serial = temp_repo.merge_commits(ours_commit, theirs_commit, workers=1)
+    for kind in (MERGES_CACHE, TREE_MERGES_CACHE):
+        shutil.rmtree(ObjectCache(temp_repo.objects_dir(), kind).cache_dir)
+    # Walk the subtrees and run the content merges in worker processes, however small the merge is
+    monkeypatch.setattr(merge, 'PARALLEL_MERGE_MIN_BLOBS', 1)
+    monkeypatch.setattr(merge, 'PARALLEL_WALK_MIN_SIZE', 0)
+    predicted = temp_repo.merge_commits(ours_commit, theirs_commit, workers=4, dry_run=True)
+    parallel = temp_repo.merge_commits(ours_commit, theirs_commit, workers=4)
+
+    assert parallel == serial
+    assert predicted.conflicts == serial.conflicts
+    assert serial.conflicts == [f'dir{d}/file3.txt' for d in range(4)]
+
+    merged_dir = load_tree(temp_repo.objects_dir(), load_tree(temp_repo.objects_dir(), serial.tree_hash)
+                           .records['dir2'].hash)
+    with open_content_for_reading(temp_repo.objects_dir(), merged_dir.records['file0.txt'].hash) as f:
+        assert f.read().decode().splitlines() == ['ours 2/0', 'line 1 of shared', 'line 2 of shared',
+                                                  'line 3 of shared', 'theirs 2/0']
+
+
+def test_merge_trees_streams_flat_directories(temp_repo: Repository) -> None:
+    objects_dir = temp_repo.objects_dir()
+
+    def record(i: int, version: str) -> TreeRecord:
+        return TreeRecord(TreeRecordType.BLOB, hash_object(Tree({})) if version == 'base' else f'{i:038x}{version}',
+                          f'file{i:05d}')
+
+    # More records than fit in a batch, so the trees are streamed and written in several
+    base = {f'file{i:05d}': record(i, 'base') for i in range(2500)}
+    ours, theirs = dict(base), dict(base)
+    for i in range(0, 2500, 7):
+        ours[f'file{i:05d}'] = record(i, 'aa')
+    for i in range(3, 2500, 11):
+        del theirs[f'file{i:05d}']
+    theirs.update({f'file{i:05d}': record(i, 'bb') for i in range(2500, 2600)})
+
+    trees = [Tree(records) for records in (base, ours, theirs)]
+    for tree in trees:
+        save_tree(objects_dir, tree)
+
+    conflicts: list[str] = []
+    merged_hash = merge_trees_core(objects_dir, *(hash_object(tree) for tree in trees), '', conflicts)
+
+    expected = {name: ours.get(name) or theirs[name] for name in sorted(ours.keys() | theirs.keys())
+                if name in theirs or ours[name] != base[name]}
+    assert load_tree(objects_dir, merged_hash).records == expected
+    assert conflicts == [f'file{i:05d}' for i in range(3, 2500, 11) if i % 7 == 0]
+
+    shutil.rmtree(ObjectCache(objects_dir, TREE_MERGES_CACHE).cache_dir)
+    loaded_conflicts: list[str] = []
+    assert merge_trees_core(objects_dir, *trees, '', loaded_conflicts) == merged_hash
+    assert loaded_conflicts == conflicts
+
+
+def test_merge_commits_reuses_cached_merges(temp_repo: Repository, monkeypatch: MonkeyPatch) -> None:
+    def write_files(edit: str | None) -> None:
+        for d in ('a', 'b'):
+            (temp_repo.working_dir / d).mkdir(exist_ok=True)
+            for f in range(2):
+                lines = [f'line {i} of {d}/{f}\n' for i in range(5)]
+                if edit is not None:
+                    lines[0 if edit == 'ours' or f == 1 else -1] = f'{edit} {d}/{f}\n'
+                (temp_repo.working_dir / d / f'file{f}.txt').write_text(''.join(lines))
+
+    write_files(None)
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+    write_files('ours')
+    ours_commit = temp_repo.commit_working_dir('Author', 'Our commit')
+
+    temp_repo.add_branch('feature')
+    temp_repo.update_ref('heads/feature', base_commit)
+    write_ref(temp_repo.head_file(), branch_ref('feature'))
+    write_files('theirs')
+    theirs_commit = temp_repo.commit_working_dir('Author', 'Their commit')
+
+    expected = temp_repo.merge_commits(ours_commit, theirs_commit)
+    assert expected.conflicts == ['a/file1.txt', 'b/file1.txt']
+
+    def fail(*_: object) -> None:
+        raise AssertionError
+
+    monkeypatch.setattr(merge, 'merge_blob_text', fail)
+    monkeypatch.setattr(merge, 'merge_blob_text_native', fail)
+    assert temp_repo.merge_commits(ours_commit, theirs_commit) == expected
+
+    # Without the entry of the root tree, the merged subtrees are still reused
+    tree_cache = ObjectCache(temp_repo.objects_dir(), TREE_MERGES_CACHE)
+    for entry in tree_cache.cache_dir.glob('??/*'):
+        if entry.read_bytes().startswith(expected.tree_hash.encode()):
+            entry.unlink()
+    shutil.rmtree(ObjectCache(temp_repo.objects_dir(), MERGES_CACHE).cache_dir)
+    assert temp_repo.merge_commits(ours_commit, theirs_commit) == expected
+
+
+def test_merge_blob_cache_survives_deleted_results(temp_repo: Repository) -> None:
+    def save(content: str) -> str:
+        file_path = temp_repo.working_dir / 'file.txt'
+        file_path.write_text(content)
+        return temp_repo.save_file_content(file_path).hash
+
+    objects_dir = temp_repo.objects_dir()
+    hashes = (save('a\nb\nc\n'), save('ours\nb\nc\n'), save('a\nb\ntheirs\n'))
+    merged_hash, conflict = merge_blob(objects_dir, *hashes)
+    assert not conflict
+
+    # Garbage collection may delete a merge result; the cached entry must not hand it out any more
+    delete_content(objects_dir, merged_hash)
+    assert merge_blob(objects_dir, *hashes) == (merged_hash, False)
+    with open_content_for_reading(objects_dir, merged_hash) as f:
+        assert f.read() == b'ours\nb\ntheirs\n'
+
+
+def test_object_cache_evicts_least_recently_used_entries(temp_repo: Repository) -> None:
+    cache = ObjectCache(temp_repo.objects_dir(), 'test', max_size=None)
+    for i, key in enumerate(('aa01', 'bb02', 'cc03')):
+        cache.put(key, b'entry')
+        os.utime(cache._path(key), ns=(i * 10**9, i * 10**9))
+
+    assert cache.prune() == 0
+    sizes = [cache._path(key).stat().st_blocks * 512 for key in ('aa01', 'bb02', 'cc03')]
+
+    bounded = ObjectCache(temp_repo.objects_dir(), 'test', max_size=sizes[0] + sizes[1])
+    # Using the oldest entry makes it the most recent one
+    assert bounded.get('aa01') == b'entry'
+    assert bounded.prune() == 1
+    assert [key for key in ('aa01', 'bb02', 'cc03') if bounded.get(key) is not None] == ['aa01', 'cc03']
+
+
+def test_merge_commits_dry_run(temp_repo: Repository, monkeypatch: MonkeyPatch) -> None:
+    def write_files(edit: str | None) -> None:
+        for d in ('a', 'b'):
+            (temp_repo.working_dir / d).mkdir(exist_ok=True)
+            for f in range(3):
+                lines = [f'line {i} of {d}/{f}\n' for i in range(5)]
+                if edit is not None:
+                    lines[0 if edit == 'ours' or f == 1 else -1] = f'{edit} {d}/{f}\n'
+                (temp_repo.working_dir / d / f'file{f}.txt').write_text(''.join(lines))
+        # Removed on our side and edited on theirs, a conflict whatever the content
+        if edit == 'ours':
+            (temp_repo.working_dir / 'b' / 'file2.txt').unlink()
+
+    write_files(None)
+    base_commit = temp_repo.commit_working_dir('Author', 'Base commit')
+    write_files('ours')
+    ours_commit = temp_repo.commit_working_dir('Author', 'Our commit')
+
+    temp_repo.add_branch('feature')
+    temp_repo.update_ref('heads/feature', base_commit)
+    write_ref(temp_repo.head_file(), branch_ref('feature'))
+    write_files('theirs')
+    theirs_commit = temp_repo.commit_working_dir('Author', 'Their commit')
+
+    # Neither objects nor cache entries, such as blob attributes or line tables, are written
+    monkeypatch.setattr(merge, 'LINE_TABLE_MIN_CACHED_SIZE', 0)
+    files = set(temp_repo.objects_dir().rglob('*'))
+    expected = ['a/file1.txt', 'b/file1.txt', 'b/file2.txt']
+
+    assert temp_repo.merge_commits(ours_commit, theirs_commit, dry_run=True) == MergeResult(None, expected)
+    assert (temp_repo.merge_commits(ours_commit, theirs_commit, dry_run=True, stop_on_conflict=True)
+            == MergeResult(None, expected[:1]))
+    # Merges of large blobs are checked with the native merge regions
+    monkeypatch.setattr(merge, 'NATIVE_MERGE_MIN_SIZE', 0)
+    assert temp_repo.merge_commits(ours_commit, theirs_commit, dry_run=True) == MergeResult(None, expected)
+    assert set(temp_repo.objects_dir().rglob('*')) == files
+
+    assert temp_repo.merge_commits(ours_commit, theirs_commit).conflicts == expected
+    # Predicted from the merge caches once the merge has been done
+    assert (temp_repo.merge_commits(ours_commit, theirs_commit, dry_run=True, stop_on_conflict=True)
+            == MergeResult(None, expected[:1]))
+
+    with raises(ValueError, match='dry_run'):
+        temp_repo.merge_commits(ours_commit, theirs_commit, stop_on_conflict=True)
+
+
+def test_merge_commits_invalid_workers(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'file.txt').write_text('content')
+    commit = temp_repo.commit_working_dir('Author', 'Commit')
+
+    with raises(ValueError, match='workers'):
+        temp_repo.merge_commits(commit, commit, workers=0)
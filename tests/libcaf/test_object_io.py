@@ -1,6 +1,8 @@
 from pathlib import Path
 
-from libcaf.plumbing import hash_object, load_commit, load_tree, save_commit, save_tree
+from libcaf.plumbing import (hash_object, load_commit, load_tree, open_tree_writer, save_commit, save_tree,
+                             stream_tree_records)
+from pytest import raises
 
 from libcaf import Commit, Tree, TreeRecord, TreeRecordType
 
@@ -47,3 +49,35 @@ def test_save_load_tree(temp_repo_dir: Path) -> None:
 
     assert loaded_tree.records.keys() == records.keys()
     assert loaded_tree.records == records
+
+
+def test_stream_tree_records(temp_repo_dir: Path) -> None:
+    records = {f'file{i:04d}': TreeRecord(TreeRecordType.BLOB, f'{i:040x}', f'file{i:04d}') for i in range(10)}
+    tree = Tree(records)
+    save_tree(temp_repo_dir, tree)
+
+    streamed = list(stream_tree_records(temp_repo_dir, hash_object(tree), batch_size=3))
+
+    assert streamed == list(records.values())
+    assert list(stream_tree_records(temp_repo_dir, '')) == []
+
+
+def test_tree_writer_matches_save_tree(temp_repo_dir: Path) -> None:
+    records = {f'file{i:04d}': TreeRecord(TreeRecordType.BLOB, f'{i:040x}', f'file{i:04d}') for i in range(10)}
+    records['subdir'] = TreeRecord(TreeRecordType.TREE, 'subdir123', 'subdir')
+    tree = Tree(records)
+
+    with open_tree_writer(temp_repo_dir) as writer:
+        writer.add(list(records.values())[:4])
+        writer.add(list(records.values())[4:])
+        tree_hash = writer.commit()
+
+    assert tree_hash == hash_object(tree)
+    assert load_tree(temp_repo_dir, tree_hash).records == records
+
+
+def test_tree_writer_rejects_unordered_records(temp_repo_dir: Path) -> None:
+    with open_tree_writer(temp_repo_dir) as writer:
+        writer.add([TreeRecord(TreeRecordType.BLOB, 'bar123', 'bar')])
+        with raises(ValueError, match='increasing name order'):
+            writer.add([TreeRecord(TreeRecordType.BLOB, 'bar123', 'bar')])
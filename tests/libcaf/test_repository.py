@@ -1,11 +1,13 @@
+from datetime import datetime, timedelta
 from pathlib import Path
 from shutil import rmtree
 
+from libcaf import Commit, repository
 from libcaf.constants import DEFAULT_BRANCH, HASH_LENGTH
-from libcaf.plumbing import hash_object, load_commit, load_tree
+from libcaf.plumbing import hash_object, load_commit, load_tree, open_content_for_reading, save_commit
 from libcaf.ref import RefError, SymRef
 from libcaf.repository import HashRef, Repository, RepositoryError, Tag, branch_ref
-from pytest import raises
+from pytest import MonkeyPatch, raises
 
 
 def test_init_with_custom_repo_dir(temp_repo_dir: Path) -> None:
@@ -108,6 +110,125 @@ def test_head_log(temp_repo: Repository) -> None:
     assert [_.commit_ref for _ in temp_repo.log()] == [commit_ref2, commit_ref1]
 
 
+def test_log_max_count_and_skip(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'commit_test.txt'
+    commit_refs = []
+    for i in range(5):
+        temp_file.write_text(f'Commit {i}')
+        commit_refs.append(temp_repo.commit_working_dir('Author', f'Commit {i}'))
+    commit_refs.reverse()
+
+    assert [_.commit_ref for _ in temp_repo.log(max_count=2)] == commit_refs[:2]
+    assert [_.commit_ref for _ in temp_repo.log(skip=3)] == commit_refs[3:]
+    assert [_.commit_ref for _ in temp_repo.log(max_count=2, skip=1)] == commit_refs[1:3]
+    assert list(temp_repo.log(max_count=0)) == []
+
+    with raises(ValueError):
+        list(temp_repo.log(skip=-1))
+
+
+def test_log_with_changes(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'docs').mkdir()
+    (temp_repo.working_dir / 'docs' / 'guide.md').write_text('one\n')
+    lines = []
+    for i in range(12):
+        lines.append(f'line {i}\n')
+        (temp_repo.working_dir / 'file.txt').write_text(''.join(lines))
+        temp_repo.commit_working_dir('Author', f'Commit {i}')
+
+    entries = list(temp_repo.log_with_changes(workers=4))
+
+    assert [entry.commit_ref for entry in entries] == [entry.commit_ref for entry in temp_repo.log()]
+    assert [(stat.path, stat.added, stat.removed) for stat in entries[0].stats] == [('file.txt', 1, 0)]
+    # The root commit is compared with the empty tree
+    assert [(stat.path, stat.added, stat.removed) for stat in entries[-1].stats] == \
+        [('docs/guide.md', 1, 0), ('file.txt', 1, 0)]
+
+
+def test_log_with_changes_limited(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'a.txt').write_text('a\n')
+    (temp_repo.working_dir / 'b.txt').write_text('b\n')
+    commit_ref1 = temp_repo.commit_working_dir('Author', 'First commit')
+    (temp_repo.working_dir / 'b.txt').write_text('b\nb\n')
+    temp_repo.commit_working_dir('Author', 'Second commit')
+
+    entries = list(temp_repo.log_with_changes(paths=['a.txt'], workers=1))
+
+    assert [entry.commit_ref for entry in entries] == [commit_ref1]
+    assert [stat.path for stat in entries[0].stats] == ['a.txt']
+
+    with raises(ValueError):
+        list(temp_repo.log_with_changes(workers=0))
+
+
+def test_log_with_changes_loads_only_yielded_commits(temp_repo: Repository, monkeypatch: MonkeyPatch) -> None:
+    commits = []
+    for i in range(3):
+        (temp_repo.working_dir / 'file.txt').write_text(f'content {i}\n')
+        commits.append(temp_repo.commit_working_dir('Author', f'Commit {i}'))
+
+    loaded = []
+
+    def counting_load_commit(objects_dir: Path, commit_hash: str) -> object:
+        loaded.append(commit_hash)
+        return load_commit(objects_dir, commit_hash)
+
+    monkeypatch.setattr(repository, 'load_commit', counting_load_commit)
+
+    entries = list(temp_repo.log_with_changes(max_count=1, workers=1))
+
+    # The parent tree comes from the commit-graph rather than the parent commit
+    assert loaded == [commits[-1]]
+    assert [(stat.path, stat.added, stat.removed) for stat in entries[0].stats] == [('file.txt', 1, 1)]
+
+
+def test_log_with_changes_shares_blobs_between_workers(temp_repo: Repository) -> None:
+    # Reverting back and forth makes adjacent commits diff the same two blobs
+    file = temp_repo.working_dir / 'file.txt'
+    for i in range(8):
+        file.write_text('line\n' * 1000 + ('extra\n' if i % 2 else ''))
+        temp_repo.commit_working_dir('Author', f'Commit {i}')
+    objects_dir = temp_repo.objects_dir()
+    blob_hash = load_tree(objects_dir, load_commit(objects_dir, temp_repo.head_commit()).tree_hash) \
+        .records['file.txt'].hash
+
+    # Readers never wait for each other, even with the blob held open meanwhile
+    with open_content_for_reading(objects_dir, blob_hash):
+        entries = list(temp_repo.log_with_changes(workers=4))
+
+    assert [[(stat.path, stat.added, stat.removed) for stat in entry.stats] for entry in entries] == \
+        [[('file.txt', 1, 0)], [('file.txt', 0, 1)]] * 3 + [[('file.txt', 1, 0)], [('file.txt', 1000, 0)]]
+
+
+def test_log_since_until(temp_repo: Repository) -> None:
+    temp_file = temp_repo.working_dir / 'commit_test.txt'
+    temp_file.write_text('Initial commit')
+    commit_ref = temp_repo.commit_working_dir('Author', 'First commit')
+    commit_time = datetime.fromtimestamp(load_commit(temp_repo.objects_dir(), commit_ref).timestamp)
+
+    assert [_.commit_ref for _ in temp_repo.log(since=commit_time, until=commit_time)] == [commit_ref]
+    assert list(temp_repo.log(since=commit_time + timedelta(seconds=1))) == []
+    assert list(temp_repo.log(until=commit_time - timedelta(seconds=1))) == []
+
+
+def test_log_filters_find_commits_written_through_plumbing(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'file.txt').write_text('content')
+    first_ref = temp_repo.commit_working_dir('Author', 'First commit')
+    objects_dir = temp_repo.objects_dir()
+    first = load_commit(objects_dir, first_ref)
+
+    # Neither in the commit-graph nor in the commit index until the log reaches it
+    commit = Commit(first.tree_hash, 'Plumber', 'Written through plumbing', first.timestamp + 60, first_ref)
+    save_commit(objects_dir, commit)
+    commit_ref = hash_object(commit)
+    temp_repo.update_ref(f'heads/{DEFAULT_BRANCH}', commit_ref)
+
+    since = datetime.fromtimestamp(first.timestamp + 30)
+    assert [entry.commit_ref for entry in temp_repo.log(since=since)] == [commit_ref]
+    assert [entry.commit_ref for entry in temp_repo.log(author='Plumber')] == [commit_ref]
+    assert [entry.commit_ref for entry in temp_repo.find_commits(since=since)] == [commit_ref]
+
+
 def test_refs_directory_not_exists_raises_error(temp_repo: Repository) -> None:
     # Remove the refs directory to trigger the error condition
     refs_dir = temp_repo.refs_dir()
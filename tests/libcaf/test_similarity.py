@@ -0,0 +1,64 @@
+from libcaf.cache import ObjectCache
+from libcaf.repository import AddedDiff, MovedFromDiff, MovedToDiff, RemovedDiff, Repository
+from libcaf.similarity import SKETCH_CACHE, compute_sketch, estimate_similarity, find_similar_pairs
+from pytest import raises
+
+
+def _lines(start: int, stop: int) -> str:
+    return ''.join(f'line number {i}\n' for i in range(start, stop))
+
+
+def test_estimate_similarity() -> None:
+    base = compute_sketch(_lines(0, 100).encode())
+
+    assert estimate_similarity(base, base) == 1.0
+    assert estimate_similarity(base, compute_sketch(_lines(1000, 1100).encode())) == 0.0
+    assert 0.5 < estimate_similarity(base, compute_sketch(_lines(10, 100).encode())) < 1.0
+    assert estimate_similarity(base, compute_sketch(b'')) == 0.0
+
+
+def test_find_similar_pairs(temp_repo: Repository) -> None:
+    def save(content: str) -> str:
+        path = temp_repo.working_dir / 'blob.txt'
+        path.write_text(content)
+        return temp_repo.save_file_content(path).hash
+
+    old_hashes = [save(_lines(0, 100)), save(_lines(500, 600)), save(_lines(900, 910))]
+    new_hashes = [save(_lines(2000, 2100)), save(_lines(500, 590) + 'edited\n'), save(_lines(0, 95))]
+
+    pairs = find_similar_pairs(temp_repo.objects_dir(), old_hashes, new_hashes, threshold=0.5)
+    assert [(old_index, new_index) for old_index, new_index, _ in pairs] == [(0, 2), (1, 1)]
+    assert all(0.5 <= similarity < 1 for _, _, similarity in pairs)
+
+    # Sketches are cached per blob
+    cache = ObjectCache(temp_repo.objects_dir(), SKETCH_CACHE)
+    assert all(cache.get(blob_hash) is not None for blob_hash in old_hashes + new_hashes)
+
+    with raises(ValueError):
+        find_similar_pairs(temp_repo.objects_dir(), old_hashes, new_hashes, threshold=1.5)
+
+
+def test_diff_detects_edited_rename(temp_repo: Repository) -> None:
+    (temp_repo.working_dir / 'old_name.txt').write_text(_lines(0, 50))
+    (temp_repo.working_dir / 'unrelated.txt').write_text(_lines(100, 150))
+    commit1 = temp_repo.commit_working_dir('Tester', 'Initial commit')
+
+    (temp_repo.working_dir / 'old_name.txt').unlink()
+    (temp_repo.working_dir / 'new_name.txt').write_text(_lines(0, 48) + 'changed\n')
+    (temp_repo.working_dir / 'unrelated.txt').unlink()
+    (temp_repo.working_dir / 'different.txt').write_text(_lines(300, 350))
+    commit2 = temp_repo.commit_working_dir('Tester', 'Rename and edit')
+
+    plain = temp_repo.diff_commits(commit1, commit2)
+    assert not any(isinstance(d, MovedToDiff | MovedFromDiff) for d in plain)
+
+    diffs = temp_repo.diff_commits(commit1, commit2, rename_threshold=0.5)
+    moved_to = [d for d in diffs if isinstance(d, MovedToDiff)]
+    assert len(moved_to) == 1
+    assert moved_to[0].record.name == 'old_name.txt'
+    assert moved_to[0].moved_to is not None
+    assert moved_to[0].moved_to.record.name == 'new_name.txt'
+    assert 0.5 <= moved_to[0].similarity < 1
+
+    assert [d.record.name for d in diffs if isinstance(d, AddedDiff)] == ['different.txt']
+    assert [d.record.name for d in diffs if isinstance(d, RemovedDiff)] == ['unrelated.txt']